@@ -0,0 +1,332 @@
+import os
+import json
+import time
+import asyncio
+import zipfile
+import logging
+import tempfile
+from typing import IO, Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from fastapi import UploadFile
+
+from image_ingest import ImageRejected, INGEST_MAX_BYTES, check_upload_size, decode_image
+from pipeline import describe_image
+from executor import limits
+from result_cache import result_cache, image_digest, diagnosis_key
+from model_catalogue import ModelTier, catalogue
+from detections import Detections
+from model_api import DEFAULT_SYMPTOMS, build_diagnosis_prompt, diagnosis_llm, extract_json_from_text
+
+logger = logging.getLogger(__name__)
+
+# Most images accepted in one batch request (files plus zip entries)
+BATCH_DIAGNOSE_MAX_IMAGES = int(os.getenv("BATCH_DIAGNOSE_MAX_IMAGES", "500"))
+
+# Most bytes accepted in one batch request, over all of its files
+BATCH_DIAGNOSE_MAX_BYTES = int(os.getenv("BATCH_DIAGNOSE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+# Images diagnosed together in one LLM call, and how many such groups run at once
+BATCH_LLM_GROUP_SIZE = int(os.getenv("BATCH_LLM_GROUP_SIZE", "8"))
+BATCH_GROUP_CONCURRENCY = int(os.getenv("BATCH_GROUP_CONCURRENCY", "2"))
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tif", ".tiff")
+
+# (filename, spooled copy of the upload)
+Spool = Tuple[str, IO[bytes]]
+
+_SPOOL_CHUNK = 1024 * 1024
+
+
+def spool_uploads(uploads: List[UploadFile], max_bytes: int = BATCH_DIAGNOSE_MAX_BYTES) -> List[Spool]:
+    """
+    Copy the uploads of a batch to private temporary files.
+
+    FastAPI closes request files once the endpoint returns, before a
+    streamed response is produced, so the batch keeps its own copies.
+
+    Raises:
+        ImageRejected once the uploads together exceed max_bytes; nothing is kept then
+    """
+    spools: List[Spool] = []
+    remaining = max_bytes
+    try:
+        for upload in uploads:
+            spool = tempfile.TemporaryFile()
+            spools.append((upload.filename or "upload", spool))
+            while True:
+                chunk = upload.file.read(_SPOOL_CHUNK)
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                if remaining < 0:
+                    raise ImageRejected(f"Batch is over the limit of {max_bytes / (1024 * 1024):.1f} MB")
+                spool.write(chunk)
+            spool.seek(0)
+    except BaseException:
+        for _, spool in spools:
+            spool.close()
+        raise
+    return spools
+
+
+def _iter_images(spools: List[Spool]) -> Iterator[Tuple[str, Any]]:
+    """
+    Yield (name, bytes or ImageRejected) for every image in the uploads,
+    expanding zip archives entry by entry so only one image is read at a time
+    """
+    for name, spool in spools:
+        if zipfile.is_zipfile(spool):
+            spool.seek(0)
+            with zipfile.ZipFile(spool) as archive:
+                for info in archive.infolist():
+                    entry = info.filename
+                    if info.is_dir() or entry.startswith("__MACOSX/") or not entry.lower().endswith(IMAGE_EXTENSIONS):
+                        continue
+                    try:
+                        check_upload_size(info.file_size)
+                        with archive.open(info) as f:
+                            # Never trust the declared size of a zip entry
+                            data = f.read(INGEST_MAX_BYTES + 1)
+                        check_upload_size(len(data))
+                        yield f"{name}/{entry}", data
+                    except ImageRejected as e:
+                        yield f"{name}/{entry}", e
+        else:
+            spool.seek(0)
+            data = spool.read(INGEST_MAX_BYTES + 1)
+            try:
+                check_upload_size(len(data))
+                yield name, data
+            except ImageRejected as e:
+                yield name, e
+
+
+def build_group_prompt(entries: List[Tuple[str, Detections]], symptoms: str) -> str:
+    """Prompt asking for independent diagnoses of several images as one JSON document"""
+    images = "\n\n".join(
+        f"IMAGE {number}\nCAPTION: {caption}\nOBJECT DETECTION ([x1,y1,x2,y2] label score):\n{detections.to_prompt()}"
+        for number, (caption, detections) in enumerate(entries, start=1)
+    )
+    return f"""You are a plant disease diagnosis expert. The following plant images come from one field survey. Diagnose each image independently.
+
+DISEASE SYMPTOMS (reported for the whole survey):
+{symptoms}
+
+{images}
+
+Provide your diagnoses in this exact JSON format, with one entry per image:
+{{
+    "results": [
+        {{
+            "image": 1,
+            "possible_diagnosis": ["Diagnosis 1", "Diagnosis 2"],
+            "causes": ["Cause 1", "Cause 2"],
+            "remedies_or_cure": ["Remedy 1", "Remedy 2"]
+        }}
+    ]
+}}
+
+Return only the valid JSON with no additional text or formatting."""
+
+
+def _parse_group_response(text: str, count: int) -> Dict[int, Dict[str, Any]]:
+    """Map image number to diagnosis for every well-formed entry of a grouped answer"""
+    parsed = extract_json_from_text(text)
+    diagnoses = {}
+    for entry in parsed.get("results", []) if isinstance(parsed, dict) else []:
+        try:
+            number = int(entry["image"])
+            diagnosis = {key: list(entry[key]) for key in ("possible_diagnosis", "causes", "remedies_or_cure")}
+        except (KeyError, TypeError, ValueError):
+            continue
+        if 1 <= number <= count:
+            diagnoses[number] = diagnosis
+    return diagnoses
+
+
+class BatchDiagnosis:
+    """
+    Diagnoses one batch request and streams a result per image.
+
+    Images are read one at a time and handled in groups of
+    BATCH_LLM_GROUP_SIZE. Within a group every image is decoded and run
+    through the shared vision micro-batchers concurrently (so they batch
+    together), images with a cached diagnosis are answered immediately,
+    and the rest are diagnosed with a single LLM call. Up to
+    BATCH_GROUP_CONCURRENCY groups are in flight, which also bounds how
+    many decoded images are held in memory.
+    """
+
+    def __init__(self, spools: List[Spool], symptoms: Optional[str], tier: ModelTier):
+        self.spools = spools
+        self.symptoms = symptoms or DEFAULT_SYMPTOMS
+        self.tier = tier
+        self.llm = diagnosis_llm()
+
+        self.total = 0
+        self.succeeded = 0
+        self.cache_hits = 0
+        self.llm_calls = 0
+        self.truncated = False
+
+        self._results: asyncio.Queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(max(1, BATCH_GROUP_CONCURRENCY))
+
+    async def stream(self) -> AsyncIterator[str]:
+        """Run the batch, yielding one NDJSON line per image and a final summary line"""
+        start = time.perf_counter()
+        producer = asyncio.create_task(self._produce())
+        try:
+            while True:
+                result = await self._results.get()
+                if result is None:
+                    break
+                if result.get("success"):
+                    self.succeeded += 1
+                yield json.dumps(result) + "\n"
+            await producer
+
+            yield json.dumps({
+                "type": "summary",
+                "total": self.total,
+                "succeeded": self.succeeded,
+                "failed": self.total - self.succeeded,
+                "truncated": self.truncated,
+                "cache_hits": self.cache_hits,
+                "llm_calls": self.llm_calls,
+                "model_tier": self.tier.name,
+                "elapsed_ms": round((time.perf_counter() - start) * 1000, 1),
+            }) + "\n"
+        finally:
+            if not producer.done():
+                producer.cancel()
+            for _, spool in self.spools:
+                spool.close()
+
+    async def _produce(self):
+        tasks = []
+        try:
+            images = _iter_images(self.spools)
+            group = []
+            while True:
+                item = await asyncio.to_thread(next, images, None)
+                if item is None:
+                    break
+                if self.total >= BATCH_DIAGNOSE_MAX_IMAGES:
+                    # Anything past the limit is left unread
+                    self.truncated = True
+                    break
+
+                group.append((self.total, *item))
+                self.total += 1
+                if len(group) >= BATCH_LLM_GROUP_SIZE:
+                    await self._slots.acquire()
+                    tasks.append(asyncio.create_task(self._run_group(group)))
+                    group = []
+
+            if group:
+                await self._slots.acquire()
+                tasks.append(asyncio.create_task(self._run_group(group)))
+            await asyncio.gather(*tasks)
+        except Exception as e:
+            logger.error(f"Batch diagnosis failed: {str(e)}")
+            await self._results.put({"type": "error", "success": False, "error": str(e)})
+        finally:
+            # Only does anything when the client went away mid-batch
+            for task in tasks:
+                task.cancel()
+            await self._results.put(None)
+
+    async def _run_group(self, group: List[Tuple[int, str, Any]]):
+        try:
+            described = await asyncio.gather(*(self._describe(*item) for item in group))
+            pending = [entry for entry in described if entry is not None]
+            if pending:
+                await self._diagnose(pending)
+        finally:
+            self._slots.release()
+
+    def _result(self, index: int, name: str, diagnosis: Optional[Dict[str, Any]] = None, **fields: Any) -> Dict[str, Any]:
+        # Envelope fields are applied last so nothing in the LLM's JSON can replace them
+        return {
+            **(diagnosis or {}),
+            **fields,
+            "type": "result",
+            "index": index,
+            "filename": name,
+            "model_tier": self.tier.name,
+        }
+
+    async def _describe(self, index: int, name: str, data: Any) -> Optional[Tuple[int, str, str, str, Detections]]:
+        """Run the vision stages for one image; answers straight away on a cache hit or error"""
+        if isinstance(data, ImageRejected):
+            await self._results.put(self._result(index, name, success=False, error=str(data)))
+            return None
+        try:
+            image = await limits.run_inference(decode_image, data)
+            digest = await limits.run_inference(image_digest, image)
+            cache_key = diagnosis_key("diagnose", digest, self.symptoms, self.llm.model_name, self.tier)
+
+            cached = result_cache.get(cache_key)
+            if cached is not None:
+                self.cache_hits += 1
+                await self._results.put(self._result(
+                    index, name, cached["diagnosis"], success=True, cache="hit", detections=cached["detections"]
+                ))
+                return None
+
+            caption, detections, _ = await describe_image(image, digest, self.tier)
+            return index, name, cache_key, caption, detections
+        except Exception as e:
+            await self._results.put(self._result(index, name, success=False, error=f"Error processing image: {str(e)}"))
+            return None
+
+    async def _diagnose(self, pending: List[Tuple[int, str, str, str, Detections]]):
+        """Diagnose the images of a group with one LLM call, retrying singly any it skipped"""
+        diagnoses: Dict[int, Dict[str, Any]] = {}
+        if len(pending) > 1:
+            prompt = build_group_prompt([(caption, detections) for _, _, _, caption, detections in pending], self.symptoms)
+            try:
+                async with limits.llm_slot():
+                    response = await self.llm.ainvoke(prompt)
+                self.llm_calls += 1
+                diagnoses = _parse_group_response(response.content, len(pending))
+            except Exception as e:
+                logger.warning(f"Grouped diagnosis of {len(pending)} images failed: {str(e)}")
+
+        for number, (index, name, cache_key, caption, detections) in enumerate(pending, start=1):
+            try:
+                diagnosis = diagnoses.get(number)
+                if diagnosis is None:
+                    async with limits.llm_slot():
+                        response = await self.llm.ainvoke(build_diagnosis_prompt(caption, detections, self.symptoms))
+                    self.llm_calls += 1
+                    diagnosis = extract_json_from_text(response.content)
+
+                if "raw_response" not in diagnosis:
+                    result_cache.set(cache_key, {
+                        "caption": caption,
+                        "detections": detections.to_list(),
+                        "diagnosis": diagnosis
+                    })
+                await self._results.put(self._result(
+                    index, name, diagnosis, success=True, detections=detections.to_list()
+                ))
+            except Exception as e:
+                await self._results.put(self._result(index, name, success=False, error=str(e)))
+
+
+def stream_batch_diagnosis(spools: List[Spool], symptoms: Optional[str] = None, tier: Optional[str] = None) -> AsyncIterator[str]:
+    """
+    Diagnose every image in a set of uploads (zip archives are expanded)
+
+    Args:
+        spools: Uploads copied with spool_uploads()
+        symptoms: Symptoms reported for the whole batch
+        tier: Vision model tier; defaults to the tier configured for the diagnose endpoint
+
+    Returns:
+        Async iterator of NDJSON lines: one "result" object per image as it
+        completes, then a "summary" object
+    """
+    return BatchDiagnosis(spools, symptoms, catalogue.resolve(tier, "diagnose")).stream()
@@ -0,0 +1,203 @@
+import os
+import time
+import asyncio
+import logging
+import functools
+import contextvars
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from vision import caption_images, detect_objects
+from executor import limits
+from model_catalogue import ModelTier, catalogue
+from detections import Detections
+from metrics import MODEL_BATCH_SECONDS, MODEL_BATCH_SIZE, record_stage
+from profiling import current_profile, profile_batch
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of images in one batch, and how long to wait for a batch to fill
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "8"))
+BATCH_WINDOW_MS = float(os.getenv("BATCH_WINDOW_MS", "20"))
+
+# Number of recent batches kept for the metrics window
+_METRICS_WINDOW = 256
+
+
+class MicroBatcher:
+    """
+    Collects concurrent single-item requests into batches.
+
+    Callers ``await submit(item)``; a background task gathers pending items
+    until either ``max_batch_size`` items are queued or ``max_wait_ms`` has
+    elapsed since the first one arrived, runs ``batch_fn`` once on the whole
+    batch on the inference thread pool and resolves every caller with its
+    own result.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        batch_fn: Callable[[List[Any]], List[Any]],
+        max_batch_size: int = BATCH_MAX_SIZE,
+        max_wait_ms: float = BATCH_WINDOW_MS
+    ):
+        self.name = name
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+        # (batch size, queue wait ms, inference ms) for recent batches
+        self._recent: Deque[Tuple[int, float, float]] = deque(maxlen=_METRICS_WINDOW)
+        self._total_batches = 0
+        self._total_items = 0
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done() or self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            # Started in an empty context so it does not inherit the first caller's request state
+            self._worker = contextvars.Context().run(loop.create_task, self._run())
+
+    async def submit(self, item: Any) -> Any:
+        """
+        Queue one item for the next batch and wait for its result
+
+        Args:
+            item: Input passed to ``batch_fn`` as part of a list
+
+        Returns:
+            The result ``batch_fn`` produced for this item
+        """
+        self._ensure_worker()
+        future = self._loop.create_future()
+        # A sampled request has the whole batch its image lands in profiled
+        await self._queue.put((item, future, time.perf_counter(), current_profile()))
+        return await future
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            deadline = self._loop.time() + self.max_wait
+
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - self._loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            await self._execute(batch)
+
+    async def _execute(self, batch: List[Tuple[Any, asyncio.Future, float, Any]]):
+        items = [item for item, _, _, _ in batch]
+        profiles = [profile for _, _, _, profile in batch if profile is not None]
+        batch_fn = profile_batch(self.name, self.batch_fn, profiles) if profiles else self.batch_fn
+        start = time.perf_counter()
+        oldest_wait_ms = (start - min(enqueued for _, _, enqueued, _ in batch)) * 1000
+
+        try:
+            results = await limits.run_inference(batch_fn, items)
+            if len(results) != len(items):
+                raise RuntimeError(
+                    f"{self.name} batch returned {len(results)} results for {len(items)} inputs"
+                )
+        except Exception as e:
+            logger.error(f"{self.name} batch of {len(items)} failed: {str(e)}")
+            for _, future, _, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        inference_ms = (time.perf_counter() - start) * 1000
+        for (_, future, _, _), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+        self._recent.append((len(items), oldest_wait_ms, inference_ms))
+        MODEL_BATCH_SECONDS.labels(self.name).observe(inference_ms / 1000)
+        MODEL_BATCH_SIZE.labels(self.name).observe(len(items))
+        self._total_batches += 1
+        self._total_items += len(items)
+        logger.info(
+            f"{self.name} batch: size={len(items)} wait={oldest_wait_ms:.1f}ms "
+            f"inference={inference_ms:.1f}ms"
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        """Batch size and latency figures over the recent metrics window"""
+        recent = list(self._recent)
+        sizes = [size for size, _, _ in recent]
+        waits = [wait for _, wait, _ in recent]
+        latencies = [latency for _, _, latency in recent]
+        return {
+            "max_batch_size": self.max_batch_size,
+            "window_ms": self.max_wait * 1000,
+            "total_batches": self._total_batches,
+            "total_items": self._total_items,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "recent_avg_batch_size": round(sum(sizes) / len(sizes), 2) if sizes else 0,
+            "recent_max_batch_size": max(sizes) if sizes else 0,
+            "recent_avg_wait_ms": round(sum(waits) / len(waits), 2) if waits else 0,
+            "recent_avg_inference_ms": round(sum(latencies) / len(latencies), 2) if latencies else 0,
+        }
+
+
+# Shared batchers for the two vision stages, one per model tier since a batch
+# can only run through a single model
+_stage_fns = {"caption": caption_images, "detection": detect_objects}
+_batchers: Dict[Tuple[str, str], MicroBatcher] = {}
+
+
+def get_batcher(stage: str, tier: ModelTier) -> MicroBatcher:
+    """Return the batcher for a vision stage and tier, creating it on first use"""
+    batcher = _batchers.get((stage, tier.name))
+    if batcher is None:
+        batcher = MicroBatcher(f"{stage}:{tier.name}", functools.partial(_stage_fns[stage], tier=tier))
+        _batchers[(stage, tier.name)] = batcher
+    return batcher
+
+
+async def _timed(awaitable, timings: Dict[str, float], key: str) -> Any:
+    start = time.perf_counter()
+    try:
+        return await awaitable
+    finally:
+        elapsed = time.perf_counter() - start
+        timings[key] = round(elapsed * 1000, 1)
+        # Queue wait plus batch inference as seen by this request
+        record_stage("vision", key[:-len("_ms")], elapsed)
+
+
+async def analyze_image(image: Any, tier: Optional[ModelTier] = None) -> Tuple[str, Detections, Dict[str, float]]:
+    """
+    Run captioning and object detection on one image concurrently
+
+    Args:
+        image: Decoded upload to analyse
+        tier: Model tier to use (defaults to the catalogue's default tier)
+
+    Returns:
+        Tuple of (caption, detected objects, per-stage timings in ms)
+    """
+    tier = tier or catalogue.resolve()
+    timings: Dict[str, float] = {}
+    start = time.perf_counter()
+    caption, objects = await asyncio.gather(
+        _timed(get_batcher("caption", tier).submit(image), timings, "caption_ms"),
+        _timed(get_batcher("detection", tier).submit(image), timings, "detection_ms"),
+    )
+    timings["vision_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    return caption, objects, timings
+
+
+def batching_stats() -> Dict[str, Any]:
+    """Metrics for all vision batchers, keyed by stage and tier"""
+    return {batcher.name: batcher.stats() for batcher in list(_batchers.values())}
@@ -0,0 +1,606 @@
+"""
+End-to-end load benchmark of the API with a local stand-in for OpenAI.
+
+Starts the app in a child process with every GPT model replaced by
+benchmark_stubs.FakeChatOpenAI (configurable time to first token and
+token rate, no network, no credits) and optionally with BLIP/DETR
+replaced by stubs, then drives concurrent load against each endpoint in
+turn:
+
+- upload      POST /api/upload
+- diagnose    POST /api/diagnose-plant-disease/
+- chat        POST /api/chat (sessions are created by an upload beforehand)
+- websocket   /ws/{session_id} image message with streaming, per session
+
+Load is closed-loop by default (--concurrency clients, --requests in
+total); with --rate requests are started on a fixed schedule regardless
+of how many are in flight. Every request uses a different synthetic
+image unless --distinct-images is set, and the LLM response cache and
+near-duplicate lookup are off unless --cache is set, so the caches do not
+hide model and LLM time. Cache hits are still reported per endpoint.
+
+For each endpoint it reports p50/p95/p99 latency, throughput, errors,
+time to first streamed token (websocket) and the server's peak RSS
+while the endpoint was under load. Results are written as JSON, and
+--compare checks them against an earlier run.
+
+With --workers N the server runs under gunicorn as in production
+(gunicorn.conf.py: models loaded once, workers forked from the master),
+and the idle memory report shows the RSS of a single worker next to the
+total the workers really occupy (their PSS, which counts shared pages once).
+
+Usage:
+    python benchmark.py --stub-vision --concurrency 16 --requests 200 --output bench.json
+    python benchmark.py --stub-vision --compare bench.json --max-regression 10
+    python benchmark.py --workers 4 --endpoints diagnose
+
+Exits with status 1 when --max-regression is exceeded.
+"""
+import io
+import os
+import sys
+import json
+import math
+import time
+import uuid
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+ENDPOINTS = ("upload", "diagnose", "chat", "websocket")
+
+SYMPTOMS = "Brown spots with yellow halos on the lower leaves, spreading upwards after rain."
+CHAT_MESSAGE = "How often should I apply the fungicide?"
+
+# (success, time to first streamed token in seconds or None)
+Outcome = Tuple[bool, Optional[float]]
+
+
+def serve(args: argparse.Namespace):
+    """Run the app with the stand-ins installed; this is the benchmark's child process"""
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    os.environ["LLM_CACHE"] = "true" if args.cache else "false"
+    # Synthetic images can land within the near-duplicate distance of each other
+    os.environ["PHASH_ENABLED"] = "true" if args.cache else "false"
+    os.environ["WEB_CONCURRENCY"] = str(args.workers)
+    if args.workers > 1:
+        # Must be set before metrics.py imports prometheus_client, as gunicorn.conf.py would
+        os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", tempfile.mkdtemp(prefix="plantid-metrics-"))
+    if args.stub_vision:
+        os.environ["WARM_UP_MODELS"] = "false"
+        os.environ["SHARE_MODELS"] = "false"
+
+    # Installed before main is imported, since its startup task builds the chat models
+    import llm_client
+    from benchmark_stubs import FakeChatOpenAI, stub_vision_stages
+
+    def fake_chat_model(self, model: str, temperature: float, **kwargs: Any) -> FakeChatOpenAI:
+        return FakeChatOpenAI(
+            model_name=model,
+            temperature=temperature,
+            max_tokens=kwargs.get("max_tokens"),
+            streaming=kwargs.get("streaming", False),
+            cache=kwargs.get("cache"),
+            callbacks=kwargs.get("callbacks"),
+            latency_ms=args.llm_latency_ms,
+            tokens_per_second=args.llm_tokens_per_second
+        )
+
+    llm_client.LLMClient.chat_model = fake_chat_model
+    if args.stub_vision:
+        import batching
+        batching._stage_fns.update(stub_vision_stages(args.vision_ms))
+
+    if args.workers > 1:
+        # Runs in this process, so the workers fork with the stand-ins already installed
+        from gunicorn.app.wsgiapp import WSGIApplication
+        sys.argv = [
+            "gunicorn",
+            "--config", os.path.join(os.path.dirname(os.path.abspath(__file__)), "gunicorn.conf.py"),
+            "--bind", f"127.0.0.1:{args.port}",
+            "--log-level", "warning",
+            "main:app",
+        ]
+        WSGIApplication("%(prog)s [OPTIONS] [APP_MODULE]").run()
+        return
+
+    import uvicorn
+    from main import app
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(args: argparse.Namespace, workdir: str) -> Tuple[subprocess.Popen, str, Dict[str, Any]]:
+    """
+    Start the app in a child process working in workdir and wait until it is ready
+
+    Returns:
+        The process, its base URL and its cold-start times: seconds from
+        spawning it until / answered (live_s) and until /ready returned 200
+        (ready_s), plus the startup breakdown /ready reported
+    """
+    import httpx
+
+    port = _free_port()
+    command = [
+        sys.executable, os.path.abspath(__file__), "--serve",
+        "--port", str(port),
+        "--llm-latency-ms", str(args.llm_latency_ms),
+        "--llm-tokens-per-second", str(args.llm_tokens_per_second),
+        "--vision-ms", str(args.vision_ms),
+        "--workers", str(args.workers),
+    ]
+    if args.stub_vision:
+        command.append("--stub-vision")
+    if args.cache:
+        command.append("--cache")
+
+    log = open(os.path.join(workdir, "server.log"), "wb")
+    spawned = time.monotonic()
+    process = subprocess.Popen(command, cwd=workdir, stdout=log, stderr=subprocess.STDOUT)
+    base_url = f"http://127.0.0.1:{port}"
+    cold_start: Dict[str, Any] = {"live_s": None, "ready_s": None}
+    deadline = spawned + args.startup_timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited during startup; see {log.name}")
+        try:
+            if cold_start["live_s"] is None:
+                if httpx.get(base_url + "/", timeout=1).status_code == 200:
+                    cold_start["live_s"] = round(time.monotonic() - spawned, 3)
+            else:
+                response = httpx.get(base_url + "/ready", timeout=1)
+                if response.status_code == 200:
+                    cold_start["ready_s"] = round(time.monotonic() - spawned, 3)
+                    cold_start["server"] = response.json()
+                    return process, base_url, cold_start
+                if response.json().get("status") == "failed":
+                    process.kill()
+                    raise RuntimeError(f"Server warm-up failed: {response.json().get('error')}")
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.05)
+    process.kill()
+    raise RuntimeError(f"Server was not ready within {args.startup_timeout}s; see {log.name}")
+
+
+class RssSampler:
+    """Tracks the peak resident memory of the server process and its children"""
+
+    def __init__(self, pid: int, interval: float = 0.05):
+        import psutil
+        self.process = psutil.Process(pid)
+        self.interval = interval
+        self.peak = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def rss(self) -> int:
+        processes = [self.process, *self.process.children(recursive=True)]
+        total = 0
+        for process in processes:
+            try:
+                total += process.memory_info().rss
+            except Exception:
+                pass
+        return total
+
+    async def _run(self):
+        while True:
+            self.peak = max(self.peak, self.rss())
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self.peak = self.rss()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> int:
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        return self.peak
+
+
+def memory_report(pid: int) -> Dict[str, Any]:
+    """
+    Memory of the server process and its workers
+
+    Summing RSS counts the pages the workers share (the preloaded model
+    weights) once per worker, so the real total is the sum of their PSS,
+    which splits every shared page between the processes mapping it. PSS
+    is Linux only; elsewhere the total falls back to the RSS sum.
+    """
+    import psutil
+
+    parent = psutil.Process(pid)
+    processes = []
+    for process in [parent, *parent.children(recursive=True)]:
+        try:
+            info = process.memory_full_info()
+        except psutil.Error:
+            continue
+        processes.append({
+            "pid": process.pid,
+            "rss_mb": round(info.rss / 2**20, 1),
+            "pss_mb": round(info.pss / 2**20, 1) if hasattr(info, "pss") else None,
+            "uss_mb": round(info.uss / 2**20, 1),
+        })
+
+    workers = processes[1:] or processes
+    pss = [p["pss_mb"] for p in processes]
+    return {
+        "workers": len(workers),
+        # What one worker maps, weights included: the footprint of a single-worker deployment
+        "single_worker_rss_mb": max(p["rss_mb"] for p in workers),
+        "rss_sum_mb": round(sum(p["rss_mb"] for p in processes), 1),
+        "total_mb": round(sum(pss), 1) if None not in pss else round(sum(p["rss_mb"] for p in processes), 1),
+        "processes": processes,
+    }
+
+
+def synthetic_images(count: int, seed: int, width: int = 800, height: int = 600) -> List[bytes]:
+    """
+    Distinct JPEG images so no two hit the same cache entry
+
+    Each one is a leafy background with randomly placed light and dark
+    blotches, so the images differ in structure (and perceptual hash),
+    not just in pixel noise.
+    """
+    import numpy as np
+    from PIL import Image
+
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width]
+    images = []
+    for _ in range(count):
+        base = np.stack([np.full(x.shape, 60.0), np.full(x.shape, 140.0), np.full(x.shape, 40.0)], axis=-1)
+        for _ in range(12):
+            cx, cy = rng.uniform(0, width), rng.uniform(0, height)
+            radius = rng.uniform(0.05, 0.2) * width
+            blob = np.exp(-((x - cx) ** 2 + (y - cy) ** 2) / (2 * radius ** 2))
+            base += blob[..., None] * rng.uniform(-120, 120, size=3)
+        pixels = np.clip(base + rng.normal(0, 15, base.shape), 0, 255).astype(np.uint8)
+        buffer = io.BytesIO()
+        Image.fromarray(pixels).save(buffer, format="JPEG", quality=85)
+        images.append(buffer.getvalue())
+    return images
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(q / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return None if seconds is None else round(seconds * 1000, 1)
+
+
+class Scenarios:
+    """One coroutine per endpoint that sends a single request and reports its outcome"""
+
+    def __init__(self, client, base_url: str):
+        self.client = client
+        self.base_url = base_url
+        self.sessions: List[str] = []
+
+    async def upload(self, image: bytes) -> Outcome:
+        response = await self.client.post(
+            "/api/upload",
+            files={"file": ("leaf.jpg", image, "image/jpeg")},
+            data={"symptoms": SYMPTOMS}
+        )
+        return response.status_code == 200 and response.json().get("success", False), None
+
+    async def diagnose(self, image: bytes) -> Outcome:
+        response = await self.client.post(
+            "/api/diagnose-plant-disease/",
+            files={"file": ("leaf.jpg", image, "image/jpeg")},
+            data={"symptoms": SYMPTOMS}
+        )
+        return response.status_code == 200 and response.json().get("success", False), None
+
+    async def create_sessions(self, images: List[bytes]):
+        """Start one chat session per image; chat requests are spread across them"""
+        for image in images:
+            response = await self.client.post(
+                "/api/upload",
+                files={"file": ("leaf.jpg", image, "image/jpeg")},
+                data={"symptoms": SYMPTOMS}
+            )
+            result = response.json()
+            if not result.get("success"):
+                raise RuntimeError(f"Could not create a chat session: {result.get('error')}")
+            self.sessions.append(result["session_id"])
+
+    async def chat(self, image: bytes, number: int) -> Outcome:
+        session_id = self.sessions[number % len(self.sessions)]
+        response = await self.client.post("/api/chat", json={"session_id": session_id, "message": CHAT_MESSAGE})
+        return response.status_code == 200 and response.json().get("success", False), None
+
+    async def websocket(self, image: bytes) -> Outcome:
+        import base64
+        import websockets
+
+        url = self.base_url.replace("http", "ws", 1) + f"/ws/{uuid.uuid4()}"
+        async with websockets.connect(url, max_size=None) as ws:
+            await ws.recv()  # connection confirmation
+            start = time.perf_counter()
+            await ws.send(json.dumps({
+                "type": "image",
+                "data": base64.b64encode(image).decode(),
+                "filename": "leaf.jpg",
+                "symptoms": SYMPTOMS,
+                "stream": True
+            }))
+            first_token = None
+            while True:
+                frame = json.loads(await ws.recv())
+                if frame.get("type") == "delta":
+                    if first_token is None:
+                        first_token = time.perf_counter() - start
+                elif "success" in frame:
+                    return frame["success"], first_token
+
+
+async def cache_hits(client) -> Dict[str, int]:
+    """Result cache and near-duplicate hits the server has counted so far (one worker's, with --workers)"""
+    stats = (await client.get("/api/cache")).json()
+    results = stats["results"]
+    return {
+        "results": results.get("memory_hits", 0) + results.get("disk_hits", 0),
+        "near_duplicates": stats["near_duplicates"]["hits"],
+    }
+
+
+async def run_endpoint(
+    request: Callable[[bytes, int], Awaitable[Outcome]],
+    images: List[bytes],
+    args: argparse.Namespace,
+    sampler: RssSampler,
+    client
+) -> Dict[str, Any]:
+    """Drive load against one endpoint and summarize latency, throughput, memory and cache hits"""
+    latencies: List[float] = []
+    first_tokens: List[float] = []
+    errors: List[str] = []
+
+    async def one(number: int):
+        start = time.perf_counter()
+        try:
+            ok, first_token = await request(images[number % len(images)], number)
+        except Exception as e:
+            errors.append(f"{type(e).__name__}: {e}")
+            return
+        if not ok:
+            errors.append("unsuccessful response")
+            return
+        latencies.append(time.perf_counter() - start)
+        if first_token is not None:
+            first_tokens.append(first_token)
+
+    total = args.requests if args.rate is None else max(1, int(args.rate * args.duration))
+    hits_before = await cache_hits(client)
+    sampler.start()
+    start = time.perf_counter()
+    if args.rate is None:
+        counter = iter(range(total))
+
+        async def worker():
+            for number in counter:
+                await one(number)
+
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    else:
+        tasks = []
+        for number in range(total):
+            delay = start + number / args.rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(one(number)))
+        await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+    peak_rss = await sampler.stop()
+    hits_after = await cache_hits(client)
+
+    result = {
+        "requests": total,
+        "succeeded": len(latencies),
+        "errors": total - len(latencies),
+        "elapsed_s": round(elapsed, 2),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed > 0 else 0,
+        "mean_ms": _ms(sum(latencies) / len(latencies)) if latencies else None,
+        "p50_ms": _ms(percentile(latencies, 50)),
+        "p95_ms": _ms(percentile(latencies, 95)),
+        "p99_ms": _ms(percentile(latencies, 99)),
+        "max_ms": _ms(max(latencies)) if latencies else None,
+        "peak_rss_mb": round(peak_rss / 2**20, 1),
+        # Requests answered without running the vision models; only non-zero with --cache or --distinct-images
+        "cache_hits": {name: hits_after[name] - hits_before[name] for name in hits_after},
+    }
+    if first_tokens:
+        result["first_token_p50_ms"] = _ms(percentile(first_tokens, 50))
+        result["first_token_p95_ms"] = _ms(percentile(first_tokens, 95))
+    if errors:
+        result["sample_errors"] = sorted(set(errors))[:5]
+    return result
+
+
+async def run_benchmark(args: argparse.Namespace, base_url: str, pid: int) -> Dict[str, Any]:
+    import httpx
+
+    sampler = RssSampler(pid)
+    timeout = httpx.Timeout(args.request_timeout)
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=args.concurrency)
+    results: Dict[str, Any] = {}
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        scenarios = Scenarios(client, base_url)
+        idle_rss = sampler.rss()
+        total = args.requests if args.rate is None else max(1, int(args.rate * args.duration))
+
+        for seed, name in enumerate(args.endpoints):
+            images = synthetic_images(args.distinct_images or total, seed=seed)
+            if name == "chat":
+                await scenarios.create_sessions(synthetic_images(args.concurrency, seed=100))
+                request = scenarios.chat
+            else:
+                handler = getattr(scenarios, name)
+                request = lambda image, number, handler=handler: handler(image)
+
+            print(f"Benchmarking {name}: {total} requests ...", flush=True)
+            results[name] = await run_endpoint(request, images, args, sampler, client)
+
+    return {"idle_rss_mb": round(idle_rss / 2**20, 1), "endpoints": results}
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def print_memory(memory: Dict[str, Any]):
+    print(
+        f"Idle memory: {memory['workers']} worker(s), single worker RSS {memory['single_worker_rss_mb']} MB, "
+        f"total {memory['total_mb']} MB (RSS sum {memory['rss_sum_mb']} MB)"
+    )
+
+
+def print_cold_start(cold_start: Dict[str, Any]):
+    server = cold_start.get("server", {})
+    print(
+        f"Cold start: live after {cold_start['live_s']}s, ready after {cold_start['ready_s']}s "
+        f"(imports done {server.get('imported_s')}s, chat {server.get('chat_ready_s')}s, "
+        f"models warm {server.get('models_warm_s')}s after process start)"
+    )
+
+
+def print_results(endpoints: Dict[str, Dict[str, Any]]):
+    print(f"{'endpoint':<10} {'ok':>5} {'err':>4} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'peak MB':>8}")
+    for name, r in endpoints.items():
+        print(
+            f"{name:<10} {r['succeeded']:>5} {r['errors']:>4} {r['throughput_rps']:>8} "
+            f"{str(r['p50_ms']):>9} {str(r['p95_ms']):>9} {str(r['p99_ms']):>9} {r['peak_rss_mb']:>8}"
+        )
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], max_regression: Optional[float]) -> bool:
+    """Print the change against a baseline run; True when a regression exceeds max_regression percent"""
+    def change(new, old):
+        return None if not new or not old else (new - old) / old * 100
+
+    regressed = False
+    print(f"\nChange against {baseline.get('git_commit') or 'baseline'}:")
+    print(f"{'endpoint':<10} {'p95':>9} {'p99':>9} {'rps':>9} {'peak MB':>9}")
+    for name, r in current["endpoints"].items():
+        old = baseline.get("endpoints", {}).get(name)
+        if old is None:
+            continue
+        deltas = {
+            "p95": change(r["p95_ms"], old["p95_ms"]),
+            "p99": change(r["p99_ms"], old["p99_ms"]),
+            "rps": change(r["throughput_rps"], old["throughput_rps"]),
+            "rss": change(r["peak_rss_mb"], old["peak_rss_mb"]),
+        }
+        print(f"{name:<10} " + " ".join(
+            f"{'n/a':>9}" if d is None else f"{d:>+8.1f}%" for d in deltas.values()
+        ))
+        if max_regression is not None:
+            worse = [deltas["p95"], deltas["rss"], None if deltas["rps"] is None else -deltas["rps"]]
+            regressed = regressed or any(d is not None and d > max_regression for d in worse)
+    ready = change(current.get("cold_start", {}).get("ready_s"), baseline.get("cold_start", {}).get("ready_s"))
+    if ready is not None:
+        print(f"Time to ready: {ready:+.1f}%")
+    memory = change(current.get("memory", {}).get("total_mb"), baseline.get("memory", {}).get("total_mb"))
+    if memory is not None:
+        print(f"Idle memory: {memory:+.1f}%")
+    return regressed
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Load test the API offline with a fake LLM")
+    parser.add_argument("--endpoints", nargs="+", default=list(ENDPOINTS), choices=ENDPOINTS)
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent clients in closed-loop mode")
+    parser.add_argument("--requests", type=int, default=100, help="Requests per endpoint in closed-loop mode")
+    parser.add_argument("--rate", type=float, help="Open-loop mode: requests started per second")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds of open-loop load per endpoint")
+    parser.add_argument("--llm-latency-ms", type=float, default=300, help="Fake LLM time to first token")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=50, help="Fake LLM generation rate")
+    parser.add_argument("--stub-vision", action="store_true", help="Replace BLIP and DETR with fixed stubs")
+    parser.add_argument("--vision-ms", type=float, default=20, help="Time each stub vision batch takes")
+    parser.add_argument("--distinct-images", type=int, default=0,
+                        help="Cycle through this many images (default: a new image per request)")
+    parser.add_argument("--cache", action="store_true", help="Leave the LLM response cache and near-duplicate lookup enabled")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Run the server under gunicorn with this many forked workers")
+    parser.add_argument("--request-timeout", type=float, default=120)
+    parser.add_argument("--startup-timeout", type=float, default=300)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--compare", help="Earlier --output file to compare against")
+    parser.add_argument("--max-regression", type=float,
+                        help="Fail if p95, peak RSS or throughput is this many percent worse than --compare")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main() -> int:
+    args = parse_args()
+    if args.serve:
+        serve(args)
+        return 0
+
+    with tempfile.TemporaryDirectory(prefix="plantid-bench-") as workdir:
+        process, base_url, cold_start = start_server(args, workdir)
+        try:
+            memory = memory_report(process.pid)
+            measured = asyncio.run(run_benchmark(args, base_url, process.pid))
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    results = {
+        "git_commit": _git_commit(),
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "config": {key: value for key, value in vars(args).items() if key not in ("serve", "port", "output", "compare")},
+        "cold_start": cold_start,
+        "memory": memory,
+        **measured,
+    }
+    print_cold_start(cold_start)
+    print_memory(memory)
+    print_results(results["endpoints"])
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.max_regression):
+            print(f"Regression above {args.max_regression}%")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,178 @@
+"""
+Stand-ins used by benchmark.py so the API can be load tested offline.
+
+FakeChatOpenAI replaces every GPT model with a deterministic local chat
+model that waits a configurable time to the first token and then emits
+tokens at a fixed rate. stub_vision_stages() replaces BLIP and DETR with
+functions that return a fixed caption and detections after a fixed
+per-batch delay, so a benchmark can isolate the serving path from model
+inference.
+"""
+import re
+import json
+import time
+import asyncio
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+import numpy as np
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models import BaseChatModel
+from langchain_core.language_models.chat_models import agenerate_from_stream, generate_from_stream
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from detections import Detections
+
+DIAGNOSIS = {
+    "possible_diagnosis": ["Late blight (Phytophthora infestans)", "Septoria leaf spot"],
+    "causes": ["Prolonged leaf wetness", "Spores spread by wind and splashing water"],
+    "remedies_or_cure": ["Remove and destroy infected leaves", "Apply a copper-based fungicide"],
+}
+
+ANALYSIS = (
+    "The leaves show dark water-soaked lesions spreading from the margins with pale "
+    "growth on the underside, which points to late blight. It is favoured by cool humid "
+    "weather and spreads quickly between plants. Remove infected foliage, avoid overhead "
+    "watering and apply a copper-based fungicide every seven to ten days. Would you like "
+    "more detail on any of these steps?"
+)
+
+STUB_CAPTION = "a close up of a green leaf with brown spots"
+
+
+def _prompt_text(messages: List[BaseMessage]) -> str:
+    return "\n".join(str(message.content) for message in messages)
+
+
+def fake_response(prompt: str) -> str:
+    """Deterministic answer in the format the prompt asks for"""
+    if '"results"' in prompt:
+        count = len(re.findall(r"^IMAGE \d+$", prompt, flags=re.MULTILINE))
+        return json.dumps({"results": [{"image": n, **DIAGNOSIS} for n in range(1, count + 1)]})
+    if "possible_diagnosis" in prompt:
+        return json.dumps(DIAGNOSIS)
+    if "action_input" in prompt:
+        # Conversational agent format: answer directly without calling a tool
+        return "```json\n" + json.dumps({"action": "Final Answer", "action_input": ANALYSIS}) + "\n```"
+    return ANALYSIS
+
+
+def _tokens(text: str) -> List[str]:
+    # Roughly one token per word, keeping the separators so chunks join back losslessly
+    return re.findall(r"\S+\s*|\s+", text)
+
+
+class FakeChatOpenAI(BaseChatModel):
+    """
+    Deterministic chat model with OpenAI-like timing.
+
+    Every call waits ``latency_ms`` before the first token and then
+    ``1 / tokens_per_second`` per token, both when streaming and when the
+    full answer is returned at once.
+    """
+
+    model_name: str = "fake-gpt-4o"
+    temperature: float = 0.0
+    max_tokens: Optional[int] = None
+    streaming: bool = False
+    latency_ms: float = 300.0
+    tokens_per_second: float = 50.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-openai-chat"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model_name": self.model_name, "temperature": self.temperature, "max_tokens": self.max_tokens}
+
+    def _duration(self, tokens: int) -> float:
+        return self.latency_ms / 1000 + tokens / self.tokens_per_second
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> ChatResult:
+        if self.streaming:
+            return generate_from_stream(self._stream(messages, stop, run_manager, **kwargs))
+        text = fake_response(_prompt_text(messages))
+        time.sleep(self._duration(len(_tokens(text))))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> ChatResult:
+        if self.streaming:
+            # Like ChatOpenAI, a streaming model reports tokens to callbacks even when invoked
+            return await agenerate_from_stream(self._astream(messages, stop, run_manager, **kwargs))
+        text = fake_response(_prompt_text(messages))
+        await asyncio.sleep(self._duration(len(_tokens(text))))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.latency_ms / 1000)
+        for token in _tokens(fake_response(_prompt_text(messages))):
+            time.sleep(1 / self.tokens_per_second)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager is not None:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.latency_ms / 1000)
+        for token in _tokens(fake_response(_prompt_text(messages))):
+            await asyncio.sleep(1 / self.tokens_per_second)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager is not None:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+    def get_num_tokens_from_messages(self, messages: List[BaseMessage], tools: Optional[Any] = None) -> int:
+        # Same rough four-characters-per-token rule for every model, no tokenizer download
+        return sum(len(str(message.content)) // 4 + 4 for message in messages)
+
+    def get_num_tokens(self, text: str) -> int:
+        return len(text) // 4
+
+
+def stub_vision_stages(batch_ms: float) -> Dict[str, Any]:
+    """
+    Caption and detection functions with the signatures of vision.caption_images
+    and vision.detect_objects that sleep batch_ms per batch instead of running a model
+    """
+    def caption_images(images: List[Any], models: Any = None, tier: Any = None) -> List[str]:
+        time.sleep(batch_ms / 1000)
+        return [STUB_CAPTION] * len(images)
+
+    def detect_objects(images: List[Any], models: Any = None, tier: Any = None) -> List[Detections]:
+        time.sleep(batch_ms / 1000)
+        results = []
+        for image in images:
+            width, height = image.original_size
+            results.append(Detections(
+                np.array([[0.1 * width, 0.2 * height, 0.6 * width, 0.9 * height]], dtype=np.float32),
+                np.array(["potted plant"], dtype=str),
+                np.array([0.97], dtype=np.float32)
+            ))
+        return results
+
+    return {"caption": caption_images, "detection": detect_objects}
@@ -0,0 +1,175 @@
+"""
+Accuracy-vs-latency comparison of the vision inference backends.
+
+Runs every image in a fixed directory through BLIP and DETR once per
+backend, using the first backend as the reference, and checks that the
+other backends stay within tolerance:
+
+- captions must have a word-level similarity of at least --caption-similarity
+- every reference detection must be matched by one with the same label,
+  an IoU of at least --box-iou and a score within --score-delta; detections
+  whose reference score is within --score-delta of the threshold may be
+  missing or extra, since they can legitimately flip either way
+
+Usage:
+    python compare_backends.py --images images/ --backends torch int8 onnx --output backends.json
+
+Exits with status 1 when any backend is out of tolerance.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from difflib import SequenceMatcher
+from typing import Any, Dict, List
+
+import numpy as np
+
+from image_ingest import decode_image
+from inference_backends import BACKENDS
+from model_registry import ModelRegistry
+from model_catalogue import ModelTier, catalogue
+from vision import caption_images, detect_objects
+from detections import Detections
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp")
+
+def pairwise_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """(N, M) intersection over union between two sets of [x1, y1, x2, y2] boxes"""
+    top_left = np.maximum(a[:, None, :2], b[None, :, :2])
+    bottom_right = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    intersection = np.clip(bottom_right - top_left, 0, None).prod(-1)
+    area_a = (a[:, 2:] - a[:, :2]).prod(-1)
+    area_b = (b[:, 2:] - b[:, :2]).prod(-1)
+    union = area_a[:, None] + area_b[None, :] - intersection
+    return np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+
+
+def caption_similarity(reference: str, candidate: str) -> float:
+    return SequenceMatcher(None, reference.lower().split(), candidate.lower().split()).ratio()
+
+
+def detections_match(
+    reference: Detections,
+    candidate: Detections,
+    threshold: float,
+    box_iou: float,
+    score_delta: float
+) -> bool:
+    """Check that two sets of detections agree, tolerating borderline detections"""
+    borderline = threshold + score_delta
+    # (reference, candidate) pairs that would count as the same detection
+    compatible = (
+        (reference.labels[:, None] == candidate.labels[None, :])
+        & (pairwise_iou(reference.boxes, candidate.boxes) >= box_iou)
+        & (np.abs(reference.scores[:, None] - candidate.scores[None, :]) <= score_delta)
+    )
+    unmatched = np.ones(len(candidate), dtype=bool)
+    for i in range(len(reference)):
+        options = np.flatnonzero(compatible[i] & unmatched)
+        if len(options):
+            unmatched[options[0]] = False
+        elif reference.scores[i] > borderline:
+            return False
+    return bool(np.all(candidate.scores[unmatched] <= borderline))
+
+
+def run_backend(backend: str, tier: ModelTier, images: List[Any], repeats: int) -> Dict[str, Any]:
+    """Load the models of a tier for one backend and time captioning and detection per image"""
+    models = ModelRegistry(backend=backend)
+    models.caption(tier)
+    models.detection(tier)
+    load_stats = models.stats()["models"]
+
+    captions, detections, latencies = [], [], []
+    for image in images:
+        best = None
+        for _ in range(repeats):
+            start = time.perf_counter()
+            caption = caption_images([image], models, tier)[0]
+            found = detect_objects([image], models, tier)[0]
+            elapsed = (time.perf_counter() - start) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+        captions.append(caption)
+        detections.append(found)
+        latencies.append(best)
+
+    latencies_sorted = sorted(latencies)
+    return {
+        "load": load_stats,
+        "captions": captions,
+        "detections": detections,
+        "mean_ms": round(sum(latencies) / len(latencies), 1),
+        "p50_ms": round(latencies_sorted[len(latencies_sorted) // 2], 1),
+        "max_ms": round(latencies_sorted[-1], 1),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Compare vision inference backends for accuracy and latency")
+    parser.add_argument("--images", default="images", help="Directory with the fixed image set")
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS,
+                        help="Backends to compare; the first one is the reference")
+    parser.add_argument("--tier", help="Model tier from the catalogue (defaults to its default tier)")
+    parser.add_argument("--repeats", type=int, default=3, help="Runs per image; the fastest is kept")
+    parser.add_argument("--caption-similarity", type=float, default=0.8)
+    parser.add_argument("--box-iou", type=float, default=0.85)
+    parser.add_argument("--score-delta", type=float, default=0.05)
+    parser.add_argument("--output", help="Write the full results as JSON to this file")
+    args = parser.parse_args()
+
+    paths = sorted(
+        os.path.join(args.images, name) for name in os.listdir(args.images)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    if not paths:
+        print(f"No images found in {args.images}")
+        return 1
+    images = [decode_image(path) for path in paths]
+
+    tier = catalogue.resolve(args.tier)
+    results = {backend: run_backend(backend, tier, images, args.repeats) for backend in args.backends}
+
+    reference = results[args.backends[0]]
+    failed = False
+    print(f"{'backend':<8} {'mean ms':>9} {'p50 ms':>9} {'speedup':>8} {'captions ok':>12} {'detections ok':>14}")
+    for backend, result in results.items():
+        captions_ok = [
+            caption_similarity(ref, cand) >= args.caption_similarity
+            for ref, cand in zip(reference["captions"], result["captions"])
+        ]
+        detections_ok = [
+            detections_match(ref, cand, tier.detection_threshold, args.box_iou, args.score_delta)
+            for ref, cand in zip(reference["detections"], result["detections"])
+        ]
+        result["within_tolerance"] = all(captions_ok) and all(detections_ok)
+        result["mismatches"] = [
+            os.path.basename(path)
+            for path, caption_ok, detection_ok in zip(paths, captions_ok, detections_ok)
+            if not (caption_ok and detection_ok)
+        ]
+        failed = failed or not result["within_tolerance"]
+        print(
+            f"{backend:<8} {result['mean_ms']:>9} {result['p50_ms']:>9} "
+            f"{reference['mean_ms'] / result['mean_ms']:>7.2f}x "
+            f"{sum(captions_ok):>5}/{len(paths):<6} {sum(detections_ok):>6}/{len(paths):<7}"
+        )
+        for name in result["mismatches"]:
+            print(f"    out of tolerance: {name}")
+
+    if args.output:
+        for result in results.values():
+            result["detections"] = [found.to_list() for found in result["detections"]]
+        with open(args.output, "w") as f:
+            json.dump({
+                "tier": tier._asdict(),
+                "images": [os.path.basename(path) for path in paths],
+                "results": results
+            }, f, indent=2)
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+import os
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+
+# Most detections kept per image after thresholding, highest scores first
+DETECTION_TOP_K = int(os.getenv("DETECTION_TOP_K", "10"))
+
+
+class Detections:
+    """
+    Object detections for one image as parallel NumPy arrays.
+
+    ``boxes`` is an (N, 4) float32 array of [x1, y1, x2, y2] in the
+    original upload's pixel space, ``labels`` an (N,) array of class names
+    and ``scores`` an (N,) float32 array of confidences, sorted by score.
+    """
+
+    __slots__ = ("boxes", "labels", "scores")
+
+    def __init__(self, boxes: np.ndarray, labels: np.ndarray, scores: np.ndarray):
+        self.boxes = boxes
+        self.labels = labels
+        self.scores = scores
+
+    @classmethod
+    def select(
+        cls,
+        boxes: np.ndarray,
+        label_ids: np.ndarray,
+        scores: np.ndarray,
+        id2label: Dict[int, str],
+        threshold: float,
+        top_k: int = DETECTION_TOP_K
+    ) -> "Detections":
+        """
+        Keep the top_k candidates scoring above threshold
+
+        Args:
+            boxes: (Q, 4) candidate boxes
+            label_ids: (Q,) class ids
+            scores: (Q,) confidences
+            id2label: Class id to name mapping from the model config
+            threshold: Minimum confidence
+            top_k: Maximum number of detections to keep
+
+        Returns:
+            The selected detections, highest score first
+        """
+        keep = np.flatnonzero(scores > threshold)
+        keep = keep[np.argsort(-scores[keep], kind="stable")[:top_k]]
+        names = np.array([id2label[int(i)] for i in label_ids[keep]], dtype=str)
+        return cls(boxes[keep].astype(np.float32), names, scores[keep].astype(np.float32))
+
+    def rescaled(self, from_size: Sequence[int], to_size: Sequence[int]) -> "Detections":
+        """
+        Move the boxes from one image's pixel space to another's
+
+        Args:
+            from_size: (width, height) the boxes are currently in
+            to_size: (width, height) of the image they should describe
+
+        Returns:
+            Detections with scaled boxes (self when the sizes match)
+        """
+        (from_width, from_height), (to_width, to_height) = from_size, to_size
+        if (from_width, from_height) == (to_width, to_height):
+            return self
+        scale = np.array([to_width / from_width, to_height / from_height] * 2, dtype=np.float32)
+        return Detections(self.boxes * scale, self.labels, self.scores)
+
+    def __len__(self) -> int:
+        return len(self.scores)
+
+    def to_prompt(self) -> str:
+        """Compact text form for LLM prompts: one "[x1,y1,x2,y2] label score" per line"""
+        if not len(self):
+            return "none"
+        boxes = np.rint(self.boxes).astype(int)
+        return "\n".join(
+            f"[{x1},{y1},{x2},{y2}] {label} {score:.2f}"
+            for (x1, y1, x2, y2), label, score in zip(boxes.tolist(), self.labels.tolist(), self.scores.tolist())
+        )
+
+    def to_list(self) -> List[Dict[str, Any]]:
+        """JSON-serializable form used in API responses and the result cache"""
+        return [
+            {"label": label, "score": round(score, 4), "box": [round(v, 1) for v in box]}
+            for box, label, score in zip(self.boxes.tolist(), self.labels.tolist(), self.scores.tolist())
+        ]
+
+    @classmethod
+    def from_list(cls, items: List[Dict[str, Any]]) -> "Detections":
+        """Rebuild detections from to_list() output"""
+        return cls(
+            np.array([item["box"] for item in items], dtype=np.float32).reshape(-1, 4),
+            np.array([item["label"] for item in items], dtype=str),
+            np.array([item["score"] for item in items], dtype=np.float32)
+        )
@@ -0,0 +1,122 @@
+import os
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict, Optional
+
+from profiling import current_profile
+
+logger = logging.getLogger(__name__)
+
+# Threads available for CPU-bound work (model inference, image decoding)
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Maximum number of LLM requests in flight per worker process
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "16"))
+
+
+class ExecutionLimits:
+    """
+    Keeps blocking work off the asyncio event loop.
+
+    CPU-bound callables run on a bounded thread pool and LLM calls are
+    gated by a semaphore. Both track how many tasks are waiting and
+    running so queue depth can be reported.
+    """
+
+    def __init__(self, inference_workers: int = INFERENCE_WORKERS, llm_concurrency: int = LLM_CONCURRENCY):
+        self.inference_workers = max(1, inference_workers)
+        self.llm_concurrency = max(1, llm_concurrency)
+        self._pool = ThreadPoolExecutor(
+            max_workers=self.inference_workers,
+            thread_name_prefix="inference"
+        )
+        self._llm_semaphore: Optional[asyncio.Semaphore] = None
+        self._counter_lock = threading.Lock()
+
+        self.inference_queued = 0
+        self.inference_active = 0
+        self.inference_completed = 0
+        self.llm_waiting = 0
+        self.llm_active = 0
+        self.llm_completed = 0
+
+    async def run_inference(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """
+        Run a blocking callable on the inference thread pool
+
+        Args:
+            fn: Callable to execute
+            *args: Positional arguments for the callable
+
+        Returns:
+            Whatever the callable returns
+        """
+        loop = asyncio.get_running_loop()
+        with self._counter_lock:
+            self.inference_queued += 1
+
+        # Work done on behalf of a sampled request is profiled in the worker thread
+        profile = current_profile()
+        if profile is not None:
+            fn = profile.wrap(fn)
+
+        def _tracked():
+            with self._counter_lock:
+                self.inference_queued -= 1
+                self.inference_active += 1
+            try:
+                return fn(*args)
+            finally:
+                with self._counter_lock:
+                    self.inference_active -= 1
+                    self.inference_completed += 1
+
+        return await loop.run_in_executor(self._pool, _tracked)
+
+    @asynccontextmanager
+    async def llm_slot(self):
+        """Wait for one of the LLM_CONCURRENCY slots before calling the LLM"""
+        # Created lazily so the semaphore binds to the server's event loop
+        if self._llm_semaphore is None:
+            self._llm_semaphore = asyncio.Semaphore(self.llm_concurrency)
+
+        self.llm_waiting += 1
+        try:
+            await self._llm_semaphore.acquire()
+        finally:
+            self.llm_waiting -= 1
+
+        self.llm_active += 1
+        try:
+            yield
+        finally:
+            self.llm_active -= 1
+            self.llm_completed += 1
+            self._llm_semaphore.release()
+
+    def stats(self) -> Dict[str, Any]:
+        """Current queue depth and throughput counters"""
+        return {
+            "inference": {
+                "workers": self.inference_workers,
+                "queued": self.inference_queued,
+                "active": self.inference_active,
+                "completed": self.inference_completed,
+            },
+            "llm": {
+                "concurrency": self.llm_concurrency,
+                "waiting": self.llm_waiting,
+                "active": self.llm_active,
+                "completed": self.llm_completed,
+            },
+        }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+# Singleton instance shared by the whole backend
+limits = ExecutionLimits()
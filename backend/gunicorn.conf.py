@@ -0,0 +1,91 @@
+"""
+Gunicorn settings for running several API workers on one machine:
+
+    gunicorn main:app
+
+(gunicorn picks this file up from the working directory.)
+
+The app is imported and the vision models of every enabled tier are loaded
+once in the master process, which then forks the workers. The weights stay
+in pages shared copy-on-write between all workers, since inference never
+writes to them, so N workers cost roughly one set of weights plus N times
+the per-request memory instead of N full copies. Each worker then runs its
+own dummy forward passes at startup (see /ready).
+
+Cores are split between the workers: WEB_CONCURRENCY is passed on to
+inference_backends.STAGE_THREADS, which sizes each worker's torch thread
+pools so the workers together use every core once instead of each one
+trying to use all of them.
+
+Prometheus metrics are kept in PROMETHEUS_MULTIPROC_DIR (a fresh temporary
+directory unless set), so /metrics reports the sum over all workers no
+matter which one answers the scrape.
+"""
+import gc
+import os
+import sys
+import glob
+import logging
+import tempfile
+
+logger = logging.getLogger("gunicorn.error")
+
+# Worker processes; also read by inference_backends to split the cores between them
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+os.environ["WEB_CONCURRENCY"] = str(workers)
+
+# Shared metric files; must be set before prometheus_client is imported with the app.
+# Files left by an earlier run would be counted again, so they are removed first
+if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+    for path in glob.glob(os.path.join(os.environ["PROMETHEUS_MULTIPROC_DIR"], "*.db")):
+        os.remove(path)
+else:
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="plantid-metrics-")
+
+# Load the vision models in the master before forking; false leaves each worker to load its own copy
+SHARE_MODELS = os.getenv("SHARE_MODELS", "true").lower() == "true"
+
+worker_class = "uvicorn.workers.UvicornWorker"
+bind = os.getenv("BIND", "0.0.0.0:8000")
+preload_app = True
+
+# Loading the models in the master can take a while; workers are only
+# forked afterwards, so this only covers requests and worker startup
+timeout = int(os.getenv("WORKER_TIMEOUT", "120"))
+
+
+def when_ready(server):
+    """Runs in the master after the app is imported, before any worker is forked"""
+    if not SHARE_MODELS:
+        return
+
+    from model_catalogue import VISION_BACKEND
+    if VISION_BACKEND == "onnx":
+        # ONNX Runtime sessions start their thread pools on creation and do not survive a fork
+        logger.warning("SHARE_MODELS is not supported with VISION_BACKEND=onnx; each worker loads its own models")
+        return
+
+    import torch
+    from model_registry import registry
+
+    # A single thread keeps the OpenMP pool from being started before the fork,
+    # which would leave the workers' thread pools unusable
+    torch.set_num_threads(1)
+    stats = registry.load_enabled()
+    logger.info(f"Loaded vision models in the master for {workers} workers: {stats}")
+
+    # Keep the cyclic GC from touching (and so copying) every object inherited by the workers
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    """Give each worker its share of the cores"""
+    if "torch" in sys.modules:
+        from inference_backends import configure_threads
+        configure_threads()
+
+
+def child_exit(server, worker):
+    """Drop a dead worker's live gauges from /metrics"""
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,157 @@
+import io
+import os
+import warnings
+from typing import Tuple, Union
+
+import numpy as np
+from PIL import Image, ImageOps
+
+# DETR resizes to an 800px shortest edge with the longest edge capped at 1333px
+# (BLIP needs only 384px), so nothing above that size ever reaches the models
+INGEST_MIN_EDGE = int(os.getenv("INGEST_MIN_EDGE", "800"))
+INGEST_MAX_EDGE = int(os.getenv("INGEST_MAX_EDGE", "1333"))
+
+# Uploads above these limits are rejected before any pixels are decoded
+INGEST_MAX_BYTES = int(os.getenv("INGEST_MAX_BYTES", str(20 * 1024 * 1024)))
+INGEST_MAX_PIXELS = int(os.getenv("INGEST_MAX_PIXELS", str(64 * 1000 * 1000)))
+
+# Longest edge of the thumbnails served next to uploads
+THUMBNAIL_EDGE = int(os.getenv("THUMBNAIL_EDGE", "512"))
+
+# Make Pillow itself refuse anything beyond our pixel budget
+Image.MAX_IMAGE_PIXELS = INGEST_MAX_PIXELS
+
+_EXIF_ORIENTATION = 0x0112
+
+
+class ImageRejected(ValueError):
+    """Raised when an upload violates the ingest policy"""
+
+
+class IngestedImage:
+    """
+    An upload decoded once and shared by every pipeline stage.
+
+    ``image`` is the RGB PIL image and ``array`` an HxWx3 uint8 copy of the
+    same pixels, built once, that the BLIP and DETR preprocessors consume.
+    ``original_size`` is the (width, height) of the file before any
+    decode-time downscaling, so detections can be reported in the
+    coordinates of the uploaded photo.
+    """
+
+    __slots__ = ("image", "array", "original_size")
+
+    def __init__(self, image: Image.Image, original_size: Tuple[int, int]):
+        self.image = image
+        self.array = np.asarray(image)
+        self.original_size = original_size
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        """(width, height) of the decoded pixels"""
+        return self.image.size
+
+
+def check_upload_size(size: int):
+    """
+    Enforce the upload byte limit
+
+    Raises:
+        ImageRejected if the upload is larger than INGEST_MAX_BYTES
+    """
+    if size > INGEST_MAX_BYTES:
+        raise ImageRejected(
+            f"Image is {size / (1024 * 1024):.1f} MB; the limit is {INGEST_MAX_BYTES / (1024 * 1024):.1f} MB"
+        )
+
+
+def _model_scale(width: int, height: int) -> float:
+    """Scale factor that brings an image down to the models' input resolution"""
+    return min(1.0, INGEST_MIN_EDGE / min(width, height), INGEST_MAX_EDGE / max(width, height))
+
+
+def _open(source: Union[str, bytes, memoryview]) -> Image.Image:
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        check_upload_size(len(source))
+        source = io.BytesIO(source)
+    else:
+        check_upload_size(os.path.getsize(source))
+
+    # Only the header has been read at this point, so bombs are caught before decoding
+    try:
+        with warnings.catch_warnings():
+            # Between one and two times the limit Pillow only warns; the check below covers that
+            warnings.simplefilter("ignore", Image.DecompressionBombWarning)
+            image = Image.open(source)
+    except Image.DecompressionBombError:
+        # Pillow refuses images over twice MAX_IMAGE_PIXELS before our own check gets to see them
+        raise ImageRejected(f"Image is over the limit of {INGEST_MAX_PIXELS} pixels")
+    width, height = image.size
+    if width * height > INGEST_MAX_PIXELS:
+        raise ImageRejected(
+            f"Image is {width}x{height} pixels; the limit is {INGEST_MAX_PIXELS} pixels"
+        )
+    return image
+
+
+def decode_image(source: Union[str, bytes, memoryview]) -> IngestedImage:
+    """
+    Decode an image file or in-memory bytes for the vision models.
+
+    The upload is checked against the byte and pixel limits from its header
+    alone. Large JPEGs are then decoded at a reduced DCT scale with
+    ``Image.draft``, any remaining excess is resampled down to the model
+    input resolution (INGEST_MIN_EDGE / INGEST_MAX_EDGE), and EXIF
+    orientation is applied so phone photos are upright.
+
+    Args:
+        source: Path to the image file, or its raw bytes (e.g. a spooled request body)
+
+    Returns:
+        The decoded image
+
+    Raises:
+        ImageRejected if the upload violates the ingest policy
+        PIL.UnidentifiedImageError / OSError if the data is not a valid image
+    """
+    image = _open(source)
+    original_size = image.size
+
+    width, height = original_size
+    scale = _model_scale(width, height)
+    if scale < 1:
+        # Only JPEG supports draft; other formats ignore it and decode in full
+        image.draft("RGB", (max(1, int(width * scale)), max(1, int(height * scale))))
+
+    # Orientations 5-8 swap width and height once applied
+    if image.getexif().get(_EXIF_ORIENTATION, 1) in (5, 6, 7, 8):
+        original_size = (height, width)
+    image = ImageOps.exif_transpose(image).convert("RGB")
+
+    # draft only reduces by powers of two, so finish the job with a resample
+    scale = _model_scale(*image.size)
+    if scale < 1:
+        target = (max(1, round(image.size[0] * scale)), max(1, round(image.size[1] * scale)))
+        image = image.resize(target, Image.BILINEAR, reducing_gap=2.0)
+
+    return IngestedImage(image, original_size)
+
+
+def make_thumbnail(source: Union[str, bytes, memoryview]) -> bytes:
+    """
+    Build a JPEG thumbnail no larger than THUMBNAIL_EDGE on either side
+
+    Args:
+        source: Path to the image file, or its raw bytes
+
+    Returns:
+        Encoded JPEG bytes
+    """
+    image = _open(source)
+    image.draft("RGB", (THUMBNAIL_EDGE, THUMBNAIL_EDGE))
+    image = ImageOps.exif_transpose(image).convert("RGB")
+    image.thumbnail((THUMBNAIL_EDGE, THUMBNAIL_EDGE), Image.BILINEAR)
+
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=80, optimize=True)
+    return buffer.getvalue()
@@ -0,0 +1,231 @@
+import os
+import inspect
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+import torch
+from transformers.models.detr.modeling_detr import DetrObjectDetectionOutput
+
+from model_catalogue import BACKENDS
+
+logger = logging.getLogger(__name__)
+
+# Where exported ONNX graphs are kept between restarts
+ONNX_CACHE_DIR = os.getenv("ONNX_CACHE_DIR", "onnx_models")
+
+# Worker processes serving the API on this machine (gunicorn reads the same variable)
+WORKER_PROCESSES = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+
+# Captioning and detection run side by side, so each stage gets half of this
+# worker's share of the cores for its intra-op parallelism instead of every
+# stage of every worker fighting over all of them
+STAGE_THREADS = int(os.getenv(
+    "VISION_STAGE_THREADS",
+    str(max(1, (os.cpu_count() or 1) // (2 * WORKER_PROCESSES)))
+))
+
+_threads_pid: Optional[int] = None
+
+
+def configure_threads():
+    """
+    Size this process's torch intra-op thread pool to STAGE_THREADS
+
+    The setting is process-wide, so it is applied once per process (again
+    in a forked child) rather than by every stage call.
+    """
+    global _threads_pid
+    if _threads_pid != os.getpid():
+        torch.set_num_threads(STAGE_THREADS)
+        _threads_pid = os.getpid()
+
+
+def quantize_int8(model: torch.nn.Module) -> torch.nn.Module:
+    """Quantize the weights of every Linear layer to INT8, activations stay dynamic"""
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+class _VisionEncoderGraph(torch.nn.Module):
+    """BLIP vision encoder reduced to a single tensor output for export"""
+
+    def __init__(self, vision_model: torch.nn.Module):
+        super().__init__()
+        self.vision_model = vision_model
+
+    def forward(self, pixel_values):
+        return self.vision_model(pixel_values=pixel_values)[0]
+
+
+class _DetectorGraph(torch.nn.Module):
+    """Object detector reduced to its (logits, boxes) outputs for export"""
+
+    def __init__(self, model: torch.nn.Module):
+        super().__init__()
+        self.model = model
+
+    def forward(self, pixel_values, pixel_mask=None):
+        if pixel_mask is None:
+            outputs = self.model(pixel_values=pixel_values)
+        else:
+            outputs = self.model(pixel_values=pixel_values, pixel_mask=pixel_mask)
+        return outputs.logits, outputs.pred_boxes
+
+
+class OnnxVisionEncoder(torch.nn.Module):
+    """
+    Drop-in replacement for ``BlipForConditionalGeneration.vision_model``
+    backed by an ONNX Runtime session. ``generate`` only reads the first
+    output (the image embeddings), so the text decoder keeps running in
+    PyTorch unchanged.
+    """
+
+    def __init__(self, session: Any, path: str):
+        super().__init__()
+        self.session = session
+        self.path = path
+
+    def forward(self, pixel_values, **kwargs):
+        (embeds,) = self.session.run(None, {"pixel_values": pixel_values.cpu().numpy()})
+        return (torch.from_numpy(embeds),)
+
+
+class OnnxDetector(torch.nn.Module):
+    """
+    Drop-in replacement for a DETR-style detector (DETR, YOLOS, ...) backed
+    by an ONNX Runtime session, returning the outputs the post-processor reads.
+    """
+
+    def __init__(self, session: Any, path: str, model: torch.nn.Module):
+        super().__init__()
+        self.session = session
+        self.path = path
+        self.config = model.config
+        self.name_or_path = model.name_or_path
+        self.uses_mask = any(graph_input.name == "pixel_mask" for graph_input in session.get_inputs())
+
+    def forward(self, pixel_values, pixel_mask=None, **kwargs):
+        feeds = {"pixel_values": pixel_values.cpu().numpy()}
+        if self.uses_mask:
+            if pixel_mask is None:
+                batch, _, height, width = pixel_values.shape
+                pixel_mask = torch.ones((batch, height, width), dtype=torch.long)
+            feeds["pixel_mask"] = pixel_mask.cpu().numpy().astype("int64")
+        logits, boxes = self.session.run(None, feeds)
+        # Any output class with logits and pred_boxes satisfies the post-processors
+        return DetrObjectDetectionOutput(logits=torch.from_numpy(logits), pred_boxes=torch.from_numpy(boxes))
+
+
+def _onnx_session(
+    model_name: str,
+    part: str,
+    graph: torch.nn.Module,
+    inputs: Dict[str, torch.Tensor],
+    output_names: List[str],
+    dynamic_axes: Dict[str, Dict[int, str]]
+) -> Tuple[Any, str]:
+    """Export a graph once per model (cached in ONNX_CACHE_DIR) and open it with ONNX Runtime; returns (session, path)"""
+    try:
+        import onnxruntime as ort
+    except ImportError as e:
+        raise ImportError("VISION_BACKEND=onnx requires onnxruntime (pip install onnxruntime)") from e
+
+    path = os.path.join(ONNX_CACHE_DIR, f"{model_name.replace('/', '--')}-{part}.onnx")
+    if not os.path.exists(path):
+        os.makedirs(ONNX_CACHE_DIR, exist_ok=True)
+        logger.info(f"Exporting {model_name} {part} to {path}")
+        with torch.no_grad():
+            torch.onnx.export(
+                graph,
+                tuple(inputs.values()),
+                path,
+                input_names=list(inputs),
+                output_names=output_names,
+                dynamic_axes=dynamic_axes,
+                opset_version=17
+            )
+
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = STAGE_THREADS
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return ort.InferenceSession(path, options, providers=["CPUExecutionProvider"]), path
+
+
+def to_onnx(key: str, model: torch.nn.Module) -> torch.nn.Module:
+    """Move the expensive part of a vision model onto ONNX Runtime"""
+    if key == "caption":
+        size = model.config.vision_config.image_size
+        model.vision_model = OnnxVisionEncoder(*_onnx_session(
+            model.name_or_path,
+            "vision-encoder",
+            _VisionEncoderGraph(model.vision_model),
+            {"pixel_values": torch.zeros(1, 3, size, size)},
+            ["image_embeds"],
+            {"pixel_values": {0: "batch"}, "image_embeds": {0: "batch"}}
+        ))
+        return model
+    if key == "detection":
+        inputs = {"pixel_values": torch.zeros(1, 3, 800, 800)}
+        dynamic_axes = {
+            "pixel_values": {0: "batch", 2: "height", 3: "width"},
+            "logits": {0: "batch"},
+            "pred_boxes": {0: "batch"},
+        }
+        # DETR takes a padding mask for batched images of different sizes; YOLOS does not
+        if "pixel_mask" in inspect.signature(model.forward).parameters:
+            inputs["pixel_mask"] = torch.ones(1, 800, 800, dtype=torch.long)
+            dynamic_axes["pixel_mask"] = {0: "batch", 1: "height", 2: "width"}
+        session, path = _onnx_session(
+            model.name_or_path,
+            "detector",
+            _DetectorGraph(model),
+            inputs,
+            ["logits", "pred_boxes"],
+            dynamic_axes
+        )
+        return OnnxDetector(session, path, model)
+    raise KeyError(f"Unknown model key: {key}")
+
+
+def _tensor_bytes(value: Any) -> int:
+    if isinstance(value, torch.Tensor):
+        return value.numel() * value.element_size()
+    if isinstance(value, (tuple, list)):
+        # Dynamically quantized Linear layers keep (INT8 weight, bias) as packed params
+        return sum(_tensor_bytes(item) for item in value)
+    return 0
+
+
+def model_bytes(model: torch.nn.Module) -> int:
+    """
+    Memory taken by a model's weights as the backend holds them
+
+    Counts every tensor in the state dict, which unlike ``parameters()``
+    includes the packed INT8 weights of quantized layers, plus the file
+    size of each graph handed to ONNX Runtime.
+    """
+    total = sum(_tensor_bytes(value) for value in model.state_dict().values())
+    for module in model.modules():
+        if isinstance(module, (OnnxVisionEncoder, OnnxDetector)):
+            total += os.path.getsize(module.path)
+    return total
+
+
+def apply_backend(key: str, model: torch.nn.Module, backend: str) -> torch.nn.Module:
+    """
+    Convert a freshly loaded FP32 model for the selected inference backend
+
+    Args:
+        key: Model key in the registry ("caption" or "detection")
+        model: Model in eval mode
+        backend: One of BACKENDS
+
+    Returns:
+        The model to run inference with
+    """
+    if backend == "torch":
+        return model
+    if backend == "int8":
+        return quantize_int8(model)
+    if backend == "onnx":
+        return to_onnx(key, model)
+    raise ValueError(f"Unknown VISION_BACKEND: {backend}")
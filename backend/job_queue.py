@@ -0,0 +1,349 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import asyncio
+import logging
+import threading
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# SQLite file holding queued work; shared by every worker process on the host
+JOB_DB = os.getenv("JOB_DB", "jobs.db")
+
+# Queued plus running jobs allowed before submissions are refused
+JOB_QUEUE_MAX = int(os.getenv("JOB_QUEUE_MAX", "100"))
+
+# Jobs executed concurrently by each worker process
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+
+# Finished jobs are kept this long for polling
+JOB_RETENTION = float(os.getenv("JOB_RETENTION", str(60 * 60)))
+
+# Workers refresh the heartbeat of the jobs they run; a job still marked running
+# with no heartbeat for this long belonged to a worker that died and is requeued
+JOB_STALE_AFTER = float(os.getenv("JOB_STALE_AFTER", "120"))
+
+# How often idle workers look for jobs submitted by other processes
+_POLL_SECONDS = 1.0
+
+JobHandler = Callable[[Dict[str, Any], Optional[bytes]], Awaitable[Dict[str, Any]]]
+JobListener = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+class QueueFull(Exception):
+    """Raised when a job is submitted while the queue is at capacity"""
+
+    def __init__(self, depth: int, retry_after: int):
+        super().__init__(f"Job queue is full ({depth} jobs pending); retry in {retry_after}s")
+        self.depth = depth
+        self.retry_after = retry_after
+
+
+class JobQueue:
+    """
+    Bounded, persistent queue of diagnosis jobs with a local worker pool.
+
+    Jobs and their input image live in a SQLite table, so queued work
+    survives a restart and several worker processes can share one queue.
+    Each process runs ``workers`` asyncio tasks that claim the oldest
+    queued job, run it through the registered handler and store its
+    result. Listeners are told about every status change, which is how
+    results get pushed to WebSocket subscribers.
+    """
+
+    def __init__(
+        self,
+        db_path: str = JOB_DB,
+        max_pending: int = JOB_QUEUE_MAX,
+        workers: int = JOB_WORKERS,
+        retention: float = JOB_RETENTION,
+        stale_after: float = JOB_STALE_AFTER
+    ):
+        self.db_path = db_path
+        self.max_pending = max_pending
+        self.workers = workers
+        self.retention = retention
+        self.stale_after = stale_after
+
+        self._handler: Optional[JobHandler] = None
+        self._listeners: List[JobListener] = []
+        self._tasks: List[asyncio.Task] = []
+        self._wake: Optional[asyncio.Event] = None
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._last_requeue = 0.0
+
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self._recent_seconds: List[float] = []
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            # Autocommit mode; claims and submissions open their own BEGIN IMMEDIATE transactions
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, session_id TEXT, status TEXT NOT NULL, "
+                "payload TEXT NOT NULL, image BLOB, result TEXT, error TEXT, "
+                "created REAL NOT NULL, started REAL, finished REAL, heartbeat REAL)"
+            )
+            columns = {row[1] for row in self._db.execute("PRAGMA table_info(jobs)")}
+            if "heartbeat" not in columns:
+                # Queue files created before heartbeats were recorded
+                self._db.execute("ALTER TABLE jobs ADD COLUMN heartbeat REAL")
+            self._db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created)")
+            self._db.commit()
+        return self._db
+
+    def start(self, handler: JobHandler):
+        """Start this process's workers; call from the running event loop"""
+        self._handler = handler
+        self._wake = asyncio.Event()
+        self._requeue_stale()
+        self._tasks = [asyncio.create_task(self._work(i)) for i in range(self.workers)]
+        logger.info(f"Started {self.workers} job workers on {self.db_path}")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def add_listener(self, listener: JobListener):
+        """Register a coroutine called with the public view of a job on every status change"""
+        self._listeners.append(listener)
+
+    async def submit(self, payload: Dict[str, Any], image: Optional[bytes] = None, session_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Queue a job
+
+        Args:
+            payload: JSON-serializable job arguments passed to the handler
+            image: Optional image bytes stored with the job
+            session_id: Session whose WebSocket is notified of progress
+
+        Returns:
+            The public view of the queued job, including its queue position
+
+        Raises:
+            QueueFull when max_pending jobs are already queued or running
+        """
+        job = await asyncio.to_thread(self._insert, payload, image, session_id)
+        if self._wake is not None:
+            self._wake.set()
+        await self._notify(job)
+        return job
+
+    def _insert(self, payload: Dict[str, Any], image: Optional[bytes], session_id: Optional[str]) -> Dict[str, Any]:
+        job_id = str(uuid.uuid4())
+        now = time.time()
+        with self._lock:
+            db = self._connect()
+            # BEGIN IMMEDIATE makes the capacity check and insert atomic across processes
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                depth = db.execute("SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')").fetchone()[0]
+                if depth >= self.max_pending:
+                    db.rollback()
+                    self.rejected += 1
+                    raise QueueFull(depth, self._retry_after(depth))
+                db.execute(
+                    "INSERT INTO jobs (id, session_id, status, payload, image, created) VALUES (?, ?, 'queued', ?, ?, ?)",
+                    (job_id, session_id, json.dumps(payload), image, now)
+                )
+                db.commit()
+            except QueueFull:
+                raise
+            except Exception:
+                db.rollback()
+                raise
+        return {"job_id": job_id, "session_id": session_id, "status": "queued", "position": depth + 1}
+
+    def _retry_after(self, depth: int) -> int:
+        # Rough time for the backlog to drain given recent job durations
+        recent = self._recent_seconds[-50:]
+        average = sum(recent) / len(recent) if recent else 10.0
+        return max(1, int(average * depth / max(1, self.workers)))
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Return the public view of a job, or None if it is unknown or expired"""
+        return await asyncio.to_thread(self._get, job_id)
+
+    def _get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT id, session_id, status, result, error, created, started, finished FROM jobs WHERE id = ?",
+                (job_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            job = self._view(row)
+            if job["status"] == "queued":
+                job["position"] = self._connect().execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND created <= ?", (row[5],)
+                ).fetchone()[0]
+            return job
+
+    @staticmethod
+    def _view(row) -> Dict[str, Any]:
+        job_id, session_id, status, result, error, created, started, finished = row
+        job = {"job_id": job_id, "session_id": session_id, "status": status}
+        if result is not None:
+            job["result"] = json.loads(result)
+        if error is not None:
+            job["error"] = error
+        if started is not None:
+            job["queued_ms"] = round((started - created) * 1000, 1)
+        if finished is not None and started is not None:
+            job["run_ms"] = round((finished - started) * 1000, 1)
+        return job
+
+    def _claim(self) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            db = self._connect()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                row = db.execute(
+                    "SELECT id, session_id, payload, image FROM jobs WHERE status = 'queued' ORDER BY created LIMIT 1"
+                ).fetchone()
+                if row is not None:
+                    db.execute("UPDATE jobs SET status = 'running', started = ?, heartbeat = ? WHERE id = ?", (now, now, row[0]))
+                db.execute(
+                    "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished < ?",
+                    (now - self.retention,)
+                )
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+        if row is None:
+            return None
+        return {"job_id": row[0], "session_id": row[1], "payload": json.loads(row[2]), "image": row[3]}
+
+    def _touch(self, job_id: str):
+        with self._lock:
+            db = self._connect()
+            db.execute("UPDATE jobs SET heartbeat = ? WHERE id = ? AND status = 'running'", (time.time(), job_id))
+            db.commit()
+
+    async def _heartbeat(self, job_id: str):
+        """Mark a job as still being worked on until cancelled"""
+        while True:
+            await asyncio.sleep(self.stale_after / 4)
+            try:
+                await asyncio.to_thread(self._touch, job_id)
+            except Exception as e:
+                logger.warning(f"Could not refresh the heartbeat of job {job_id}: {str(e)}")
+
+    def _requeue_stale(self):
+        """Put jobs left running by a worker that died (or could not record the outcome) back in the queue"""
+        with self._lock:
+            db = self._connect()
+            # A job that runs for long is not stale as long as its worker keeps the heartbeat fresh
+            requeued = db.execute(
+                "UPDATE jobs SET status = 'queued', started = NULL, heartbeat = NULL "
+                "WHERE status = 'running' AND COALESCE(heartbeat, started) < ?",
+                (time.time() - self.stale_after,)
+            ).rowcount
+            db.commit()
+            self._last_requeue = time.time()
+        if requeued:
+            logger.info(f"Requeued {requeued} stale jobs")
+
+    def _finish(self, job_id: str, result: Optional[Dict[str, Any]], error: Optional[str]):
+        with self._lock:
+            db = self._connect()
+            db.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, image = NULL, finished = ? WHERE id = ?",
+                ("failed" if error else "done", json.dumps(result) if result is not None else None, error, time.time(), job_id)
+            )
+            db.commit()
+
+    async def _work(self, worker: int):
+        while True:
+            try:
+                job = await asyncio.to_thread(self._claim)
+            except Exception as e:
+                logger.error(f"Job worker {worker} could not claim a job: {str(e)}")
+                job = None
+
+            if job is None:
+                # Idle workers also recover jobs that went stale while this process was running
+                if time.time() - self._last_requeue > self.stale_after / 2:
+                    try:
+                        await asyncio.to_thread(self._requeue_stale)
+                    except Exception as e:
+                        logger.error(f"Job worker {worker} could not requeue stale jobs: {str(e)}")
+                        self._last_requeue = time.time()
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), _POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self._notify({"job_id": job["job_id"], "session_id": job["session_id"], "status": "running"})
+            start = time.perf_counter()
+            result, error = None, None
+            heartbeat = asyncio.create_task(self._heartbeat(job["job_id"]))
+            try:
+                result = await self._handler(
+                    {**job["payload"], "job_id": job["job_id"], "session_id": job["session_id"]},
+                    job["image"]
+                )
+            except Exception as e:
+                logger.error(f"Job {job['job_id']} failed: {str(e)}")
+                error = str(e)
+            finally:
+                heartbeat.cancel()
+
+            self._recent_seconds = (self._recent_seconds + [time.perf_counter() - start])[-50:]
+            if error:
+                self.failed += 1
+            else:
+                self.completed += 1
+            try:
+                await asyncio.to_thread(self._finish, job["job_id"], result, error)
+                await self._notify(await self.get(job["job_id"]))
+            except Exception as e:
+                # Keep the worker alive; a job whose outcome was not recorded is requeued once stale
+                logger.error(f"Job worker {worker} could not record job {job['job_id']}: {str(e)}")
+
+    async def _notify(self, job: Optional[Dict[str, Any]]):
+        if job is None:
+            return
+        for listener in self._listeners:
+            try:
+                await listener(job)
+            except Exception as e:
+                logger.warning(f"Job listener failed: {str(e)}")
+
+    async def stats(self) -> Dict[str, Any]:
+        """Queue depth, capacity and outcome counters"""
+        return await asyncio.to_thread(self._stats)
+
+    def _stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = dict(self._connect().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        recent = self._recent_seconds
+        return {
+            "queued": counts.get("queued", 0),
+            "running": counts.get("running", 0),
+            "retained_finished": counts.get("done", 0) + counts.get("failed", 0),
+            "max_pending": self.max_pending,
+            "workers": self.workers,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "recent_avg_run_ms": round(sum(recent) / len(recent) * 1000, 1) if recent else 0,
+        }
+
+
+# Singleton instance shared by the API and this process's workers
+job_queue = JobQueue()
@@ -0,0 +1,119 @@
+import os
+import json
+import hashlib
+import logging
+from typing import Any, Dict, Optional
+
+from langchain_core.caches import BaseCache, RETURN_VAL_TYPE
+from langchain_core.load import dumps, loads
+
+from result_cache import ResultCache
+
+logger = logging.getLogger(__name__)
+
+# Set to false to send every prompt to the provider
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE", "true").lower() == "true"
+
+# In-memory tier size and entry lifetime
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "512"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(6 * 60 * 60)))
+
+# Optional on-disk tier; leave LLM_CACHE_DB unset to keep responses in memory only
+LLM_CACHE_DB = os.getenv("LLM_CACHE_DB")
+LLM_CACHE_DISK_ENTRIES = int(os.getenv("LLM_CACHE_DISK_ENTRIES", "20000"))
+
+# Part of every key; bump it whenever prompt normalization changes
+_KEY_VERSION = 1
+
+
+def _normalize(value: Any) -> Any:
+    # Collapse whitespace in every string so re-indented or re-wrapped prompts match
+    if isinstance(value, str):
+        return " ".join(value.split())
+    if isinstance(value, list):
+        return [_normalize(item) for item in value]
+    if isinstance(value, dict):
+        return {key: _normalize(item) for key, item in value.items()}
+    return value
+
+
+def normalize_prompt(prompt: str) -> str:
+    """
+    Canonical form of a prompt as LangChain hands it to the cache
+
+    Chat prompts arrive as serialized message lists; they are parsed so
+    whitespace inside message text and key order do not change the key.
+    Anything else is treated as plain text.
+    """
+    try:
+        parsed = json.loads(prompt)
+    except ValueError:
+        return " ".join(prompt.split())
+    return json.dumps(_normalize(parsed), sort_keys=True, separators=(",", ":"))
+
+
+def llm_cache_key(prompt: str, llm_string: str) -> str:
+    """
+    Cache key for one prompt sent to one model configuration
+
+    Args:
+        prompt: Serialized prompt passed by LangChain
+        llm_string: LangChain's description of the model and its parameters
+            (model name, temperature, max_tokens, stop sequences, ...)
+
+    Returns:
+        Key combining hashes of the normalized prompt and the model parameters
+    """
+    prompt_hash = hashlib.sha256(normalize_prompt(prompt).encode()).hexdigest()
+    llm_hash = hashlib.sha256(llm_string.encode()).hexdigest()[:16]
+    return f"llm:v{_KEY_VERSION}:{llm_hash}:{prompt_hash}"
+
+
+class LLMResponseCache(BaseCache):
+    """
+    LangChain cache storing chat model responses in a ResultCache.
+
+    Attached to a model with ``ChatOpenAI(cache=...)``, it is consulted by
+    ``invoke``/``ainvoke`` before any request is sent, so a prompt that
+    was already answered with the same model settings skips the network.
+    Only successful responses are stored. LangChain also consults it for
+    streamed calls, and a hit then emits no tokens, so it is only attached
+    to the non-streaming diagnosis model.
+    """
+
+    def __init__(self, store: Optional[ResultCache] = None):
+        self.store = store or ResultCache(
+            max_entries=LLM_CACHE_SIZE,
+            ttl=LLM_CACHE_TTL,
+            db_path=LLM_CACHE_DB,
+            max_disk_entries=LLM_CACHE_DISK_ENTRIES
+        )
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        cached = self.store.get(llm_cache_key(prompt, llm_string))
+        if cached is None:
+            return None
+        try:
+            generations = [loads(generation) for generation in cached]
+        except Exception as e:
+            logger.warning(f"Discarding unreadable cached LLM response: {str(e)}")
+            return None
+        for generation in generations:
+            # A cached answer costs no tokens, so it must not count towards token usage
+            if getattr(generation, "message", None) is not None:
+                generation.message.usage_metadata = None
+        return generations
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        self.store.set(llm_cache_key(prompt, llm_string), [dumps(generation) for generation in return_val])
+
+    def clear(self, **kwargs: Any) -> None:
+        self.store.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and tier sizes"""
+        return self.store.stats()
+
+
+# Singleton instance shared by every diagnosis model; None when LLM_CACHE=false
+llm_cache: Optional[LLMResponseCache] = LLMResponseCache() if LLM_CACHE_ENABLED else None
@@ -0,0 +1,121 @@
+import os
+import logging
+import threading
+from typing import Any, Optional
+
+import httpx
+from dotenv import load_dotenv
+from langchain_openai import ChatOpenAI
+
+from metrics import TokenUsageHandler
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Connections kept open to the OpenAI API, shared by every chat model in the process
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "20"))
+LLM_KEEPALIVE_SECONDS = float(os.getenv("LLM_KEEPALIVE_SECONDS", "30"))
+
+# Seconds to establish a connection, and to wait on any single read or write
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+
+# Retries with exponential backoff on connection errors, 408, 409, 429 and 5xx
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+
+
+def _timeout() -> httpx.Timeout:
+    return httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT)
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=LLM_POOL_SIZE,
+        max_keepalive_connections=LLM_POOL_SIZE,
+        keepalive_expiry=LLM_KEEPALIVE_SECONDS
+    )
+
+
+class LLMClient:
+    """
+    Process-wide HTTP connection pools for the OpenAI API.
+
+    Every ChatOpenAI built by chat_model() sends its requests through the
+    same keep-alive pools (one for sync and one for async calls), so TLS
+    handshakes happen once per connection rather than once per request.
+    The pools are created on first use.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sync: Optional[httpx.Client] = None
+        self._async: Optional[httpx.AsyncClient] = None
+
+    def api_key(self) -> str:
+        """
+        The OpenAI API key
+
+        Raises:
+            ValueError if OPENAI_API_KEY is not set
+        """
+        api_key = os.getenv("OPENAI_API_KEY")
+        if api_key is None:
+            raise ValueError("API Key not set. Please set the OPENAI_API_KEY environment variable.")
+        return api_key
+
+    def http_client(self) -> httpx.Client:
+        with self._lock:
+            if self._sync is None:
+                self._sync = httpx.Client(limits=_limits(), timeout=_timeout())
+            return self._sync
+
+    def async_http_client(self) -> httpx.AsyncClient:
+        with self._lock:
+            if self._async is None:
+                self._async = httpx.AsyncClient(limits=_limits(), timeout=_timeout())
+                logger.info(f"LLM connection pool created ({LLM_POOL_SIZE} connections)")
+            return self._async
+
+    def chat_model(self, model: str, temperature: float, **kwargs: Any) -> ChatOpenAI:
+        """
+        Build a chat model that uses the shared connection pools
+
+        Args:
+            model: OpenAI model name
+            temperature: Sampling temperature
+            **kwargs: Any other ChatOpenAI arguments (max_tokens, streaming, cache, callbacks, ...)
+
+        Returns:
+            The chat model; constructing it does not open any connection
+
+        Raises:
+            ValueError if OPENAI_API_KEY is not set
+        """
+        callbacks = [TokenUsageHandler(model), *(kwargs.pop("callbacks", None) or [])]
+        return ChatOpenAI(
+            model=model,
+            temperature=temperature,
+            api_key=self.api_key(),
+            timeout=_timeout(),
+            max_retries=LLM_MAX_RETRIES,
+            http_client=self.http_client(),
+            http_async_client=self.async_http_client(),
+            stream_usage=True,  # Streamed calls report token usage too
+            callbacks=callbacks,
+            **kwargs
+        )
+
+    async def close(self):
+        """Close the pools at shutdown"""
+        with self._lock:
+            sync_client, async_client = self._sync, self._async
+            self._sync, self._async = None, None
+        if sync_client is not None:
+            sync_client.close()
+        if async_client is not None:
+            await async_client.aclose()
+
+
+# Singleton instance shared by the diagnosis endpoint, the chat agent and batch diagnosis
+llm_client = LLMClient()
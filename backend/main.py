@@ -1,21 +1,45 @@
 import os
+import hmac
 import json
+import time
+import base64
+import asyncio
+import binascii
 import shutil
 import uuid
 import logging
-from typing import Dict, List, Optional
-from fastapi import FastAPI, File, UploadFile, WebSocket, WebSocketDisconnect, Form, HTTPException
-from fastapi.responses import JSONResponse
+from typing import Any, Dict, List, Optional
+
+import psutil
+from fastapi import FastAPI, File, UploadFile, WebSocket, WebSocketDisconnect, Form, Header, HTTPException
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
-from modelgpt import handle_image_upload, handle_chat_message
+from modelgpt import handle_image_upload, handle_chat_message, get_plant_chat, plant_chat_ready
 from model_api import process_uploaded_image  # Import for new endpoint
+from batch_diagnosis import spool_uploads, stream_batch_diagnosis
+from job_queue import QueueFull, job_queue
+from model_registry import registry
+from model_catalogue import UnknownTier, catalogue
+from batching import batching_stats
+from executor import limits
+from result_cache import result_cache
+from llm_cache import llm_cache
+from llm_client import llm_client
+from phash_index import perceptual_index
+from metrics import CONTENT_TYPE_LATEST, MetricsMiddleware, register_cache, register_gauge, render, stage, sync_multiprocess_metrics
+from session_store import SESSION_BACKEND
+from profiling import PROFILE_SAMPLE_RATE, PROFILING_ENABLED, profile_store, profiled
+from image_ingest import ImageRejected, INGEST_MAX_BYTES, check_upload_size, make_thumbnail
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Wall-clock start of this worker process, the origin of the startup times in /ready
+PROCESS_STARTED = psutil.Process(os.getpid()).create_time()
+
 # Create FastAPI app
 app = FastAPI(title="Plant Disease Diagnosis Chat")
 
@@ -27,15 +51,103 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-request latency histograms and a Server-Timing header on every HTTP response
+app.add_middleware(MetricsMiddleware)
+
 # Create uploads directories if they don't exist
 UPLOAD_DIR = "uploads"
+THUMBNAIL_DIR = os.path.join(UPLOAD_DIR, "thumbs")
 IMAGE_DIR = "image"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
+os.makedirs(THUMBNAIL_DIR, exist_ok=True)
 os.makedirs(IMAGE_DIR, exist_ok=True)
 
 # Mount only the uploads directory as static files
 app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR), name="uploads")
 
+# Process uploads straight from the request body; files are only written to
+# disk afterwards, off the event loop, for /uploads and follow-up chat turns
+ZERO_DISK_UPLOADS = os.getenv("ZERO_DISK_UPLOADS", "true").lower() == "true"
+
+# Set to false to keep only thumbnails of uploads rather than the full originals
+STORE_ORIGINALS = os.getenv("STORE_ORIGINALS", "true").lower() == "true"
+
+# /api/admin endpoints require this in the X-Admin-Token header; they are disabled while it is unset
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+# Keep references to in-flight background writes so they are not garbage collected
+_pending_writes = set()
+
+def _write_file(file_path: str, data: bytes):
+    with open(file_path, "wb") as buffer:
+        buffer.write(data)
+
+def _read_text(path: str) -> str:
+    with open(path) as f:
+        return f.read()
+
+def _copy_upload(upload: UploadFile, file_path: str):
+    with open(file_path, "wb") as buffer:
+        shutil.copyfileobj(upload.file, buffer)
+
+def thumbnail_name(file_path: str) -> str:
+    """File name of the thumbnail stored for an upload"""
+    return os.path.splitext(os.path.basename(file_path))[0] + ".jpg"
+
+def thumbnail_path(file_path: str) -> str:
+    return os.path.join(THUMBNAIL_DIR, thumbnail_name(file_path))
+
+def stored_image_path(file_path: str) -> str:
+    """The file chat follow-ups read an upload from: the original, or its thumbnail when originals are not kept"""
+    return file_path if STORE_ORIGINALS else thumbnail_path(file_path)
+
+def _write_thumbnail(file_path: str, source):
+    _write_file(thumbnail_path(file_path), make_thumbnail(source))
+
+def _store_thumbnail_only(file_path: str, source):
+    _write_thumbnail(file_path, source)
+    if not isinstance(source, bytes) and os.path.exists(file_path):
+        os.remove(file_path)
+
+async def persist_upload(file_path: str, source):
+    """
+    Store an upload under /uploads
+    
+    The file the session's chat tools read (stored_image_path) is written
+    before this returns, so follow-up questions never find it missing; the
+    thumbnail of a kept original is written in the background.
+    
+    Args:
+        file_path: Where the original is stored
+        source: Raw upload bytes, or file_path itself when the original is already on disk
+    """
+    if not STORE_ORIGINALS:
+        await asyncio.to_thread(_store_thumbnail_only, file_path, source)
+        return
+    if isinstance(source, bytes):
+        await asyncio.to_thread(_write_file, file_path, source)
+    task = asyncio.create_task(asyncio.to_thread(_write_thumbnail, file_path, source))
+    _pending_writes.add(task)
+    task.add_done_callback(_pending_writes.discard)
+
+async def read_upload(file: UploadFile) -> bytes:
+    """
+    Read an upload into memory, stopping once it exceeds INGEST_MAX_BYTES
+    
+    Raises:
+        ImageRejected if the upload is too large
+    """
+    data = await file.read(INGEST_MAX_BYTES + 1)
+    check_upload_size(len(data))
+    return data
+
+def upload_urls(file_path: str) -> Dict[str, Optional[str]]:
+    """Public URLs of a stored upload and its thumbnail"""
+    return {
+        "file_path": f"/uploads/{os.path.basename(file_path)}" if STORE_ORIGINALS else None,
+        "thumbnail_path": f"/uploads/thumbs/{thumbnail_name(file_path)}",
+    }
+
 # Connection manager for WebSockets
 class ConnectionManager:
     def __init__(self):
@@ -60,6 +172,19 @@ class ConnectionManager:
 
 manager = ConnectionManager()
 
+# Values read on every /metrics scrape
+register_gauge("plantid_active_websockets", "Open WebSocket connections", lambda: len(manager.active_connections))
+register_gauge(
+    "plantid_active_sessions",
+    "Live chat sessions",
+    lambda: get_plant_chat().store.stats()["live_sessions"] if plant_chat_ready() else 0,
+    # Every worker sees all sessions of a shared store, but only its own in memory
+    multiprocess_mode="livesum" if SESSION_BACKEND == "memory" else "livemax"
+)
+register_cache("result", result_cache.stats)
+register_cache("near_duplicate", perceptual_index.stats)
+register_cache("llm", lambda: llm_cache.stats() if llm_cache is not None else None)
+
 # Request models
 class ChatRequest(BaseModel):
     session_id: str
@@ -72,43 +197,275 @@ class AnalysisRequest(BaseModel):
 class ChatResponse(BaseModel):
     success: bool
     response: str = ""
+    prompt_tokens: Optional[int] = None
     error: Optional[str] = None
 
+async def run_upload_job(payload: Dict, image_bytes: Optional[bytes]) -> Dict:
+    """Run a queued /api/upload job; the result is what the synchronous endpoint would return"""
+    file_path = payload["file_path"]
+    # The client already knows the session id, so the image must be on disk before the session exists
+    await persist_upload(file_path, image_bytes)
+    result = await handle_image_upload(
+        file_path,
+        payload.get("symptoms"),
+        payload.get("debug"),
+        session_id=payload["session_id"],
+        image_bytes=image_bytes,
+        tier=payload.get("tier"),
+        stored_path=stored_image_path(file_path)
+    )
+    if not result["success"]:
+        raise RuntimeError(result.get("error") or "Image analysis failed")
+    result.update(upload_urls(file_path))
+    return result
+
+async def push_job_update(job: Dict):
+    """Send job status changes to the WebSocket of the job's session, if one is open"""
+    session_id = job.get("session_id")
+    if session_id in manager.active_connections:
+        await manager.send_message(session_id, json.dumps({"type": "job", **job}))
+
+# Keep a reference so the task is not garbage collected
+_metrics_sync_task: Optional[asyncio.Task] = None
+
+@app.on_event("startup")
+async def start_metrics_sync():
+    global _metrics_sync_task
+    _metrics_sync_task = asyncio.create_task(sync_multiprocess_metrics())
+
+@app.on_event("startup")
+async def start_job_workers():
+    job_queue.add_listener(push_job_update)
+    job_queue.start(run_upload_job)
+
+@app.on_event("shutdown")
+async def stop_job_workers():
+    await job_queue.stop()
+
+# Load the vision models once per worker, in the background so / answers right away;
+# /ready reports 503 until this has finished
+WARM_UP_MODELS = os.getenv("WARM_UP_MODELS", "true").lower() == "true"
+
+# Startup progress reported by /ready, in seconds since the process started
+readiness: Dict[str, Any] = {
+    "status": "starting",
+    "imported_s": round(time.time() - PROCESS_STARTED, 3),
+    "chat_ready_s": None,
+    "models_warm_s": None,
+    "error": None,
+}
+_warm_up_task: Optional[asyncio.Task] = None
+
+async def warm_up():
+    """Build the chat agent and load the vision models off the event loop"""
+    try:
+        await asyncio.to_thread(get_plant_chat)
+        readiness["chat_ready_s"] = round(time.time() - PROCESS_STARTED, 3)
+        if WARM_UP_MODELS:
+            stats = await asyncio.to_thread(registry.warm_up)
+            readiness["models_warm_s"] = round(time.time() - PROCESS_STARTED, 3)
+            logger.info(f"Vision models warmed up: {stats}")
+        else:
+            logger.info("Model warm-up disabled; models will load on first request")
+        readiness["status"] = "ready"
+        logger.info(f"Ready {time.time() - PROCESS_STARTED:.1f}s after process start")
+    except Exception as e:
+        readiness["status"] = "failed"
+        readiness["error"] = str(e)
+        logger.error(f"Startup warm-up failed: {str(e)}")
+
+@app.on_event("startup")
+async def start_warm_up():
+    global _warm_up_task
+    _warm_up_task = asyncio.create_task(warm_up())
+
+@app.on_event("shutdown")
+async def shutdown_executor():
+    limits.shutdown()
+
+@app.on_event("shutdown")
+async def close_llm_client():
+    await llm_client.close()
+
 # API endpoints
 @app.get("/")
 async def get_home():
     """Basic health check endpoint"""
     return {"status": "ok", "message": "Plant Disease Diagnosis API is running"}
 
+@app.get("/ready")
+async def get_ready():
+    """Readiness check: 200 once the chat agent is built and the vision models are warm, 503 before"""
+    return JSONResponse(status_code=200 if readiness["status"] == "ready" else 503, content=readiness)
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus metrics: stage and model latency, LLM tokens, cache hits, sessions and WebSockets"""
+    # Rendering reads the cache and session stores (SQLite when configured) and the multiprocess files
+    content = await asyncio.to_thread(render)
+    return Response(content=content, media_type=CONTENT_TYPE_LATEST)
+
+def check_admin(token: Optional[str]):
+    if not ADMIN_TOKEN:
+        # Profiles expose code paths and timings, so the admin API is off unless a token is configured
+        raise HTTPException(status_code=404, detail="Not Found")
+    if token is None or not hmac.compare_digest(token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+@app.get("/api/admin/profiles")
+async def list_profiles(x_admin_token: Optional[str] = Header(None)):
+    """List stored request profiles, newest first"""
+    check_admin(x_admin_token)
+    return {
+        "enabled": PROFILING_ENABLED,
+        "sample_rate": PROFILE_SAMPLE_RATE,
+        "profiles": await asyncio.to_thread(profile_store.list),
+    }
+
+@app.get("/api/admin/profiles/{profile_id}")
+async def get_profile(profile_id: str, x_admin_token: Optional[str] = Header(None)):
+    """Text summary of one profile: top functions per thread and torch op tables"""
+    check_admin(x_admin_token)
+    path = profile_store.path(profile_id, "summary.txt")
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return PlainTextResponse(await asyncio.to_thread(_read_text, path))
+
+@app.get("/api/admin/profiles/{profile_id}/{filename}")
+async def download_profile(profile_id: str, filename: str, x_admin_token: Optional[str] = Header(None)):
+    """Download a raw profile file (loop.prof / workers.prof load into pstats or snakeviz)"""
+    check_admin(x_admin_token)
+    path = profile_store.path(profile_id, filename)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile file not found")
+    return FileResponse(path, filename=f"{profile_id}-{filename}")
+
+@app.get("/api/models")
+async def get_model_stats():
+    """Report the model tiers and the load time and resident memory of loaded vision models"""
+    return {**registry.stats(), "catalogue": catalogue.describe()}
+
+@app.get("/api/batching")
+async def get_batching_stats():
+    """Report batch sizes and latencies for the vision micro-batchers"""
+    return batching_stats()
+
+@app.get("/api/executor")
+async def get_executor_stats():
+    """Report queue depth for the inference pool and LLM concurrency limiter"""
+    return limits.stats()
+
+@app.get("/api/cache")
+async def get_cache_stats():
+    """Report hit/miss counters for the image result cache, near-duplicate index and LLM response cache"""
+    return {
+        "results": result_cache.stats(),
+        "near_duplicates": perceptual_index.stats(),
+        "llm": llm_cache.stats() if llm_cache is not None else None,
+    }
+
+@app.get("/api/jobs")
+async def get_job_stats():
+    """Report job queue depth, capacity and outcomes"""
+    return await job_queue.stats()
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Poll a job submitted with async_job; finished jobs include the upload result"""
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return job
+
+@app.get("/api/sessions")
+async def get_session_stats():
+    """Report live chat sessions and the bytes their history holds"""
+    return get_plant_chat().store.stats()
+
 @app.post("/api/upload")
+@profiled("upload")
 async def upload_image(
     file: UploadFile = File(...), 
-    symptoms: Optional[str] = Form(None)
+    symptoms: Optional[str] = Form(None),
+    debug: Optional[bool] = Form(None),
+    tier: Optional[str] = Form(None),
+    async_job: bool = Form(False),
+    session_id: Optional[str] = Form(None)
 ):
-    """Upload an image and get initial diagnosis"""
+    """
+    Upload an image and get initial diagnosis
+    
+    With async_job the request returns 202 with a job id straight away; the
+    result is available from /api/jobs/{job_id} and is pushed to the
+    session's WebSocket (/ws/{session_id}) when the job finishes. Pass the
+    session_id of an already open WebSocket to receive the job updates on
+    it (any other session_id is rejected with 400); a new session id is
+    generated when it is omitted.
+    """
     try:
         # Generate a unique filename
         file_ext = os.path.splitext(file.filename)[1]
         unique_filename = f"{uuid.uuid4()}{file_ext}"
         file_path = os.path.join(UPLOAD_DIR, unique_filename)
         
-        # Save the uploaded file
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        logger.info(f"Image uploaded successfully: {file_path}")
+        if async_job:
+            catalogue.resolve(tier, "upload")
+            if session_id is not None and session_id not in manager.active_connections:
+                # Otherwise a job could write its diagnosis into someone else's chat session
+                return JSONResponse(
+                    status_code=400,
+                    content={"success": False, "error": "session_id must be that of a WebSocket open on this server"}
+                )
+            image_bytes = await read_upload(file)
+            try:
+                job = await job_queue.submit(
+                    {"file_path": file_path, "symptoms": symptoms, "debug": debug, "tier": tier},
+                    image_bytes,
+                    session_id=session_id or str(uuid.uuid4())
+                )
+            except QueueFull as e:
+                # Backpressure: tell the client when the backlog should have drained
+                return JSONResponse(
+                    status_code=429,
+                    content={"success": False, "error": str(e)},
+                    headers={"Retry-After": str(e.retry_after)}
+                )
+            logger.info(f"Queued upload job {job['job_id']} for session {job['session_id']}")
+            return JSONResponse(status_code=202, content={"success": True, **job})
         
-        # Process the image
-        result = await handle_image_upload(file_path, symptoms)
+        if ZERO_DISK_UPLOADS:
+            # Decode from the spooled request body; the copy for /uploads is written later
+            with stage("upload", "read"):
+                image_bytes = await read_upload(file)
+            result = await handle_image_upload(
+                file_path, symptoms, debug, image_bytes=image_bytes, tier=tier,
+                stored_path=stored_image_path(file_path)
+            )
+        else:
+            # Save the uploaded file
+            with stage("upload", "save"):
+                await asyncio.to_thread(_copy_upload, file, file_path)
+            logger.info(f"Image uploaded successfully: {file_path}")
+            
+            # Process the image
+            result = await handle_image_upload(
+                file_path, symptoms, debug, tier=tier, stored_path=stored_image_path(file_path)
+            )
         
         # Add the file path to the response
         if result["success"]:
-            result["file_path"] = f"/uploads/{unique_filename}"
+            # Awaited: the session id only reaches the client with this response,
+            # by which time the image its follow-up questions need is on disk
+            await persist_upload(file_path, image_bytes if ZERO_DISK_UPLOADS else file_path)
+            result.update(upload_urls(file_path))
             logger.info(f"Image analysis successful for session: {result.get('session_id')}")
         else:
             logger.error(f"Image analysis failed: {result.get('error')}")
         
         return result
+    except (ImageRejected, UnknownTier) as e:
+        logger.warning(f"Upload rejected: {str(e)}")
+        return {"success": False, "error": str(e)}
     except Exception as e:
         logger.error(f"Error processing upload: {str(e)}")
         return {"success": False, "error": f"Error processing upload: {str(e)}"}
@@ -126,15 +483,20 @@ async def chat_message(request: ChatRequest):
 
 # New endpoint for plant disease diagnosis
 @app.post("/api/diagnose-plant-disease/")
+@profiled("diagnose")
 async def diagnose_plant_disease(
     file: UploadFile = File(...),
-    symptoms: Optional[str] = Form(None)
+    symptoms: Optional[str] = Form(None),
+    debug: Optional[bool] = Form(None),
+    tier: Optional[str] = Form(None)
 ):
     """
     Upload an image of a plant and get a diagnosis of potential diseases.
     
     - **file**: The image file to upload
     - **symptoms**: Optional description of symptoms observed
+    - **debug**: Include a per-stage timing breakdown in the response
+    - **tier**: Vision model tier ("fast" or "accurate"); defaults to the endpoint's configured tier
     """
     # Validate file is an image
     if not file.content_type.startswith("image/"):
@@ -144,17 +506,29 @@ async def diagnose_plant_disease(
         )
     
     try:
+        catalogue.resolve(tier, "diagnose")
+    except UnknownTier as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        if ZERO_DISK_UPLOADS:
+            # The image is never served back, so it does not need to touch the disk at all
+            with stage("diagnose", "read"):
+                image_bytes = await read_upload(file)
+            result = await process_uploaded_image(file.filename, symptoms, debug, image_bytes=image_bytes, tier=tier)
+            return JSONResponse(content=result)
+        
         # Generate a unique filename to prevent collisions
         file_extension = os.path.splitext(file.filename)[1]
         unique_filename = f"{uuid.uuid4()}{file_extension}"
         file_path = os.path.join(IMAGE_DIR, unique_filename)
         
         # Save the uploaded file
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        with stage("diagnose", "save"):
+            await asyncio.to_thread(_copy_upload, file, file_path)
         
         # Process the image for disease detection
-        result = await process_uploaded_image(file_path, symptoms)
+        result = await process_uploaded_image(file_path, symptoms, debug, tier=tier)
         
         # Clean up the file after processing
         if os.path.exists(file_path):
@@ -162,6 +536,10 @@ async def diagnose_plant_disease(
         
         return JSONResponse(content=result)
         
+    except ImageRejected as e:
+        if 'file_path' in locals() and os.path.exists(file_path):
+            os.remove(file_path)
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         # Clean up on error
         if 'file_path' in locals() and os.path.exists(file_path):
@@ -172,6 +550,78 @@ async def diagnose_plant_disease(
             detail=f"Error processing image: {str(e)}"
         )
 
+@app.post("/api/diagnose-batch")
+async def diagnose_batch(
+    files: List[UploadFile] = File(...),
+    symptoms: Optional[str] = Form(None),
+    tier: Optional[str] = Form(None)
+):
+    """
+    Diagnose many plant images in one request, e.g. the photos of a field survey.
+    
+    - **files**: Image files and/or zip archives of images
+    - **symptoms**: Optional description of symptoms, applied to every image
+    - **tier**: Vision model tier ("fast" or "accurate")
+    
+    The response is streamed as NDJSON: one {"type": "result", ...} line per
+    image as soon as it is diagnosed (in completion order, with its upload
+    "index"), followed by a {"type": "summary", ...} line. Requests whose
+    files add up to more than BATCH_DIAGNOSE_MAX_BYTES get 413.
+    """
+    try:
+        catalogue.resolve(tier, "diagnose")
+    except UnknownTier as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        spools = await asyncio.to_thread(spool_uploads, files)
+    except ImageRejected as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error starting batch diagnosis: {str(e)}")
+    
+    try:
+        lines = stream_batch_diagnosis(spools, symptoms, tier)
+    except Exception as e:
+        for _, spool in spools:
+            spool.close()
+        raise HTTPException(status_code=500, detail=f"Error starting batch diagnosis: {str(e)}")
+    
+    return StreamingResponse(lines, media_type="application/x-ndjson")
+
+async def handle_websocket_image(session_id: str, message_data: Dict, on_token=None) -> Dict:
+    """Diagnose an image sent over the WebSocket and keep a copy under /uploads"""
+    try:
+        image_bytes = base64.b64decode(message_data.get("data", ""), validate=True)
+    except (binascii.Error, ValueError):
+        return {"success": False, "error": "Image data must be base64 encoded"}
+    try:
+        check_upload_size(len(image_bytes))
+    except ImageRejected as e:
+        return {"success": False, "error": str(e)}
+    
+    file_ext = os.path.splitext(message_data.get("filename") or "")[1] or ".jpg"
+    unique_filename = f"{uuid.uuid4()}{file_ext}"
+    file_path = os.path.join(UPLOAD_DIR, unique_filename)
+    
+    # The client already knows the session id, so store the image before the session exists;
+    # it is decoded straight from memory
+    await persist_upload(file_path, image_bytes)
+    result = await handle_image_upload(
+        file_path,
+        message_data.get("symptoms"),
+        message_data.get("debug"),
+        session_id=session_id,
+        on_token=on_token,
+        image_bytes=image_bytes,
+        tier=message_data.get("tier"),
+        endpoint="websocket",
+        stored_path=stored_image_path(file_path)
+    )
+    if result["success"]:
+        result.update(upload_urls(file_path))
+    return result
+
 @app.websocket("/ws/{session_id}")
 async def websocket_endpoint(websocket: WebSocket, session_id: str):
     """WebSocket endpoint for real-time chat"""
@@ -186,10 +636,14 @@ async def websocket_endpoint(websocket: WebSocket, session_id: str):
         while True:
             # Receive message from client
             data = await websocket.receive_text()
-            logger.info(f"Received WebSocket message from session {session_id}: {data}")
+            logger.info(f"Received WebSocket message from session {session_id} ({len(data)} bytes)")
             
             try:
                 message_data = json.loads(data)
+                stream = bool(message_data.get("stream"))
+                
+                async def send_delta(text: str):
+                    await websocket.send_text(json.dumps({"type": "delta", "content": text}))
                 
                 # Process the message
                 if message_data.get("type") == "chat":
@@ -202,12 +656,44 @@ async def websocket_endpoint(websocket: WebSocket, session_id: str):
                         "message": "Processing your message..."
                     }))
                     
-                    # Process the message
-                    result = await handle_chat_message(session_id, user_message)
+                    # Process the message, streaming the answer when the client asked for it
+                    result = await handle_chat_message(
+                        session_id,
+                        user_message,
+                        on_token=send_delta if stream else None
+                    )
+                    if stream:
+                        result["type"] = "done"
                     
                     # Send response back to client
                     await websocket.send_text(json.dumps(result))
                     logger.info(f"Response sent to client for session {session_id}")
+                
+                elif message_data.get("type") == "job_status":
+                    # Current state of a queued upload; completion is also pushed unprompted
+                    job = await job_queue.get(message_data.get("job_id", ""))
+                    if job is None:
+                        await websocket.send_text(json.dumps({"success": False, "error": "Job not found or expired"}))
+                    else:
+                        await websocket.send_text(json.dumps({"type": "job", **job}))
+                
+                elif message_data.get("type") == "image":
+                    # Start this session from a base64 encoded image and stream the diagnosis
+                    await websocket.send_text(json.dumps({
+                        "type": "system",
+                        "message": "Analyzing your image..."
+                    }))
+                    
+                    result = await handle_websocket_image(
+                        session_id,
+                        message_data,
+                        on_token=send_delta if stream else None
+                    )
+                    if stream:
+                        result["type"] = "done"
+                    
+                    await websocket.send_text(json.dumps(result))
+                    logger.info(f"Diagnosis sent to client for session {session_id}")
             except json.JSONDecodeError:
                 logger.error(f"Invalid JSON received from session {session_id}")
                 await websocket.send_text(json.dumps({
@@ -0,0 +1,274 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import multiprocess
+from prometheus_client.core import CounterMetricFamily
+from prometheus_client.registry import Collector
+
+logger = logging.getLogger(__name__)
+
+# Set by gunicorn.conf.py when several workers serve the API: every worker then writes its
+# metrics to files in this directory and /metrics aggregates them, whichever worker answers
+MULTIPROCESS = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+# How often each worker publishes its cache counters and gauges in multiprocess mode
+METRICS_SYNC_SECONDS = float(os.getenv("METRICS_SYNC_SECONDS", "5"))
+
+# Bucket bounds in seconds; pipeline stages range from sub-millisecond parsing to multi-second LLM calls
+_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+STAGE_SECONDS = Histogram(
+    "plantid_stage_seconds",
+    "Time spent in one stage of a request pipeline",
+    ["pipeline", "stage"],
+    buckets=_LATENCY_BUCKETS
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "plantid_http_request_seconds",
+    "HTTP request latency until the response starts",
+    ["route", "method", "status"],
+    buckets=_LATENCY_BUCKETS
+)
+MODEL_BATCH_SECONDS = Histogram(
+    "plantid_model_batch_seconds",
+    "Inference time of one vision model batch",
+    ["batcher"],
+    buckets=_LATENCY_BUCKETS
+)
+MODEL_BATCH_SIZE = Histogram(
+    "plantid_model_batch_size",
+    "Images per vision model batch",
+    ["batcher"],
+    buckets=(1, 2, 4, 8, 16, 32)
+)
+LLM_TOKENS = Counter(
+    "plantid_llm_tokens",
+    "Tokens sent to and generated by the LLM provider",
+    ["model", "kind"]
+)
+
+# Stage durations (ms) of the HTTP request being handled, for its Server-Timing header
+_request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_timings", default=None)
+
+
+def record_stage(pipeline: str, name: str, seconds: float):
+    """Observe a stage duration and add it to the current request's Server-Timing"""
+    STAGE_SECONDS.labels(pipeline, name).observe(seconds)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds * 1000
+
+
+@contextmanager
+def stage(pipeline: str, name: str) -> Iterator[None]:
+    """
+    Time the enclosed block as one stage of a pipeline
+
+    Args:
+        pipeline: Request pipeline ("upload", "diagnose", "chat", ...)
+        name: Stage within it ("decode", "vision", "llm", ...)
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(pipeline, name, time.perf_counter() - start)
+
+
+def server_timing_header(timings: Dict[str, float], total_ms: float) -> str:
+    """Server-Timing value listing each recorded stage and the total"""
+    entries = [f"{name};dur={duration:.1f}" for name, duration in timings.items()]
+    entries.append(f"total;dur={total_ms:.1f}")
+    return ", ".join(entries)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware timing every HTTP request.
+
+    Collects the stages recorded while the request is handled into a
+    ``Server-Timing`` response header and observes the request latency,
+    labelled by route template so paths with ids do not explode the label
+    set. WebSocket and lifespan traffic passes straight through.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings: Dict[str, float] = {}
+        token = _request_timings.set(timings)
+        start = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                elapsed = time.perf_counter() - start
+                header = server_timing_header(timings, elapsed * 1000)
+                message["headers"] = [*message.get("headers", []), (b"server-timing", header.encode())]
+                route = getattr(scope.get("route"), "path", "unmatched")
+                HTTP_REQUEST_SECONDS.labels(route, scope["method"], str(message["status"])).observe(elapsed)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_timings.reset(token)
+
+
+class TokenUsageHandler(BaseCallbackHandler):
+    """Counts the prompt and completion tokens reported for every call of one chat model"""
+
+    # Only increments counters, so it runs inline rather than on an executor thread
+    run_inline = True
+
+    def __init__(self, model: str):
+        self.model = model
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    LLM_TOKENS.labels(self.model, "prompt").inc(usage.get("input_tokens", 0))
+                    LLM_TOKENS.labels(self.model, "completion").inc(usage.get("output_tokens", 0))
+
+
+def _cache_lookups(stats: Dict[str, Any]) -> Dict[str, int]:
+    hits = stats.get("hits", stats.get("memory_hits", 0) + stats.get("disk_hits", 0))
+    return {"hit": hits, "miss": stats.get("misses", 0)}
+
+
+class _CacheStatsCollector(Collector):
+    """Exports the hit and miss counters the caches already keep, read at scrape time"""
+
+    def __init__(self):
+        self.sources: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+    def collect(self):
+        lookups = CounterMetricFamily(
+            "plantid_cache_lookups",
+            "Cache lookups by cache and outcome",
+            labels=["cache", "result"]
+        )
+        for name, stats_fn in self.sources.items():
+            try:
+                stats = stats_fn()
+            except Exception as e:
+                logger.warning(f"Could not read {name} cache stats: {str(e)}")
+                continue
+            if stats is None:
+                continue
+            for result, total in _cache_lookups(stats).items():
+                lookups.add_metric([name, result], total)
+        yield lookups
+
+
+class _MultiprocessSync:
+    """
+    Publishes scrape-time values for multiprocess mode.
+
+    Collectors and callback gauges only run in the worker that answers a
+    scrape, so instead every worker periodically copies its cache counters
+    (as increments of a real Counter) and gauge values into the shared
+    metric files.
+    """
+
+    def __init__(self):
+        self.lookups = Counter("plantid_cache_lookups", "Cache lookups by cache and outcome", ["cache", "result"])
+        self.gauges: List[Tuple[Gauge, Callable[[], float]]] = []
+        self._published: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+
+    def sync(self):
+        with self._lock:
+            for name, stats_fn in _cache_stats.sources.items():
+                try:
+                    stats = stats_fn()
+                except Exception as e:
+                    logger.warning(f"Could not read {name} cache stats: {str(e)}")
+                    continue
+                if stats is None:
+                    continue
+                for result, total in _cache_lookups(stats).items():
+                    published = self._published.get((name, result), 0)
+                    if total > published:
+                        self.lookups.labels(name, result).inc(total - published)
+                        self._published[(name, result)] = total
+            for gauge, value_fn in self.gauges:
+                try:
+                    gauge.set(value_fn())
+                except Exception as e:
+                    logger.warning(f"Could not read gauge value: {str(e)}")
+
+
+_cache_stats = _CacheStatsCollector()
+_sync: Optional[_MultiprocessSync] = None
+if MULTIPROCESS:
+    _sync = _MultiprocessSync()
+else:
+    REGISTRY.register(_cache_stats)
+
+
+def register_cache(name: str, stats_fn: Callable[[], Optional[Dict[str, Any]]]):
+    """Export a cache's hit/miss counters, taken from its stats() at every scrape"""
+    _cache_stats.sources[name] = stats_fn
+
+
+def register_gauge(
+    name: str,
+    documentation: str,
+    value_fn: Callable[[], float],
+    multiprocess_mode: str = "livesum"
+) -> Gauge:
+    """
+    Export a gauge whose value is read from value_fn at every scrape
+
+    Args:
+        name: Metric name
+        documentation: Help text
+        value_fn: Returns this worker's current value
+        multiprocess_mode: How worker values are combined in multiprocess mode
+            ("livesum" for per-worker state, "livemax" for state every worker shares)
+    """
+    if _sync is not None:
+        gauge = Gauge(name, documentation, multiprocess_mode=multiprocess_mode)
+        _sync.gauges.append((gauge, value_fn))
+        return gauge
+    gauge = Gauge(name, documentation)
+    gauge.set_function(value_fn)
+    return gauge
+
+
+async def sync_multiprocess_metrics():
+    """Publish this worker's scrape-time values every METRICS_SYNC_SECONDS; returns at once outside multiprocess mode"""
+    while _sync is not None:
+        await asyncio.to_thread(_sync.sync)
+        await asyncio.sleep(METRICS_SYNC_SECONDS)
+
+
+def render() -> bytes:
+    """
+    All metrics in the Prometheus text format, aggregated over every worker in multiprocess mode
+
+    Blocking: callback gauges and cache stats may query SQLite, so call it off the event loop
+    """
+    if _sync is None:
+        return generate_latest()
+    _sync.sync()
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry)
+
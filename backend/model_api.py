@@ -1,18 +1,31 @@
 import os
 import json
 import re
+import time
 from typing import Dict, Any, Optional, List, Union
-from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.messages import AIMessage, HumanMessage
 from langchain.tools import BaseTool
-from transformers import BlipProcessor, BlipForConditionalGeneration, DetrImageProcessor, DetrForObjectDetection
-from PIL import Image
-import torch
-from langchain.agents import AgentExecutor, create_openai_functions_agent
+from image_ingest import ImageRejected, decode_image
+from vision import caption_images, detect_objects
+from pipeline import describe_image
+from model_catalogue import catalogue
+from detections import Detections
+from executor import limits
+from result_cache import result_cache, image_digest, diagnosis_key
+from llm_cache import llm_cache
+from llm_client import llm_client
+from metrics import stage
 from langchain_core.tools import Tool
-from langchain.memory import ConversationBufferMemory
+
+# Include per-stage timings in diagnosis responses unless a request overrides it
+DEBUG_TIMINGS = os.getenv("DEBUG_TIMINGS", "false").lower() == "true"
+
+# Symptoms assumed when a request does not describe any
+DEFAULT_SYMPTOMS = """Disease Symptoms
+1. Wet-looking, dark patches appear on leaves, usually starting from the edges.
+2. A white, cotton-like layer may grow on the underside of leaves when it's humid."""
 
 
 class ImageCaptionTool(BaseTool):
@@ -22,56 +35,27 @@ class ImageCaptionTool(BaseTool):
     )
 
     def _run(self, img_path: str) -> str:
-        image = Image.open(img_path).convert("RGB")
-
-        model_name = "Salesforce/blip-image-captioning-large"
-        device = "cpu"  # Change to "cuda" if GPU is available
-
-        processor = BlipProcessor.from_pretrained(model_name)
-        model = BlipForConditionalGeneration.from_pretrained(model_name).to(device)
-
-        inputs = processor(image, return_tensors="pt").to(device)
-        output = model.generate(**inputs, max_new_tokens=20)
-
-        caption = processor.decode(output[0], skip_special_tokens=True)
+        return caption_images([decode_image(img_path)])[0]
 
-        return caption
-
-    def _arun(self, query: str):
-        raise NotImplementedError("This tool does not support async")
+    async def _arun(self, img_path: str) -> str:
+        # Run inference on the bounded thread pool so the event loop stays free
+        return await limits.run_inference(self._run, img_path)
 
 
 class ObjectDetectionTool(BaseTool):
     name: str = "object_detector"
     description: str = (
         "Use this tool when given the path to an image that you would like to detect objects. "
-        "It will return a list of all detected objects. Each element in the list is in the format: "
-        "[x1, y1, x2, y2] class_name confidence_score."
+        "It will return all detected objects, one per line, in the format: "
+        "[x1,y1,x2,y2] class_name confidence_score."
     )
 
     def _run(self, img_path: str) -> str:
-        image = Image.open(img_path).convert("RGB")
-
-        processor = DetrImageProcessor.from_pretrained("facebook/detr-resnet-50")
-        model = DetrForObjectDetection.from_pretrained("facebook/detr-resnet-50")
-
-        inputs = processor(images=image, return_tensors="pt")
-        outputs = model(**inputs)
-
-        # Convert outputs (bounding boxes and class logits) to COCO API
-        target_sizes = torch.tensor([image.size[::-1]])
-        results = processor.post_process_object_detection(outputs, target_sizes=target_sizes, threshold=0.9)[0]
+        return detect_objects([decode_image(img_path)])[0].to_prompt()
 
-        detections = ""
-        for score, label, box in zip(results["scores"], results["labels"], results["boxes"]):
-            detections += "[{}, {}, {}, {}]".format(int(box[0]), int(box[1]), int(box[2]), int(box[3]))
-            detections += " {}".format(model.config.id2label[int(label)])
-            detections += " {}\n".format(float(score))
-
-        return detections
-
-    def _arun(self, query: str):
-        raise NotImplementedError("This tool does not support async")
+    async def _arun(self, img_path: str) -> str:
+        # Run inference on the bounded thread pool so the event loop stays free
+        return await limits.run_inference(self._run, img_path)
 
 
 def extract_json_from_text(text: str) -> Dict[str, Any]:
@@ -160,10 +144,56 @@ def extract_json_from_text(text: str) -> Dict[str, Any]:
     }
 
 
-def process_plant_disease_image(
+_diagnosis_llm: Optional[ChatOpenAI] = None
+
+
+def diagnosis_llm() -> ChatOpenAI:
+    """
+    Return the chat model used for structured diagnoses, creating it on first use
+
+    Raises:
+        ValueError if OPENAI_API_KEY is not set
+    """
+    global _diagnosis_llm
+    if _diagnosis_llm is None:
+        # Lower temperature for more consistent output
+        _diagnosis_llm = llm_client.chat_model(
+            "gpt-4o",
+            temperature=0.2,
+            cache=llm_cache  # Repeated prompts are answered without calling the API
+        )
+    return _diagnosis_llm
+
+
+def build_diagnosis_prompt(caption: str, detections: Detections, symptoms: str) -> str:
+    """Prompt asking for the diagnosis of one image as JSON"""
+    return f"""You are a plant disease diagnosis expert. Analyze the following information about a plant image:
+
+IMAGE CAPTION: {caption}
+
+OBJECT DETECTION ([x1,y1,x2,y2] label score):
+{detections.to_prompt()}
+
+DISEASE SYMPTOMS:
+{symptoms}
+
+Based on this information, provide your diagnosis in this exact JSON format:
+{{
+    "possible_diagnosis": ["Diagnosis 1", "Diagnosis 2"],
+    "causes": ["Cause 1", "Cause 2"],
+    "remedies_or_cure": ["Remedy 1", "Remedy 2"]
+}}
+
+Return only the valid JSON with no additional text or formatting."""
+
+
+async def process_plant_disease_image(
     image_path: str, 
     disease_symptoms: Optional[str] = None,
-    image_dir: str = "images/"
+    image_dir: str = "images/",
+    debug: Optional[bool] = None,
+    image_bytes: Optional[bytes] = None,
+    tier: Optional[str] = None
 ) -> Dict[str, Any]:
     """
     Process an image for plant disease detection and return a structured JSON response.
@@ -172,35 +202,38 @@ def process_plant_disease_image(
         image_path (str): Name of the image file (will be joined with image_dir)
         disease_symptoms (str, optional): Description of disease symptoms
         image_dir (str, optional): Directory where images are stored. Defaults to "images/".
+        debug (bool, optional): Include per-stage timings in the result. Defaults to DEBUG_TIMINGS.
+        image_bytes (bytes, optional): Raw image to decode in memory; image_path is then only a label.
+        tier (str, optional): Vision model tier; defaults to the tier configured for the diagnose endpoint.
     
     Returns:
         Dict[str, Any]: A JSON-formatted dictionary with diagnosis, causes, and remedies
+
+    Raises:
+        ImageRejected: If the image exceeds the decoder's pixel limit
     """
-    # Load environment variables and API key
-    load_dotenv()
-    api_key = os.getenv("OPENAI_API_KEY")
-    if api_key is None:
-        raise ValueError("API Key not set. Please set the OPENAI_API_KEY environment variable.")
+    start = time.perf_counter()
+    if debug is None:
+        debug = DEBUG_TIMINGS
 
     # Full path to the image
     full_image_path = os.path.join(image_dir, image_path)
     
     # Validate image exists
-    if not os.path.exists(full_image_path):
+    if image_bytes is None and not os.path.exists(full_image_path):
         return {
             "success": False,
             "error": f"Image not found at path: {full_image_path}",
             "image_path": image_path,
             "possible_diagnosis": [],
             "causes": [],
-            "remedies_or_cure": []
+            "remedies_or_cure": [],
+            "detections": []
         }
 
     # Default symptoms if not provided
     if disease_symptoms is None:
-        disease_symptoms = """Disease Symptoms
-1. Wet-looking, dark patches appear on leaves, usually starting from the edges.
-2. A white, cotton-like layer may grow on the underside of leaves when it's humid."""
+        disease_symptoms = DEFAULT_SYMPTOMS
 
     # Create tools
     tools = [
@@ -216,53 +249,82 @@ def process_plant_disease_image(
         )
     ]
 
-    # Initialize the ChatOpenAI model with more strict temperature
-    llm = ChatOpenAI(
-        model="gpt-4o",
-        temperature=0.2,  # Lower temperature for more consistent output
-        api_key=api_key
-    )
+    llm = diagnosis_llm()
 
     # Create a simpler approach without complicated chat templates
     try:
-        # First, get the image description
-        image_caption = ImageCaptionTool()._run(full_image_path)
-        object_detection = ObjectDetectionTool()._run(full_image_path)
+        model_tier = catalogue.resolve(tier, "diagnose")
+        
+        # First, decode the image once for every later stage
+        with stage("diagnose", "decode"):
+            image = await limits.run_inference(
+                decode_image,
+                full_image_path if image_bytes is None else image_bytes
+            )
+        
+        # Identical photos (same decoded pixels and symptoms) reuse earlier results
+        with stage("diagnose", "digest"):
+            digest = await limits.run_inference(image_digest, image)
+        cache_key = diagnosis_key("diagnose", digest, disease_symptoms, llm.model_name, model_tier)
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            result = dict(cached["diagnosis"])
+            result["image_path"] = image_path
+            result["detections"] = cached["detections"]
+            result["model_tier"] = model_tier.name
+            result["success"] = True
+            if debug:
+                result["timings"] = {
+                    "cache": "hit",
+                    "total_ms": round((time.perf_counter() - start) * 1000, 1)
+                }
+            return result
+        
+        # Caption and detect objects, reusing results for exact or near-duplicate photos
+        with stage("diagnose", "vision"):
+            image_caption, detections, timings = await describe_image(image, digest, model_tier)
         
         # Create a simple prompt that directly asks for the required JSON format
-        prompt = f"""You are a plant disease diagnosis expert. Analyze the following information about a plant image:
-
-IMAGE CAPTION: {image_caption}
-
-OBJECT DETECTION: {object_detection}
-
-DISEASE SYMPTOMS:
-{disease_symptoms}
-
-Based on this information, provide your diagnosis in this exact JSON format:
-{{
-    "possible_diagnosis": ["Diagnosis 1", "Diagnosis 2"],
-    "causes": ["Cause 1", "Cause 2"],
-    "remedies_or_cure": ["Remedy 1", "Remedy 2"]
-}}
-
-Return only the valid JSON with no additional text or formatting."""
+        prompt = build_diagnosis_prompt(image_caption, detections, disease_symptoms)
 
         # Get response from the model directly without using an agent
-        response = llm.invoke(prompt)
+        llm_start = time.perf_counter()
+        with stage("diagnose", "llm"):
+            async with limits.llm_slot():
+                response = await llm.ainvoke(prompt)
+        timings["llm_ms"] = round((time.perf_counter() - llm_start) * 1000, 1)
         
         # Extract the content from the response
         content = response.content
         
         # Parse the JSON from the response
-        result = extract_json_from_text(content)
+        with stage("diagnose", "parse"):
+            result = extract_json_from_text(content)
+        
+        # Only cache diagnoses the model returned as proper JSON
+        if "raw_response" not in result:
+            result_cache.set(cache_key, {
+                "caption": image_caption,
+                "detections": detections.to_list(),
+                "diagnosis": result
+            })
         
         # Add metadata
+        result = dict(result)
         result["image_path"] = image_path
+        result["detections"] = detections.to_list()
+        result["model_tier"] = model_tier.name
         result["success"] = True
         
+        if debug:
+            timings["total_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            result["timings"] = timings
+        
         return result
         
+    except ImageRejected:
+        # Reported by the endpoint as 413, like an upload over the byte limit
+        raise
     except Exception as e:
         error_message = str(e)
         return {
@@ -271,30 +333,48 @@ Return only the valid JSON with no additional text or formatting."""
             "image_path": image_path,
             "possible_diagnosis": [],
             "causes": [],
-            "remedies_or_cure": []
+            "remedies_or_cure": [],
+            "detections": []
         }
 
 
-async def process_uploaded_image(file_path: str, symptoms: Optional[str] = None) -> Dict[str, Any]:
+async def process_uploaded_image(
+    file_path: str,
+    symptoms: Optional[str] = None,
+    debug: Optional[bool] = None,
+    image_bytes: Optional[bytes] = None,
+    tier: Optional[str] = None
+) -> Dict[str, Any]:
     """
     Process an uploaded image for disease detection. This function is designed to be used in a FastAPI app.
     
     Args:
         file_path (str): Path to the uploaded image file
         symptoms (str, optional): Description of disease symptoms
+        debug (bool, optional): Include per-stage timings in the result
+        image_bytes (bytes, optional): Raw upload to process in memory instead of reading file_path
+        tier (str, optional): Vision model tier ("fast", "accurate", ...)
         
     Returns:
         Dict[str, Any]: JSON response with diagnosis information
+
+    Raises:
+        ImageRejected: If the image exceeds the decoder's pixel limit
     """
     try:
         # Use the processing function with the file path directly
         # Note: we're not using image_dir here since we have the full path
-        result = process_plant_disease_image(
+        result = await process_plant_disease_image(
             image_path=file_path,
             disease_symptoms=symptoms,
-            image_dir=""  # Empty string because file_path is already the full path
+            image_dir="",  # Empty string because file_path is already the full path
+            debug=debug,
+            image_bytes=image_bytes,
+            tier=tier
         )
         return result
+    except ImageRejected:
+        raise
     except Exception as e:
         return {
             "success": False,
@@ -302,5 +382,6 @@ async def process_uploaded_image(file_path: str, symptoms: Optional[str] = None)
             "image_path": file_path,
             "possible_diagnosis": [],
             "causes": [],
-            "remedies_or_cure": []
+            "remedies_or_cure": [],
+            "detections": []
         }
\ No newline at end of file
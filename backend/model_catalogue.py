@@ -0,0 +1,129 @@
+import os
+import json
+import logging
+from typing import Any, Dict, List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+# Optional JSON file replacing DEFAULT_CATALOGUE, in the same shape
+MODEL_CATALOGUE = os.getenv("MODEL_CATALOGUE")
+
+# Overrides the catalogue's default tier
+MODEL_TIER = os.getenv("MODEL_TIER")
+
+# Comma separated tiers this worker may load; defaults to the default tier
+# plus every tier an endpoint is mapped to
+MODEL_TIERS = os.getenv("MODEL_TIERS")
+
+# "torch" runs the checkpoints as shipped (FP32); "int8" applies PyTorch dynamic
+# quantization to every Linear layer; "onnx" runs the heavy encoder graphs with
+# ONNX Runtime (see inference_backends.py). The last two are CPU only.
+VISION_BACKEND = os.getenv("VISION_BACKEND", "torch")
+BACKENDS = ("torch", "int8", "onnx")
+
+DEFAULT_CATALOGUE: Dict[str, Any] = {
+    "default_tier": "accurate",
+    "tiers": {
+        "accurate": {
+            "caption": "Salesforce/blip-image-captioning-large",
+            "detection": "facebook/detr-resnet-50",
+            "detection_threshold": 0.9,
+        },
+        "fast": {
+            "caption": "Salesforce/blip-image-captioning-base",
+            "detection": "hustvl/yolos-tiny",
+            "detection_threshold": 0.7,
+        },
+    },
+    # Tier used by each endpoint when the request does not pick one
+    "endpoints": {
+        "upload": "accurate",
+        "websocket": "accurate",
+        "diagnose": "accurate",
+    },
+}
+
+
+class ModelTier(NamedTuple):
+    """The captioning and detection models that make up one speed tier"""
+    name: str
+    caption: str
+    detection: str
+    detection_threshold: float
+
+
+class UnknownTier(ValueError):
+    """Raised when a request asks for a tier that is not configured or not enabled"""
+
+
+class ModelCatalogue:
+    """
+    Speed tiers of vision models, the default tier for each endpoint and
+    the subset of tiers this worker is allowed to load.
+    """
+
+    def __init__(self, config: Dict[str, Any], default_tier: Optional[str] = None, enabled: Optional[List[str]] = None):
+        self.tiers: Dict[str, ModelTier] = {
+            name: ModelTier(
+                name=name,
+                caption=tier["caption"],
+                detection=tier["detection"],
+                detection_threshold=float(tier.get("detection_threshold", 0.9))
+            )
+            for name, tier in config["tiers"].items()
+        }
+        self.default_tier = default_tier or config.get("default_tier") or next(iter(self.tiers))
+        self.endpoints: Dict[str, str] = dict(config.get("endpoints", {}))
+        self.enabled = enabled or sorted({self.default_tier, *self.endpoints.values()})
+
+        for name in [self.default_tier, *self.endpoints.values(), *self.enabled]:
+            if name not in self.tiers:
+                raise ValueError(f"Model catalogue refers to unknown tier: {name}")
+
+    @classmethod
+    def load(cls, path: Optional[str] = MODEL_CATALOGUE) -> "ModelCatalogue":
+        """Build the catalogue from MODEL_CATALOGUE (or the built-in default) and the env overrides"""
+        config = DEFAULT_CATALOGUE
+        if path:
+            with open(path) as f:
+                config = json.load(f)
+            logger.info(f"Loaded model catalogue from {path}")
+        enabled = [name.strip() for name in MODEL_TIERS.split(",") if name.strip()] if MODEL_TIERS else None
+        return cls(config, default_tier=MODEL_TIER, enabled=enabled)
+
+    def resolve(self, tier: Optional[str] = None, endpoint: Optional[str] = None) -> ModelTier:
+        """
+        Pick the tier for a request
+
+        Args:
+            tier: Tier requested by the client, if any
+            endpoint: Endpoint handling the request, for its configured default
+
+        Returns:
+            The selected tier
+
+        Raises:
+            UnknownTier if the tier is not configured or not enabled in this worker
+        """
+        name = tier or self.endpoints.get(endpoint) or self.default_tier
+        if name not in self.tiers:
+            raise UnknownTier(f"Unknown model tier '{name}'; choose one of: {', '.join(self.enabled)}")
+        if name not in self.enabled:
+            raise UnknownTier(f"Model tier '{name}' is not enabled; choose one of: {', '.join(self.enabled)}")
+        return self.tiers[name]
+
+    def enabled_tiers(self) -> List[ModelTier]:
+        return [self.tiers[name] for name in self.enabled]
+
+    def describe(self) -> Dict[str, Any]:
+        """Configured tiers, endpoint defaults and which tiers are enabled"""
+        return {
+            "default_tier": self.default_tier,
+            "enabled": list(self.enabled),
+            "endpoints": dict(self.endpoints),
+            "tiers": {name: tier._asdict() for name, tier in self.tiers.items()},
+        }
+
+
+# Singleton instance shared by the registry, the pipelines and the API
+catalogue = ModelCatalogue.load()
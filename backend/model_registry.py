@@ -0,0 +1,200 @@
+import os
+import time
+import logging
+import functools
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import psutil
+
+from model_catalogue import VISION_BACKEND, ModelTier, catalogue
+
+logger = logging.getLogger(__name__)
+
+# torch, transformers and the inference backends are imported on first use rather
+# than at module import, so the API starts serving before they are loaded
+
+# Device used for all vision models ("cuda" is picked automatically when available).
+# The INT8 and ONNX Runtime backends only run on CPU.
+MODEL_DEVICE = os.getenv("MODEL_DEVICE")
+
+
+def device(backend: str = VISION_BACKEND) -> str:
+    """The device the vision models of an inference backend run on"""
+    if MODEL_DEVICE:
+        return MODEL_DEVICE
+    import torch
+    return "cuda" if torch.cuda.is_available() and backend == "torch" else "cpu"
+
+
+def model_versions(tier: Optional[ModelTier] = None) -> str:
+    """Identifier for the vision models of a tier (the default one if omitted), for keying cached results"""
+    tier = tier or catalogue.resolve()
+    return f"{tier.caption}|{tier.detection}|{tier.detection_threshold}|{VISION_BACKEND}"
+
+
+def _rss_bytes() -> int:
+    """Resident set size of the current process in bytes"""
+    return psutil.Process(os.getpid()).memory_info().rss
+
+
+def _uss_bytes() -> Optional[int]:
+    """Memory private to the current process in bytes, excluding pages shared with other workers"""
+    try:
+        return psutil.Process(os.getpid()).memory_full_info().uss
+    except (psutil.AccessDenied, AttributeError):
+        return None
+
+
+def _load_caption_model(model_name: str, device: str) -> Tuple[Any, Any]:
+    from transformers import AutoProcessor, BlipForConditionalGeneration
+    processor = AutoProcessor.from_pretrained(model_name)
+    model = BlipForConditionalGeneration.from_pretrained(model_name).to(device)
+    return processor, model
+
+
+def _load_detection_model(model_name: str, device: str) -> Tuple[Any, Any]:
+    # DETR, YOLOS and other detectors share the post_process_object_detection API
+    from transformers import AutoImageProcessor, AutoModelForObjectDetection
+    processor = AutoImageProcessor.from_pretrained(model_name)
+    model = AutoModelForObjectDetection.from_pretrained(model_name).to(device)
+    return processor, model
+
+
+class ModelRegistry:
+    """
+    Process-wide cache of the vision models used by the image tools.
+
+    Models are chosen per speed tier from the model catalogue; only the
+    tiers a request actually uses are loaded. Each processor/model pair is
+    loaded at most once per worker (tiers naming the same checkpoint share
+    it), switched to eval mode, converted for the inference ``backend``
+    (see inference_backends.py) and then shared by every request. Load time
+    and the resident memory added by each model are recorded for reporting.
+    """
+
+    def __init__(self, backend: str = VISION_BACKEND):
+        self.backend = backend
+        self._loaders: Dict[str, Callable[[str, str], Tuple[Any, Any]]] = {
+            "caption": _load_caption_model,
+            "detection": _load_detection_model,
+        }
+        self._models: Dict[Tuple[str, str], Tuple[Any, Any]] = {}
+        self._stats: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    @functools.cached_property
+    def device(self) -> str:
+        """Device this registry's models and their inputs are placed on, resolved on first use"""
+        return device(self.backend)
+
+    def get(self, key: str, model_name: str) -> Tuple[Any, Any]:
+        """
+        Return the (processor, model) pair for a model, loading it on first use
+
+        Args:
+            key: Either "caption" or "detection"
+            model_name: Hugging Face model identifier from the catalogue
+
+        Returns:
+            Tuple of (processor, model)
+        """
+        pair = self._models.get((key, model_name))
+        if pair is not None:
+            return pair
+
+        with self._lock:
+            # Another thread may have finished loading while we waited
+            if (key, model_name) not in self._models:
+                self._models[(key, model_name)] = self._load(key, model_name)
+            return self._models[(key, model_name)]
+
+    def _load(self, key: str, model_name: str) -> Tuple[Any, Any]:
+        if key not in self._loaders:
+            raise KeyError(f"Unknown model key: {key}")
+        import torch
+        from inference_backends import apply_backend, model_bytes
+
+        rss_before = _rss_bytes()
+        start = time.perf_counter()
+
+        with torch.inference_mode():
+            processor, model = self._loaders[key](model_name, self.device)
+            model.eval()
+        model = apply_backend(key, model, self.backend)
+
+        load_seconds = time.perf_counter() - start
+        self._stats[f"{key}:{model_name}"] = {
+            "model_name": model_name,
+            "device": self.device,
+            "backend": self.backend,
+            "load_seconds": round(load_seconds, 3),
+            "rss_delta_mb": round((_rss_bytes() - rss_before) / (1024 * 1024), 1),
+            # Weights as the backend holds them: INT8 packed params count one byte each, ONNX graphs their file size
+            "parameter_mb": round(model_bytes(model) / (1024 * 1024), 1),
+        }
+        logger.info(f"Loaded {key} model: {self._stats[f'{key}:{model_name}']}")
+        return processor, model
+
+    def caption(self, tier: Optional[ModelTier] = None) -> Tuple[Any, Any]:
+        """Return the captioning processor and model of a tier (the default one if omitted)"""
+        return self.get("caption", (tier or catalogue.resolve()).caption)
+
+    def detection(self, tier: Optional[ModelTier] = None) -> Tuple[Any, Any]:
+        """Return the object detection processor and model of a tier (the default one if omitted)"""
+        return self.get("detection", (tier or catalogue.resolve()).detection)
+
+    def load_enabled(self) -> Dict[str, Any]:
+        """
+        Load the models of every enabled tier without running them
+
+        Used to load the weights once in a parent process that then forks
+        the workers (see gunicorn.conf.py), so they share the weight pages.
+        The dummy forward passes of warm_up() are left to each worker.
+
+        Returns:
+            Per-model load statistics
+        """
+        for tier in catalogue.enabled_tiers():
+            self.caption(tier)
+            self.detection(tier)
+        return self.stats()
+
+    def warm_up(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Load the models of every enabled tier and run one dummy forward pass
+        so the first real request does not pay for lazy initialisation.
+
+        Returns:
+            Per-model load statistics
+        """
+        import torch
+        from PIL import Image
+
+        blank = Image.new("RGB", (224, 224))
+
+        with torch.inference_mode():
+            for tier in catalogue.enabled_tiers():
+                processor, model = self.caption(tier)
+                inputs = processor(images=blank, return_tensors="pt").to(self.device)
+                model.generate(**inputs, max_new_tokens=1)
+
+                processor, model = self.detection(tier)
+                inputs = processor(images=blank, return_tensors="pt").to(self.device)
+                model(**inputs)
+
+        return self.stats()
+
+    def stats(self) -> Dict[str, Any]:
+        """Load time and memory usage for every model loaded so far"""
+        uss = _uss_bytes()
+        return {
+            "models": dict(self._stats),
+            "process_rss_mb": round(_rss_bytes() / (1024 * 1024), 1),
+            # RSS also counts weights shared with the other workers; USS is what this worker alone holds
+            "process_uss_mb": round(uss / (1024 * 1024), 1) if uss is not None else None,
+        }
+
+
+# Singleton instance shared by modelgpt.py and model_api.py
+registry = ModelRegistry()
@@ -1,25 +1,34 @@
 import os
 import json
 import uuid
+import time
 import base64
+import logging
+import threading
 from typing import Dict, Any, Optional, List
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
-from langchain.agents import initialize_agent
-from langchain.chains.conversation.memory import ConversationBufferMemory
 from langchain.tools import BaseTool
-from transformers import BlipProcessor, BlipForConditionalGeneration, DetrImageProcessor, DetrForObjectDetection
-from PIL import Image
-import torch
-# Add LangSmith imports
-from langsmith import Client
-from langchain.callbacks.tracers.langchain import LangChainTracer
-from langchain.callbacks.manager import CallbackManager
+from image_ingest import IngestedImage, ImageRejected, decode_image
+from vision import caption_images, detect_objects
+from pipeline import describe_image
+from model_catalogue import ModelTier, UnknownTier, catalogue
+from executor import limits
+from result_cache import result_cache, image_digest, diagnosis_key
+from llm_client import llm_client
+from metrics import stage
+from streaming import FinalAnswerStreamHandler, TokenCallback, emit
+from session_store import create_session_store, new_session
+from token_memory import memory_factory, PromptTokenCounter, MEMORY_MODE, SUMMARY_MODEL
+
+logger = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv()
 
+# Include per-stage timings in upload responses unless a request overrides it
+DEBUG_TIMINGS = os.getenv("DEBUG_TIMINGS", "false").lower() == "true"
+
 class ImageCaptionTool(BaseTool):
     name: str = "Image captioner"
     description: str = (
@@ -35,32 +44,20 @@ class ImageCaptionTool(BaseTool):
             if not os.path.exists(img_path):
                 return f"Error: Image file not found at path: {img_path}"
                 
-            image = Image.open(img_path).convert("RGB")
-
-            model_name = "Salesforce/blip-image-captioning-large"
-            device = "cuda" if torch.cuda.is_available() else "cpu"
-
-            processor = BlipProcessor.from_pretrained(model_name)
-            model = BlipForConditionalGeneration.from_pretrained(model_name).to(device)
-
-            inputs = processor(image, return_tensors="pt").to(device)
-            output = model.generate(**inputs, max_new_tokens=20)
-
-            caption = processor.decode(output[0], skip_special_tokens=True)
-
-            return caption
+            return caption_images([decode_image(img_path)])[0]
         except Exception as e:
             return f"Error processing image: {str(e)}"
 
-    def _arun(self, query: str):
-        raise NotImplementedError("This tool does not support async")
+    async def _arun(self, img_path: str) -> str:
+        # Run inference on the bounded thread pool so the event loop stays free
+        return await limits.run_inference(self._run, img_path)
 
 class ObjectDetectionTool(BaseTool):
     name: str = "Object detector"
     description: str = (
         "Use this tool when given the path to an image that you would like to detect objects. "
-        "It will return a list of all detected objects. Each element in the list is in the format: "
-        "[x1, y1, x2, y2] class_name confidence_score."
+        "It will return all detected objects, one per line, in the format: "
+        "[x1,y1,x2,y2] class_name confidence_score."
     )
 
     def _run(self, img_path: str) -> str:
@@ -72,42 +69,28 @@ class ObjectDetectionTool(BaseTool):
             if not os.path.exists(img_path):
                 return f"Error: Image file not found at path: {img_path}"
                 
-            image = Image.open(img_path).convert("RGB")
-
-            processor = DetrImageProcessor.from_pretrained("facebook/detr-resnet-50")
-            model = DetrForObjectDetection.from_pretrained("facebook/detr-resnet-50")
-
-            inputs = processor(images=image, return_tensors="pt")
-            outputs = model(**inputs)
-
-            # Convert outputs (bounding boxes and class logits) to COCO API
-            target_sizes = torch.tensor([image.size[::-1]])
-            results = processor.post_process_object_detection(outputs, target_sizes=target_sizes, threshold=0.9)[0]
-
-            detections = ""
-            for score, label, box in zip(results["scores"], results["labels"], results["boxes"]):
-                detections += "[{}, {}, {}, {}]".format(int(box[0]), int(box[1]), int(box[2]), int(box[3]))
-                detections += " {}".format(model.config.id2label[int(label)])
-                detections += " {}\n".format(float(score))
-
-            return detections
+            return detect_objects([decode_image(img_path)])[0].to_prompt()
         except Exception as e:
             return f"Error detecting objects: {str(e)}"
 
-    def _arun(self, query: str):
-        raise NotImplementedError("This tool does not support async")
+    async def _arun(self, img_path: str) -> str:
+        # Run inference on the bounded thread pool so the event loop stays free
+        return await limits.run_inference(self._run, img_path)
 
 class PlantDiseaseChat:
     def __init__(self):
-        self.api_key = os.getenv("OPENAI_API_KEY")
-        if self.api_key is None:
-            raise ValueError("API Key not set. Please set the OPENAI_API_KEY environment variable.")
+        self.api_key = llm_client.api_key()
         
         # Initialize LangSmith client
         self.langsmith_api_key = os.getenv("LANGCHAIN_API_KEY")
         self.langsmith_project = os.getenv("LANGCHAIN_PROJECT", "plant-disease-diagnosis")
         
         if self.langsmith_api_key:
+            # Imported here so workers without tracing never load LangSmith
+            from langsmith import Client
+            from langchain.callbacks.tracers.langchain import LangChainTracer
+            from langchain.callbacks.manager import CallbackManager
+
             # Set LangSmith environment variables
             os.environ["LANGCHAIN_TRACING_V2"] = "true"
             os.environ["LANGCHAIN_PROJECT"] = self.langsmith_project
@@ -122,48 +105,64 @@ class PlantDiseaseChat:
             print("Warning: LANGCHAIN_API_KEY not set. LangSmith tracing is disabled.")
         
         # Initialize OpenAI model with GPT-4o which has vision capabilities
-        self.llm = ChatOpenAI(
-            api_key=self.api_key, 
-            model="gpt-4o",  # Using GPT-4o which has vision capabilities
+        # Both models share the process-wide OpenAI connection pool
+        self.llm = llm_client.chat_model(
+            "gpt-4o",  # Using GPT-4o which has vision capabilities
             temperature=0.7,
             max_tokens=1024,
+            streaming=True,  # Lets callers forward tokens as they arrive
+            # No response cache: a cache hit emits no tokens, which would turn
+            # streamed answers into a single final message
             callbacks=[self.tracer] if self.tracer else None
         )
         
+        # Cheaper deterministic model that folds old chat turns into a running summary
+        self.summary_llm = llm_client.chat_model(
+            SUMMARY_MODEL,
+            temperature=0,
+            max_tokens=256
+        )
+        self.memory_factory = memory_factory(self.summary_llm)
+        
         # Initialize tools
         self.tools = [ImageCaptionTool(), ObjectDetectionTool()]
         
-        # Setup persistent conversation memory
-        self.sessions = {}
+        # Bounded session store (see SESSION_BACKEND) holding only per-session history
+        self.store = create_session_store(memory_factory=self.memory_factory)
+        
+        # One agent executor shared by every session, built on the first chat message
+        self._agent = None
+    
+    def has_session(self, session_id: str) -> bool:
+        """Check whether a session exists and has not expired"""
+        return self.store.exists(session_id)
     
     def _get_or_create_session(self, session_id: str) -> Dict:
         """Get existing session or create a new one"""
-        if session_id not in self.sessions:
-            self.sessions[session_id] = {
-                "memory": ConversationBufferMemory(
-                    memory_key='chat_history',
-                    return_messages=True
-                ),
-                "agent": None,
-                "image_path": None,
-                "initial_diagnosis": None,
-                "run_ids": []  # For LangSmith tracking
-            }
-            
-            # Initialize agent with memory and tracer
-            self.sessions[session_id]["agent"] = initialize_agent(
+        session = self.store.load(session_id)
+        if session is None:
+            session = new_session(self.memory_factory)
+            self.store.save(session_id, session)
+        return session
+    
+    def _get_agent(self):
+        """Return the shared agent executor, building it on first use"""
+        if self._agent is None:
+            # langchain.agents pulls in every agent type; importing it here keeps startup fast
+            from langchain.agents import initialize_agent
+
+            # No memory is bound here; each call passes the session's chat_history
+            self._agent = initialize_agent(
                 agent="chat-conversational-react-description",
                 tools=self.tools,
                 llm=self.llm,
                 max_iterations=5,
                 verbose=True,
-                memory=self.sessions[session_id]["memory"],
                 early_stopping_method='generate',
                 handle_parsing_errors=True,
                 callbacks=[self.tracer] if self.tracer else None
             )
-            
-        return self.sessions[session_id]
+        return self._agent
     
     def _parse_response_for_ui(self, response_text: str) -> str:
         """Format the response for UI display"""
@@ -220,7 +219,10 @@ class PlantDiseaseChat:
         self, 
         session_id: str,
         image_path: str, 
-        symptoms: Optional[str] = None
+        symptoms: Optional[str] = None,
+        on_token: Optional[TokenCallback] = None,
+        image: Optional[IngestedImage] = None,
+        tier: Optional[ModelTier] = None
     ) -> str:
         """
         Process a plant image and initialize a chat session
@@ -229,20 +231,26 @@ class PlantDiseaseChat:
             session_id: Unique identifier for the chat session
             image_path: Path to the uploaded image
             symptoms: Optional description of symptoms
+            on_token: Optional coroutine called with each piece of the diagnosis as it streams
+            image: The already decoded image, to avoid decoding image_path again
+            tier: Vision model tier to use (defaults to the catalogue's default tier)
             
         Returns:
             Formatted response for the user
         """
-        # Validate image path
-        if not os.path.exists(image_path):
+        # Validate image path (an in-memory upload may not have been written yet)
+        if image is None and not os.path.exists(image_path):
             return f"Error: Image file not found at path: {image_path}"
         
         try:
-            # Test image loading before proceeding
-            Image.open(image_path).convert("RGB")
+            # Decode once; the same pixels feed hashing and both vision stages
+            if image is None:
+                with stage("upload", "decode"):
+                    image = await limits.run_inference(decode_image, image_path)
         except Exception as e:
             return f"Error loading image: {str(e)}. Please ensure the file is a valid image."
         
+        tier = tier or catalogue.resolve()
         session = self._get_or_create_session(session_id)
         session["image_path"] = image_path
         
@@ -253,12 +261,28 @@ class PlantDiseaseChat:
             """
         
         try:
-            # Normalize the image path for cross-platform compatibility
-            normalized_path = os.path.normpath(image_path).replace("\\", "/")
-            
-            # Use the image tools to get descriptions
-            caption = self.tools[0]._run(normalized_path)
-            objects = self.tools[1]._run(normalized_path)
+            # Identical photos (same decoded pixels and symptoms) reuse earlier results
+            with stage("upload", "digest"):
+                digest = await limits.run_inference(image_digest, image)
+            cache_key = diagnosis_key("chat", digest, symptoms, self.llm.model_name, tier)
+            cached = result_cache.get(cache_key)
+            
+            if cached is not None:
+                session["timings"] = {"cache": "hit"}
+                session["detections"] = cached["detections"]
+                session["memory"].chat_memory.add_user_message(f"I'm having issues with my plant. Symptoms: {symptoms}")
+                session["initial_diagnosis"] = cached["diagnosis"]
+                session["memory"].chat_memory.add_ai_message(cached["diagnosis"])
+                self.store.save(session_id, session)
+                await emit(on_token, cached["diagnosis"])
+                with stage("upload", "parse"):
+                    return self._parse_response_for_ui(cached["diagnosis"])
+            
+            # Caption and detect objects, reusing results for exact or near-duplicate photos
+            with stage("upload", "vision"):
+                caption, detections, timings = await describe_image(image, digest, tier)
+            session["timings"] = timings
+            session["detections"] = detections.to_list()
             
             # Create a comprehensive prompt with the tool outputs
             enhanced_prompt = f"""
@@ -269,7 +293,8 @@ class PlantDiseaseChat:
             
             Image caption: {caption}
             
-            Detected objects: {objects}
+            Detected objects ([x1,y1,x2,y2] label score):
+            {detections.to_prompt()}
             
             Based on this information, provide a detailed analysis of:
             1. Possible disease diagnosis
@@ -283,41 +308,64 @@ class PlantDiseaseChat:
             session["memory"].chat_memory.add_user_message(f"I'm having issues with my plant. Symptoms: {symptoms}")
             
             # Process with direct LLM call - LangSmith will trace this automatically
-            response = self.llm.invoke(enhanced_prompt)
+            llm_start = time.perf_counter()
+            with stage("upload", "llm"):
+                async with limits.llm_slot():
+                    if on_token is None:
+                        response = await self.llm.ainvoke(enhanced_prompt)
+                    else:
+                        response = None
+                        async for chunk in self.llm.astream(enhanced_prompt):
+                            response = chunk if response is None else response + chunk
+                            await emit(on_token, chunk.content)
+            timings["llm_ms"] = round((time.perf_counter() - llm_start) * 1000, 1)
             output_text = response.content
             
+            result_cache.set(cache_key, {
+                "caption": caption,
+                "detections": session["detections"],
+                "diagnosis": output_text
+            })
+            
             # Store the diagnosis in memory and save it separately
             session["initial_diagnosis"] = output_text
             session["memory"].chat_memory.add_ai_message(output_text)
             
             # Format the response for the UI
-            formatted_response = self._parse_response_for_ui(output_text)
+            with stage("upload", "parse"):
+                formatted_response = self._parse_response_for_ui(output_text)
             
             # Save the run_id if it was provided in the response metadata
             if hasattr(response, 'metadata') and response.metadata.get('run_id'):
                 session["run_ids"].append(response.metadata['run_id'])
             
+            self.store.save(session_id, session)
             return formatted_response
             
         except Exception as e:
             return f"Error analyzing plant image: {str(e)}"
     
-    async def chat(self, session_id: str, message: str) -> str:
+    async def chat(
+        self,
+        session_id: str,
+        message: str,
+        on_token: Optional[TokenCallback] = None
+    ) -> str:
         """
         Handle follow-up questions in the chat session
         
         Args:
             session_id: Unique identifier for the chat session
             message: User's follow-up question
+            on_token: Optional coroutine called with each piece of the answer as it streams
             
         Returns:
             Assistant's response
         """
         # Validate session
-        if session_id not in self.sessions:
+        session = self.store.load(session_id)
+        if session is None:
             return "Error: Session not found. Please start a new session by uploading a plant image."
-            
-        session = self._get_or_create_session(session_id)
         
         # Check if we have an image for this session
         if not session["image_path"]:
@@ -328,28 +376,45 @@ class PlantDiseaseChat:
             return "Error: The previously uploaded image is no longer available. Please upload a new image."
         
         try:
-            # Add the user's message to memory
-            session["memory"].chat_memory.add_user_message(message)
-            
-            # Create a context-aware follow-up prompt
-            initial_diagnosis = session.get("initial_diagnosis", "No initial diagnosis available.")
+            # The budgeted memory already carries the diagnosis (verbatim or summarized),
+            # so only the unbounded buffer mode needs it repeated in every input
+            agent_input = f"The user's latest question is: {message}"
+            if MEMORY_MODE == "buffer":
+                initial_diagnosis = session.get("initial_diagnosis", "No initial diagnosis available.")
+                agent_input = f"""The user's latest question is: {message}
+                    
+                    Remember the initial plant diagnosis was: {initial_diagnosis}
+                    """
             
             # Use the agent for follow-up instead of direct LLM calls
             # This will properly maintain conversation context
-            response = session["agent"].run(
-                input=f"""The user's latest question is: {message}
-                
-                Remember the initial plant diagnosis was: {initial_diagnosis}
-                """
-            )
-            
-            # Add the response to memory
-            session["memory"].chat_memory.add_ai_message(response)
+            token_counter = PromptTokenCounter(self.llm)
+            callbacks = [token_counter]
+            if on_token is not None:
+                callbacks.append(FinalAnswerStreamHandler(on_token))
+            memory = session["memory"]
+            with stage("chat", "memory_load"):
+                history = (await memory.aload_memory_variables({}))["chat_history"]
+            with stage("chat", "agent"):
+                async with limits.llm_slot():
+                    result = await self._get_agent().ainvoke(
+                        {"input": agent_input, "chat_history": history},
+                        config={"callbacks": callbacks}
+                    )
+            response = result["output"]
+            
+            # Record the turn in the session's own memory (this may fold old turns into the summary)
+            with stage("chat", "memory_save"):
+                await memory.asave_context({"input": agent_input}, {"output": response})
+            
+            session["prompt_tokens"].append(token_counter.total)
+            logger.debug(f"Session {session_id} turn {len(session['prompt_tokens'])}: {token_counter.total} prompt tokens")
             
             # Save the run_id if available from agent
             if hasattr(response, 'metadata') and response.metadata and response.metadata.get('run_id'):
                 session["run_ids"].append(response.metadata['run_id'])
             
+            self.store.save(session_id, session)
             return response
             
         except Exception as e:
@@ -395,32 +460,92 @@ class PlantDiseaseChat:
             print(f"Error logging feedback: {str(e)}")
             return False
 
-# Singleton instance for use in the FastAPI app
-plant_chat = PlantDiseaseChat()
+# Singleton instance for use in the FastAPI app, built on first use (see get_plant_chat)
+_plant_chat: Optional[PlantDiseaseChat] = None
+_plant_chat_lock = threading.Lock()
+
+
+def get_plant_chat() -> PlantDiseaseChat:
+    """
+    Return the shared PlantDiseaseChat, creating it on the first call
+
+    The app builds it in the background at startup; a request arriving
+    before that finishes builds it (or waits for it) here instead.
+
+    Raises:
+        ValueError if OPENAI_API_KEY is not set
+    """
+    global _plant_chat
+    if _plant_chat is None:
+        with _plant_chat_lock:
+            if _plant_chat is None:
+                _plant_chat = PlantDiseaseChat()
+    return _plant_chat
+
+
+def plant_chat_ready() -> bool:
+    """Whether the shared PlantDiseaseChat has been created"""
+    return _plant_chat is not None
 
 # Function to use in FastAPI app
-async def handle_image_upload(file_path: str, symptoms: Optional[str] = None) -> Dict[str, Any]:
+async def handle_image_upload(
+    file_path: str,
+    symptoms: Optional[str] = None,
+    debug: Optional[bool] = None,
+    session_id: Optional[str] = None,
+    on_token: Optional[TokenCallback] = None,
+    image_bytes: Optional[bytes] = None,
+    tier: Optional[str] = None,
+    endpoint: str = "upload",
+    stored_path: Optional[str] = None
+) -> Dict[str, Any]:
     """
     Process an uploaded image and start a new chat session
     
     Args:
-        file_path: Path to the uploaded image file
+        file_path: Path to the uploaded image file (where it will be stored when image_bytes is given)
         symptoms: Optional description of symptoms
+        debug: Include per-stage timings in the result (defaults to DEBUG_TIMINGS)
+        session_id: Session to start; a new one is generated when omitted
+        on_token: Optional coroutine called with each piece of the diagnosis as it streams
+        image_bytes: Raw upload to decode in memory instead of reading file_path
+        tier: Vision model tier requested by the client ("fast", "accurate", ...)
+        endpoint: Endpoint name, whose configured tier applies when none is requested
+        stored_path: File the chat tools read the image from in follow-up turns
+            (defaults to file_path; the caller makes sure it exists)
         
     Returns:
-        Dictionary with session_id and initial response
+        Dictionary with session_id, initial response, detected objects and the model tier used
     """
+    start = time.perf_counter()
+    if debug is None:
+        debug = DEBUG_TIMINGS
+        
     try:
+        try:
+            model_tier = catalogue.resolve(tier, endpoint)
+        except UnknownTier as e:
+            return {
+                "success": False,
+                "error": str(e)
+            }
+        
         # Validate the file path
-        if not os.path.exists(file_path):
+        if image_bytes is None and not os.path.exists(file_path):
             return {
                 "success": False,
                 "error": f"Error: Image file not found at path: {file_path}"
             }
             
-        # Ensure the file is a valid image
+        # Ensure the file is a valid image, keeping the decoded result for the pipeline
         try:
-            Image.open(file_path).convert("RGB")
+            with stage("upload", "decode"):
+                image = await limits.run_inference(decode_image, file_path if image_bytes is None else image_bytes)
+        except ImageRejected as e:
+            return {
+                "success": False,
+                "error": str(e)
+            }
         except Exception as e:
             return {
                 "success": False,
@@ -428,20 +553,35 @@ async def handle_image_upload(file_path: str, symptoms: Optional[str] = None) ->
             }
             
         # Generate a unique session ID
-        session_id = str(uuid.uuid4())
+        if session_id is None:
+            session_id = str(uuid.uuid4())
         
         # Process the image
+        plant_chat = get_plant_chat()
         response = await plant_chat.process_image(
             session_id=session_id,
-            image_path=file_path,
-            symptoms=symptoms
+            image_path=stored_path or file_path,
+            symptoms=symptoms,
+            on_token=on_token,
+            image=image,
+            tier=model_tier
         )
         
-        return {
+        session = plant_chat.store.load(session_id) or {}
+        result = {
             "success": True,
             "session_id": session_id,
-            "response": response
+            "response": response,
+            "detections": session.get("detections") or [],
+            "model_tier": model_tier.name
         }
+        
+        if debug:
+            timings = dict(session.get("timings", {}))
+            timings["total_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            result["timings"] = timings
+        
+        return result
     except Exception as e:
         return {
             "success": False,
@@ -449,30 +589,40 @@ async def handle_image_upload(file_path: str, symptoms: Optional[str] = None) ->
         }
 
 # Function to handle chat messages
-async def handle_chat_message(session_id: str, message: str) -> Dict[str, Any]:
+async def handle_chat_message(
+    session_id: str,
+    message: str,
+    on_token: Optional[TokenCallback] = None
+) -> Dict[str, Any]:
     """
     Handle a chat message in an existing session
     
     Args:
         session_id: Unique identifier for the chat session
         message: User's message
+        on_token: Optional coroutine called with each piece of the answer as it streams
         
     Returns:
         Dictionary with the assistant's response
     """
     try:
+        plant_chat = get_plant_chat()
+
         # Validate session_id
-        if not session_id or session_id not in plant_chat.sessions:
+        if not session_id or not plant_chat.has_session(session_id):
             return {
                 "success": False,
                 "error": "Invalid session ID. Please start a new session by uploading a plant image."
             }
             
-        response = await plant_chat.chat(session_id, message)
+        response = await plant_chat.chat(session_id, message, on_token=on_token)
+        session = plant_chat.store.load(session_id) or {}
+        prompt_tokens = session.get("prompt_tokens") or [None]
         
         return {
             "success": True,
-            "response": response
+            "response": response,
+            "prompt_tokens": prompt_tokens[-1]
         }
     except Exception as e:
         return {
@@ -495,7 +645,7 @@ async def handle_feedback(session_id: str, message_id: str, feedback: Dict[str,
     """
     try:
         # Log feedback to LangSmith
-        success = plant_chat.log_feedback(session_id, message_id, feedback)
+        success = get_plant_chat().log_feedback(session_id, message_id, feedback)
         
         return {
             "success": success
@@ -0,0 +1,194 @@
+import os
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from PIL import Image
+
+from model_registry import model_versions
+from model_catalogue import ModelTier
+from result_cache import result_cache
+
+logger = logging.getLogger(__name__)
+
+# Maximum Hamming distance between 64-bit hashes for two images to count as the same photo
+PHASH_MAX_DISTANCE = int(os.getenv("PHASH_MAX_DISTANCE", "6"))
+
+# Set PHASH_ENABLED=false to only reuse results for exact pixel matches
+PHASH_ENABLED = os.getenv("PHASH_ENABLED", "true").lower() == "true"
+
+# Hashes indexed per set of vision models; the oldest quarter is dropped when it is exceeded.
+# Indexed results live in result_cache, so by default the index holds no more hashes than
+# the cache can hold results; beyond that most matches would point at evicted entries
+PHASH_MAX_ENTRIES = int(os.getenv("PHASH_MAX_ENTRIES", "0")) or result_cache.capacity
+
+
+def dhash(image: Image.Image, hash_size: int = 8) -> int:
+    """
+    Difference hash of an image.
+
+    The image is reduced to a (hash_size + 1) x hash_size grayscale grid
+    and each bit records whether a pixel is brighter than its right-hand
+    neighbour. Re-encoding, resizing and small colour shifts leave most
+    bits unchanged.
+
+    Args:
+        image: Decoded image
+        hash_size: Grid height; the hash has hash_size * hash_size bits
+
+    Returns:
+        The hash as an integer
+    """
+    # reducing_gap lets Pillow shrink large photos cheaply before resampling
+    small = image.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR, reducing_gap=2.0)
+    pixels = list(small.getdata())
+
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over integer hashes with Hamming distance.
+
+    Each child edge is labelled with its distance to the parent, so a
+    radius query only descends into edges within ``radius`` of the query's
+    distance to the current node. For small radii this visits a small
+    fraction of the tree.
+    """
+
+    def __init__(self):
+        # Node layout: [hash, payload, {distance: child}]
+        self._root: Optional[List[Any]] = None
+        self.size = 0
+
+    def add(self, value: int, payload: Any):
+        if self._root is None:
+            self._root = [value, payload, {}]
+            self.size = 1
+            return
+
+        node = self._root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                # Same hash already indexed; keep the newest result
+                node[1] = payload
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, payload, {}]
+                self.size += 1
+                return
+            node = child
+
+    def nearest(self, value: int, radius: int) -> Optional[Tuple[int, Any]]:
+        """
+        Find the closest indexed hash within a radius
+
+        Args:
+            value: Query hash
+            radius: Maximum Hamming distance
+
+        Returns:
+            Tuple of (distance, payload), or None if nothing is close enough
+        """
+        if self._root is None:
+            return None
+
+        best: Optional[Tuple[int, Any]] = None
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= radius and (best is None or distance < best[0]):
+                best = (distance, node[1])
+                if distance == 0:
+                    break
+            for edge, child in node[2].items():
+                if distance - radius <= edge <= distance + radius:
+                    stack.append(child)
+        return best
+
+
+class PerceptualIndex:
+    """
+    Near-duplicate lookup for vision results, with one BK-tree per set of
+    vision models so results from different models are never mixed.
+
+    The trees only hold each hash and the result cache key of its vision
+    result; the result itself is read from result_cache, so its TTL and
+    LRU eviction also bound what the index can return. Each tree keeps at
+    most ``max_entries`` hashes, and is rebuilt from the newest ones when
+    it grows past that.
+    """
+
+    def __init__(self, max_distance: int = PHASH_MAX_DISTANCE, max_entries: int = PHASH_MAX_ENTRIES):
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        self._trees: Dict[str, BKTree] = {}
+        # Hash -> result cache key per tree, oldest first
+        self._entries: Dict[str, "OrderedDict[int, str]"] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.rebuilds = 0
+
+    def lookup(self, phash: int, tier: Optional[ModelTier] = None) -> Optional[Any]:
+        """Return the cached vision result of the nearest near-duplicate, if it is still cached"""
+        with self._lock:
+            tree = self._trees.get(model_versions(tier))
+            match = tree.nearest(phash, self.max_distance) if tree is not None else None
+        payload = result_cache.get(match[1]) if match is not None else None
+        with self._lock:
+            if payload is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return payload
+
+    def add(self, phash: int, cache_key: str, tier: Optional[ModelTier] = None):
+        """Index a hash whose vision result is stored in result_cache under cache_key"""
+        versions = model_versions(tier)
+        with self._lock:
+            entries = self._entries.setdefault(versions, OrderedDict())
+            entries[phash] = cache_key
+            entries.move_to_end(phash)
+            if len(entries) <= self.max_entries:
+                self._trees.setdefault(versions, BKTree()).add(phash, cache_key)
+                return
+
+            for _ in range(len(entries) - self.max_entries * 3 // 4):
+                entries.popitem(last=False)
+            tree = BKTree()
+            for value, key in entries.items():
+                tree.add(value, key)
+            self._trees[versions] = tree
+            self.rebuilds += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": PHASH_ENABLED,
+                "max_distance": self.max_distance,
+                "entries": sum(tree.size for tree in self._trees.values()),
+                "max_entries": self.max_entries,
+                "rebuilds": self.rebuilds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0,
+            }
+
+
+# Singleton instance shared by both diagnosis pipelines
+perceptual_index = PerceptualIndex()
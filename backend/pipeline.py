@@ -0,0 +1,55 @@
+from typing import Any, Dict, Tuple
+
+from batching import analyze_image
+from executor import limits
+from result_cache import result_cache, vision_key
+from phash_index import perceptual_index, dhash, PHASH_ENABLED
+from image_ingest import IngestedImage
+from model_catalogue import ModelTier
+from detections import Detections
+
+
+async def describe_image(image: IngestedImage, digest: str, tier: ModelTier) -> Tuple[str, Detections, Dict[str, Any]]:
+    """
+    Caption and detect objects in an image, reusing earlier results when
+    the same photo (exact pixels) or a near-duplicate (perceptual hash)
+    has already been analysed.
+
+    Args:
+        image: Decoded upload
+        digest: Content hash of the decoded image from image_digest()
+        tier: Model tier to run (results are never shared across tiers)
+
+    Returns:
+        Tuple of (caption, detected objects, per-stage timings)
+    """
+    vision = result_cache.get(vision_key(digest, tier))
+    if vision is not None:
+        return vision["caption"], _detections_for(vision, image), {"vision_cache": "exact"}
+
+    phash = None
+    if PHASH_ENABLED:
+        phash = await limits.run_inference(dhash, image.image)
+        match = perceptual_index.lookup(phash, tier)
+        if match is not None:
+            # The match may be a resized copy, so its boxes are moved to this image's size
+            detections = _detections_for(match, image)
+            vision = {"caption": match["caption"], "detections": detections.to_list(), "size": list(image.original_size)}
+            result_cache.set(vision_key(digest, tier), vision)
+            return vision["caption"], detections, {"vision_cache": "near_duplicate"}
+
+    caption, detections, timings = await analyze_image(image, tier)
+    vision = {"caption": caption, "detections": detections.to_list(), "size": list(image.original_size)}
+    result_cache.set(vision_key(digest, tier), vision)
+    if phash is not None:
+        perceptual_index.add(phash, vision_key(digest, tier), tier)
+
+    return caption, detections, timings
+
+
+def _detections_for(vision: Dict[str, Any], image: IngestedImage) -> Detections:
+    """Cached detections in the pixel space of image (results cached without a size are used as is)"""
+    detections = Detections.from_list(vision["detections"])
+    if "size" not in vision:
+        return detections
+    return detections.rescaled(vision["size"], image.original_size)
@@ -0,0 +1,296 @@
+import os
+import io
+import json
+import time
+import uuid
+import random
+import shutil
+import pstats
+import asyncio
+import cProfile
+import logging
+import functools
+import threading
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Fraction of upload and diagnose requests profiled; 0 disables profiling entirely
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILING_ENABLED = PROFILE_SAMPLE_RATE > 0
+
+# Where profiles are written, and how many of the newest are kept
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "100"))
+
+# Also record a torch profiler op breakdown of the BLIP and DETR forwards
+PROFILE_TORCH = os.getenv("PROFILE_TORCH", "true").lower() == "true"
+
+# Functions and torch ops listed in the text summary
+_SUMMARY_ROWS = 40
+
+# Files a stored profile may contain
+PROFILE_FILES = ("summary.txt", "loop.prof", "workers.prof", "meta.json")
+
+_current: ContextVar[Optional["RequestProfile"]] = ContextVar("request_profile", default=None)
+
+# cProfile allows one profiler per thread, and the torch profiler one per process
+_loop_profiler_busy = False
+_torch_lock = threading.Lock()
+
+
+def _start(profiler: cProfile.Profile) -> bool:
+    """Enable a profiler; False if another one is already active where it would run"""
+    try:
+        profiler.enable()
+        return True
+    except ValueError:
+        # Python 3.12+ allows a single active cProfile per process
+        return False
+
+
+class RequestProfile:
+    """
+    Profiles gathered for one sampled request.
+
+    ``loop`` profiles the event loop thread while the request runs (so it
+    also sees other coroutines interleaved with it). Work the request hands
+    to the inference pool (decoding, hashing and every vision batch that
+    includes its image) is profiled in the worker thread and collected in
+    ``workers``; vision batches also add a torch op table.
+    """
+
+    def __init__(self, endpoint: str):
+        self.id = uuid.uuid4().hex
+        self.endpoint = endpoint
+        self.started = time.time()
+        self.duration_ms: Optional[float] = None
+        self.loop: Optional[cProfile.Profile] = None
+        self.workers: List[cProfile.Profile] = []
+        self.torch_tables: List[Tuple[str, int, str]] = []
+        self._lock = threading.Lock()
+
+    def add_worker(self, profiler: cProfile.Profile):
+        with self._lock:
+            self.workers.append(profiler)
+
+    def add_torch_table(self, batch: str, size: int, table: str):
+        with self._lock:
+            self.torch_tables.append((batch, size, table))
+
+    def wrap(self, fn: Callable[..., Any]) -> Callable[..., Any]:
+        """Profile fn in whichever thread ends up running it"""
+        @functools.wraps(fn)
+        def profiled(*args: Any) -> Any:
+            profiler = cProfile.Profile()
+            if not _start(profiler):
+                return fn(*args)
+            try:
+                return fn(*args)
+            finally:
+                profiler.disable()
+                self.add_worker(profiler)
+        return profiled
+
+    def meta(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "endpoint": self.endpoint,
+            "started": self.started,
+            "duration_ms": self.duration_ms,
+            "loop_profiled": self.loop is not None,
+            "worker_calls": len(self.workers),
+            "torch_batches": [f"{batch} ({size} images)" for batch, size, _ in self.torch_tables],
+        }
+
+
+def current_profile() -> Optional[RequestProfile]:
+    """The profile of the request being handled, or None when it is not sampled"""
+    return _current.get() if PROFILING_ENABLED else None
+
+
+def _run_profiled(profiler: cProfile.Profile, fn: Callable[..., Any], *args: Any) -> Tuple[Any, bool]:
+    if not _start(profiler):
+        return fn(*args), False
+    try:
+        return fn(*args), True
+    finally:
+        profiler.disable()
+
+
+def profile_batch(name: str, batch_fn: Callable[[List[Any]], List[Any]], profiles: List[RequestProfile]) -> Callable[[List[Any]], List[Any]]:
+    """
+    Wrap a vision batch that contains images from sampled requests
+
+    The batch runs under cProfile and, when PROFILE_TORCH is set and no
+    other batch holds the torch profiler, under torch.profiler too. Both
+    results are attached to every sampled request in the batch.
+    """
+    def run(items: List[Any]) -> List[Any]:
+        profiler = cProfile.Profile()
+        use_torch = PROFILE_TORCH and _torch_lock.acquire(blocking=False)
+        try:
+            if use_torch:
+                import torch
+                with torch.profiler.profile(activities=[torch.profiler.ProfilerActivity.CPU]) as torch_profile:
+                    results, profiled = _run_profiled(profiler, batch_fn, items)
+                table = torch_profile.key_averages().table(sort_by="self_cpu_time_total", row_limit=_SUMMARY_ROWS)
+            else:
+                results, profiled = _run_profiled(profiler, batch_fn, items)
+        finally:
+            if use_torch:
+                _torch_lock.release()
+
+        for profile in profiles:
+            if profiled:
+                profile.add_worker(profiler)
+            if use_torch:
+                profile.add_torch_table(name, len(items), table)
+        return results
+    return run
+
+
+@asynccontextmanager
+async def profile_request(endpoint: str):
+    """Profile the enclosed request with probability PROFILE_SAMPLE_RATE"""
+    global _loop_profiler_busy
+    if not PROFILING_ENABLED or random.random() >= PROFILE_SAMPLE_RATE:
+        yield None
+        return
+
+    profile = RequestProfile(endpoint)
+    token = _current.set(profile)
+    if not _loop_profiler_busy:
+        loop_profiler = cProfile.Profile()
+        if _start(loop_profiler):
+            _loop_profiler_busy = True
+            profile.loop = loop_profiler
+    start = time.perf_counter()
+    try:
+        yield profile
+    finally:
+        if profile.loop is not None:
+            profile.loop.disable()
+            _loop_profiler_busy = False
+        profile.duration_ms = round((time.perf_counter() - start) * 1000, 1)
+        _current.reset(token)
+        try:
+            await asyncio.to_thread(profile_store.save, profile)
+            logger.info(f"Stored profile {profile.id} of {endpoint} ({profile.duration_ms} ms)")
+        except Exception as e:
+            logger.warning(f"Could not store profile {profile.id}: {str(e)}")
+
+
+def profiled(endpoint: str):
+    """
+    Decorator sampling an endpoint for profiling
+
+    Returns the endpoint unchanged when profiling is disabled, so it adds
+    no overhead at all unless PROFILE_SAMPLE_RATE is set.
+    """
+    def decorate(fn):
+        if not PROFILING_ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            async with profile_request(endpoint):
+                return await fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def _stats(profilers: List[cProfile.Profile]) -> Optional[pstats.Stats]:
+    stats = None
+    for profiler in profilers:
+        try:
+            if stats is None:
+                stats = pstats.Stats(profiler)
+            else:
+                stats.add(profiler)
+        except TypeError:
+            # Raised for a profiler that recorded no calls
+            continue
+    return stats
+
+
+def _stats_text(stats: pstats.Stats) -> str:
+    out = io.StringIO()
+    stats.stream = out
+    stats.sort_stats("cumulative").print_stats(_SUMMARY_ROWS)
+    return out.getvalue()
+
+
+class ProfileStore:
+    """Profiles on disk, one directory per sampled request, newest PROFILE_KEEP kept"""
+
+    def __init__(self, directory: str = PROFILE_DIR, keep: int = PROFILE_KEEP):
+        self.directory = directory
+        self.keep = keep
+
+    def save(self, profile: RequestProfile):
+        path = os.path.join(self.directory, profile.id)
+        os.makedirs(path, exist_ok=True)
+
+        sections = [f"{profile.endpoint} request, {profile.duration_ms} ms\n"]
+        loop_stats = _stats([profile.loop] if profile.loop is not None else [])
+        if loop_stats is not None:
+            loop_stats.dump_stats(os.path.join(path, "loop.prof"))
+            sections.append("=== Event loop thread ===\n" + _stats_text(loop_stats))
+        worker_stats = _stats(profile.workers)
+        if worker_stats is not None:
+            worker_stats.dump_stats(os.path.join(path, "workers.prof"))
+            sections.append("=== Inference threads ===\n" + _stats_text(worker_stats))
+        for batch, size, table in profile.torch_tables:
+            sections.append(f"=== torch ops: {batch} batch of {size} ===\n{table}\n")
+
+        with open(os.path.join(path, "summary.txt"), "w") as f:
+            f.write("\n".join(sections))
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump(profile.meta(), f)
+        self._prune()
+
+    def _prune(self):
+        entries = sorted(
+            (entry for entry in os.scandir(self.directory) if entry.is_dir()),
+            key=lambda entry: entry.stat().st_mtime,
+            reverse=True
+        )
+        for entry in entries[self.keep:]:
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+    def list(self) -> List[Dict[str, Any]]:
+        """Metadata of the stored profiles, newest first"""
+        if not os.path.isdir(self.directory):
+            return []
+        profiles = []
+        for entry in os.scandir(self.directory):
+            try:
+                with open(os.path.join(entry.path, "meta.json")) as f:
+                    profiles.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return sorted(profiles, key=lambda meta: meta["started"], reverse=True)
+
+    def path(self, profile_id: str, filename: str) -> Optional[str]:
+        """
+        Location of one file of a stored profile
+
+        Returns:
+            The file path, or None if the id is malformed, the file name is
+            not one a profile contains, or the profile has been pruned
+        """
+        try:
+            profile_id = uuid.UUID(hex=profile_id).hex
+        except ValueError:
+            return None
+        if filename not in PROFILE_FILES:
+            return None
+        path = os.path.join(self.directory, profile_id, filename)
+        return path if os.path.exists(path) else None
+
+
+# Singleton instance shared by the profiled endpoints and the admin API
+profile_store = ProfileStore()
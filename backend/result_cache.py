@@ -0,0 +1,226 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from model_registry import model_versions
+from model_catalogue import ModelTier
+from image_ingest import IngestedImage
+
+logger = logging.getLogger(__name__)
+
+# In-memory tier size and entry lifetime
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "1024"))
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", str(24 * 60 * 60)))
+
+# Optional on-disk tier; leave RESULT_CACHE_DB unset to keep the cache in memory only
+RESULT_CACHE_DB = os.getenv("RESULT_CACHE_DB")
+RESULT_CACHE_DISK_ENTRIES = int(os.getenv("RESULT_CACHE_DISK_ENTRIES", "100000"))
+
+# How many disk writes happen between eviction sweeps
+_DISK_EVICT_EVERY = 100
+
+# Part of every key; bump it whenever the shape of cached values changes
+_SCHEMA_VERSION = 2
+
+
+def image_digest(image: IngestedImage) -> str:
+    """
+    Hash the decoded pixels of an image, so the same photo saved with
+    different metadata or file names maps to the same key
+
+    Args:
+        image: Decoded image
+
+    Returns:
+        Hex SHA-256 digest
+    """
+    digest = hashlib.sha256()
+    digest.update(f"RGB:{image.size[0]}x{image.size[1]}:".encode())
+    digest.update(image.array.tobytes())
+    return digest.hexdigest()
+
+
+def vision_key(digest: str, tier: ModelTier) -> str:
+    """Cache key for the caption and detections of an image"""
+    return f"vision:v{_SCHEMA_VERSION}:{model_versions(tier)}:{digest}"
+
+
+def diagnosis_key(pipeline: str, digest: str, symptoms: Optional[str], llm_model: str, tier: ModelTier) -> str:
+    """Cache key for a full diagnosis of an image with the given symptoms"""
+    normalized = " ".join((symptoms or "").split()).lower()
+    symptoms_hash = hashlib.sha256(normalized.encode()).hexdigest()[:16]
+    return f"diagnosis:v{_SCHEMA_VERSION}:{pipeline}:{llm_model}:{model_versions(tier)}:{symptoms_hash}:{digest}"
+
+
+class ResultCache:
+    """
+    Two-tier cache for pipeline results.
+
+    A bounded LRU dictionary sits in front of an optional SQLite table.
+    Entries expire after ``ttl`` seconds in both tiers; the memory tier is
+    capped at ``max_entries`` and the disk tier at ``max_disk_entries``,
+    evicting least recently used entries first. Values must be JSON
+    serializable.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = RESULT_CACHE_SIZE,
+        ttl: float = RESULT_CACHE_TTL,
+        db_path: Optional[str] = RESULT_CACHE_DB,
+        max_disk_entries: int = RESULT_CACHE_DISK_ENTRIES
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_disk_entries = max_disk_entries
+        self._memory: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._disk_writes = 0
+
+        self.db_path = db_path
+        self._db: Optional[sqlite3.Connection] = None
+        if db_path:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            self._db = self._connect()
+            logger.info(f"Result cache disk tier at {db_path}")
+            # Workers forked from a preloading parent (gunicorn.conf.py) must not share its connection
+            if hasattr(os, "register_at_fork"):
+                os.register_at_fork(after_in_child=self._reconnect)
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.db_path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)")
+        db.commit()
+        return db
+
+    def _reconnect(self):
+        self._lock = threading.Lock()
+        self._db = self._connect()
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Look up a cached value
+
+        Args:
+            key: Cache key
+
+        Returns:
+            The cached value, or None on a miss or expired entry
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created, value = entry
+                if now - created <= self.ttl:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return value
+                del self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, created FROM results WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    if now - row[1] <= self.ttl:
+                        self._db.execute("UPDATE results SET accessed = ? WHERE key = ?", (now, key))
+                        self._db.commit()
+                        value = json.loads(row[0])
+                        self._put_memory(key, row[1], value)
+                        self.disk_hits += 1
+                        return value
+                    self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+                    self._db.commit()
+
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value: Any):
+        """
+        Store a value in both tiers
+
+        Args:
+            key: Cache key
+            value: JSON-serializable value
+        """
+        now = time.time()
+        with self._lock:
+            self._put_memory(key, now, value)
+
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO results (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(value), now, now)
+                )
+                self._disk_writes += 1
+                if self._disk_writes % _DISK_EVICT_EVERY == 0:
+                    self._evict_disk(now)
+                self._db.commit()
+
+    def clear(self):
+        """Drop every entry from both tiers"""
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM results")
+                self._db.commit()
+
+    @property
+    def capacity(self) -> int:
+        """Entries the cache holds before it starts evicting: the disk tier's size if there is one"""
+        return self.max_disk_entries if self._db is not None else self.max_entries
+
+    def _put_memory(self, key: str, created: float, value: Any):
+        self._memory[key] = (created, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def _evict_disk(self, now: float):
+        expired = self._db.execute("DELETE FROM results WHERE created < ?", (now - self.ttl,)).rowcount
+        overflow = self._db.execute(
+            "DELETE FROM results WHERE key IN ("
+            "SELECT key FROM results ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+            (self.max_disk_entries,)
+        ).rowcount
+        self.evictions += expired + overflow
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and tier sizes"""
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            disk_entries = None
+            if self._db is not None:
+                disk_entries = self._db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 3) if lookups else 0,
+                "evictions": self.evictions,
+                "memory_entries": len(self._memory),
+                "disk_entries": disk_entries,
+            }
+
+
+# Singleton instance shared by both diagnosis pipelines
+result_cache = ResultCache()
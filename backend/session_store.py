@@ -0,0 +1,279 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from langchain.chains.conversation.memory import ConversationBufferMemory
+from langchain_core.memory import BaseMemory
+
+logger = logging.getLogger(__name__)
+
+# "memory" keeps sessions in this worker only; "sqlite" shares them between workers
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")
+SESSION_MAX = int(os.getenv("SESSION_MAX", "10000"))
+SESSION_TTL = float(os.getenv("SESSION_TTL", str(6 * 60 * 60)))
+SESSION_DB = os.getenv("SESSION_DB", "sessions.db")
+
+# Live (rehydrated) sessions each worker keeps when using the sqlite backend
+SESSION_LIVE_CACHE = int(os.getenv("SESSION_LIVE_CACHE", "256"))
+
+# Fields of a session that are plain data and can be stored as JSON
+_RECORD_FIELDS = ("image_path", "initial_diagnosis", "detections", "timings", "prompt_tokens", "run_ids")
+
+
+# Builds the conversation memory object for a new or rehydrated session
+MemoryFactory = Callable[[], BaseMemory]
+
+
+def _buffer_memory() -> BaseMemory:
+    return ConversationBufferMemory(
+        memory_key='chat_history',
+        return_messages=True
+    )
+
+
+def new_session(memory_factory: Optional[MemoryFactory] = None) -> Dict[str, Any]:
+    """Create an empty session holding only conversation state"""
+    return {
+        "memory": (memory_factory or _buffer_memory)(),
+        "image_path": None,
+        "initial_diagnosis": None,
+        "detections": [],  # Boxes from the initial image, as returned by the API
+        "timings": {},
+        "prompt_tokens": [],  # Prompt tokens sent per chat turn
+        "run_ids": []  # For LangSmith tracking
+    }
+
+
+def to_record(session: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert a live session into JSON-serializable data"""
+    record = {field: session.get(field) for field in _RECORD_FIELDS}
+    record["messages"] = [
+        {"type": message.type, "content": message.content}
+        for message in session["memory"].chat_memory.messages
+    ]
+    # Running summary of pruned turns when the memory is token budgeted
+    record["summary"] = getattr(session["memory"], "moving_summary_buffer", "")
+    return record
+
+
+def from_record(record: Dict[str, Any], memory_factory: Optional[MemoryFactory] = None) -> Dict[str, Any]:
+    """Rebuild a live session (conversation memory included) from stored data"""
+    session = new_session(memory_factory)
+    for field in _RECORD_FIELDS:
+        if record.get(field) is not None:
+            session[field] = record[field]
+
+    chat_memory = session["memory"].chat_memory
+    for message in record.get("messages", []):
+        if message["type"] == "human":
+            chat_memory.add_user_message(message["content"])
+        else:
+            chat_memory.add_ai_message(message["content"])
+    if record.get("summary") and hasattr(session["memory"], "moving_summary_buffer"):
+        session["memory"].moving_summary_buffer = record["summary"]
+    return session
+
+
+def _record_size(session: Dict[str, Any]) -> int:
+    return len(json.dumps(to_record(session)))
+
+
+class SessionStore(ABC):
+    """Interface for chat session storage; backends must implement load, save and stats"""
+
+    @abstractmethod
+    def load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Return the live session, or None if it does not exist or expired"""
+
+    @abstractmethod
+    def save(self, session_id: str, session: Dict[str, Any]):
+        """Persist changes made to a session"""
+
+    def exists(self, session_id: str) -> bool:
+        return self.load(session_id) is not None
+
+    @abstractmethod
+    def stats(self) -> Dict[str, Any]:
+        """Live session count and the bytes their history holds"""
+
+
+class MemorySessionStore(SessionStore):
+    """
+    Sessions held in this process, evicted least recently used first once
+    ``max_sessions`` is exceeded, and dropped after ``ttl`` seconds idle.
+    """
+
+    def __init__(self, max_sessions: int = SESSION_MAX, ttl: float = SESSION_TTL):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        # session_id -> (last access, session, serialized size)
+        self._sessions: "OrderedDict[str, Tuple[float, Dict[str, Any], int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            if now - entry[0] > self.ttl:
+                del self._sessions[session_id]
+                self.evictions += 1
+                return None
+            self._sessions[session_id] = (now, entry[1], entry[2])
+            self._sessions.move_to_end(session_id)
+            return entry[1]
+
+    def save(self, session_id: str, session: Dict[str, Any]):
+        size = _record_size(session)
+        with self._lock:
+            self._sessions[session_id] = (time.time(), session, size)
+            self._sessions.move_to_end(session_id)
+            self._evict()
+
+    def _evict(self):
+        now = time.time()
+        # Entries are in access order, so expired ones sit at the front
+        while self._sessions:
+            session_id, (accessed, _, _) = next(iter(self._sessions.items()))
+            if len(self._sessions) <= self.max_sessions and now - accessed <= self.ttl:
+                break
+            del self._sessions[session_id]
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "backend": "memory",
+                "live_sessions": len(self._sessions),
+                "bytes_held": sum(size for _, _, size in self._sessions.values()),
+                "max_sessions": self.max_sessions,
+                "ttl_seconds": self.ttl,
+                "evictions": self.evictions,
+            }
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Sessions stored as JSON rows in a SQLite file shared by every worker
+    on the host. Each worker keeps a small LRU of rehydrated sessions and
+    reloads a session whenever another worker has written a newer copy.
+    """
+
+    def __init__(
+        self,
+        db_path: str = SESSION_DB,
+        max_sessions: int = SESSION_MAX,
+        ttl: float = SESSION_TTL,
+        live_cache: int = SESSION_LIVE_CACHE,
+        memory_factory: Optional[MemoryFactory] = None
+    ):
+        self.db_path = db_path
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.live_cache = live_cache
+        self.memory_factory = memory_factory
+        # session_id -> (updated timestamp, live session)
+        self._live: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.rehydrations = 0
+
+        self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "id TEXT PRIMARY KEY, data TEXT NOT NULL, updated REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated)")
+        self._db.commit()
+
+    def load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT data, updated FROM sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+            if row is None:
+                self._live.pop(session_id, None)
+                return None
+
+            data, updated = row
+            if now - updated > self.ttl:
+                self._db.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+                self._db.commit()
+                self._live.pop(session_id, None)
+                self.evictions += 1
+                return None
+
+            cached = self._live.get(session_id)
+            if cached is not None and cached[0] >= updated:
+                self._live.move_to_end(session_id)
+                return cached[1]
+
+            # Another worker wrote this session (or it fell out of the live cache)
+            session = from_record(json.loads(data), self.memory_factory)
+            self.rehydrations += 1
+            self._remember(session_id, updated, session)
+            return session
+
+    def save(self, session_id: str, session: Dict[str, Any]):
+        now = time.time()
+        data = json.dumps(to_record(session))
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO sessions (id, data, updated) VALUES (?, ?, ?)",
+                (session_id, data, now)
+            )
+            self.evictions += self._db.execute(
+                "DELETE FROM sessions WHERE updated < ?", (now - self.ttl,)
+            ).rowcount
+            self.evictions += self._db.execute(
+                "DELETE FROM sessions WHERE id IN ("
+                "SELECT id FROM sessions ORDER BY updated DESC LIMIT -1 OFFSET ?)",
+                (self.max_sessions,)
+            ).rowcount
+            self._db.commit()
+            self._remember(session_id, now, session)
+
+    def _remember(self, session_id: str, updated: float, session: Dict[str, Any]):
+        self._live[session_id] = (updated, session)
+        self._live.move_to_end(session_id)
+        while len(self._live) > self.live_cache:
+            self._live.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            count, total_bytes = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM sessions"
+            ).fetchone()
+            return {
+                "backend": "sqlite",
+                "live_sessions": count,
+                "rehydrated_in_worker": len(self._live),
+                "bytes_held": total_bytes,
+                "max_sessions": self.max_sessions,
+                "ttl_seconds": self.ttl,
+                "evictions": self.evictions,
+                "rehydrations": self.rehydrations,
+            }
+
+
+def create_session_store(
+    backend: str = SESSION_BACKEND,
+    memory_factory: Optional[MemoryFactory] = None
+) -> SessionStore:
+    """Build the session store selected by SESSION_BACKEND"""
+    if backend == "memory":
+        return MemorySessionStore()
+    if backend == "sqlite":
+        logger.info(f"Using SQLite session store at {SESSION_DB}")
+        return SQLiteSessionStore(memory_factory=memory_factory)
+    raise ValueError(f"Unknown SESSION_BACKEND: {backend}")
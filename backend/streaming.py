@@ -0,0 +1,130 @@
+import re
+from typing import Any, Awaitable, Callable, Optional, Tuple
+
+from langchain_core.callbacks import AsyncCallbackHandler
+
+# Coroutine that receives each new piece of response text
+TokenCallback = Callable[[str], Awaitable[None]]
+
+_ACTION_RE = re.compile(r'"action"\s*:\s*"((?:[^"\\]|\\.)*)"')
+_ACTION_INPUT_RE = re.compile(r'"action_input"\s*:\s*"')
+_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "b": "\b", "f": "\f", '"': '"', "\\": "\\", "/": "/"}
+
+
+
+def _hex4(text: str) -> Optional[int]:
+    if len(text) != 4 or any(c not in "0123456789abcdefABCDEF" for c in text):
+        return None
+    return int(text, 16)
+
+
+def _unicode_escape(buffer: str, i: int) -> Tuple[str, int]:
+    """
+    Decode the \\uXXXX escape at buffer[i], joining UTF-16 surrogate pairs
+    (how JSON encodes emoji and other astral characters)
+
+    Returns:
+        (text, characters consumed), or ("", 0) if the escape is not complete yet
+    """
+    if i + 6 > len(buffer):
+        return "", 0
+    code = _hex4(buffer[i + 2:i + 6])
+    if code is None:
+        # Not valid JSON; pass it through rather than break the stream
+        return buffer[i:i + 2], 2
+    if 0xD800 <= code <= 0xDBFF:
+        rest = buffer[i + 6:i + 12]
+        if len(rest) < 6 and "\\u".startswith(rest[:2]):
+            # The low half may still be on its way
+            return "", 0
+        low = _hex4(rest[2:]) if rest.startswith("\\u") else None
+        if low is not None and 0xDC00 <= low <= 0xDFFF:
+            return chr(0x10000 + ((code - 0xD800) << 10) + (low - 0xDC00)), 12
+        return "\ufffd", 6
+    if 0xDC00 <= code <= 0xDFFF:
+        return "\ufffd", 6
+    return chr(code), 6
+
+
+class FinalAnswerStreamHandler(AsyncCallbackHandler):
+    """
+    Streams the final answer of a conversational ReAct agent.
+
+    The agent's LLM replies with a JSON blob such as
+    ``{"action": "Final Answer", "action_input": "..."}``. Tokens are
+    buffered until the action is known; tool-call steps are ignored and
+    the ``action_input`` string of the final answer is unescaped and
+    forwarded to ``on_token`` as it arrives.
+    """
+
+    def __init__(self, on_token: TokenCallback):
+        self.on_token = on_token
+        self._reset()
+
+    def _reset(self):
+        self._buffer = ""
+        self._state = "seek"
+        self._pos = 0
+
+    async def on_llm_start(self, serialized: Any, prompts: Any, **kwargs: Any) -> None:
+        # Each agent step is a fresh LLM call with its own JSON reply
+        self._reset()
+
+    async def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        self._buffer += token
+        delta = self._advance()
+        if delta:
+            await self.on_token(delta)
+
+    def _advance(self) -> str:
+        if self._state == "seek":
+            action = _ACTION_RE.search(self._buffer)
+            if action is None:
+                return ""
+            if action.group(1) != "Final Answer":
+                self._state = "skip"
+                return ""
+            action_input = _ACTION_INPUT_RE.search(self._buffer, action.end())
+            if action_input is None:
+                return ""
+            self._state = "emit"
+            self._pos = action_input.end()
+
+        if self._state != "emit":
+            return ""
+
+        out = []
+        i = self._pos
+        buffer = self._buffer
+        while i < len(buffer):
+            char = buffer[i]
+            if char == "\\":
+                # Wait for the rest of an escape sequence split across tokens
+                if i + 1 >= len(buffer):
+                    break
+                escaped = buffer[i + 1]
+                if escaped == "u":
+                    char, length = _unicode_escape(buffer, i)
+                    if length == 0:
+                        break
+                    out.append(char)
+                    i += length
+                    continue
+                out.append(_ESCAPES.get(escaped, escaped))
+                i += 2
+                continue
+            if char == '"':
+                self._state = "done"
+                i += 1
+                break
+            out.append(char)
+            i += 1
+
+        self._pos = i
+        return "".join(out)
+
+
+async def emit(on_token: Optional[TokenCallback], text: str):
+    """Forward text to an optional token callback"""
+    if on_token is not None and text:
+        await on_token(text)
@@ -0,0 +1,37 @@
+import io
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("langchain_openai")
+
+from fastapi import UploadFile
+
+from batch_diagnosis import spool_uploads
+from image_ingest import ImageRejected
+
+
+def _upload(name, size):
+    return UploadFile(io.BytesIO(b"x" * size), filename=name)
+
+
+def test_spools_every_upload():
+    spools = spool_uploads([_upload("a.jpg", 3000), _upload("b.zip", 10)], max_bytes=4000)
+
+    assert [(name, len(spool.read())) for name, spool in spools] == [("a.jpg", 3000), ("b.zip", 10)]
+
+
+def test_rejects_batches_over_the_byte_limit(monkeypatch):
+    import batch_diagnosis
+
+    monkeypatch.setattr(batch_diagnosis, "_SPOOL_CHUNK", 100)
+    created = []
+    temporary_file = batch_diagnosis.tempfile.TemporaryFile
+    monkeypatch.setattr(batch_diagnosis.tempfile, "TemporaryFile", lambda: created.append(temporary_file()) or created[-1])
+
+    with pytest.raises(ImageRejected):
+        spool_uploads([_upload("a.jpg", 600), _upload("b.jpg", 600)], max_bytes=1000)
+
+    # Nothing is left behind once the batch is refused
+    assert len(created) == 2
+    assert all(spool.closed for spool in created)
@@ -0,0 +1,83 @@
+import asyncio
+import argparse
+
+import benchmark
+
+
+class StubResponse:
+    def __init__(self, body):
+        self.body = body
+
+    def json(self):
+        return self.body
+
+
+class StubClient:
+    """Answers /api/cache with hit counters that grow by one per call"""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def get(self, path):
+        assert path == "/api/cache"
+        self.calls += 1
+        return StubResponse({
+            "results": {"memory_hits": self.calls, "disk_hits": 0},
+            "near_duplicates": {"hits": 2 * self.calls},
+        })
+
+
+class StubSampler:
+    def start(self):
+        pass
+
+    async def stop(self):
+        return 64 * 2**20
+
+
+async def ok_request(image, number):
+    return number % 4 != 3, 0.01
+
+
+def _args(**overrides):
+    args = argparse.Namespace(requests=8, concurrency=3, rate=None, duration=1.0)
+    for name, value in overrides.items():
+        setattr(args, name, value)
+    return args
+
+
+def test_run_endpoint_closed_loop():
+    result = asyncio.run(benchmark.run_endpoint(ok_request, [b"a", b"b"], _args(), StubSampler(), StubClient()))
+
+    assert result["requests"] == 8
+    assert result["succeeded"] == 6
+    assert result["errors"] == 2
+    assert result["sample_errors"] == ["unsuccessful response"]
+    assert result["cache_hits"] == {"results": 1, "near_duplicates": 2}
+    assert result["peak_rss_mb"] == 64.0
+    assert result["first_token_p50_ms"] == 10.0
+
+
+def test_run_endpoint_open_loop():
+    args = _args(rate=200.0, duration=0.05)
+    result = asyncio.run(benchmark.run_endpoint(ok_request, [b"a"], args, StubSampler(), StubClient()))
+
+    assert result["requests"] == 10
+    assert result["succeeded"] + result["errors"] == 10
+
+
+def test_run_endpoint_reports_exceptions():
+    async def failing(image, number):
+        raise ConnectionError("refused")
+
+    result = asyncio.run(benchmark.run_endpoint(failing, [b"a"], _args(), StubSampler(), StubClient()))
+
+    assert result["succeeded"] == 0
+    assert result["p50_ms"] is None
+    assert result["sample_errors"] == ["ConnectionError: refused"]
+
+
+def test_percentile():
+    assert benchmark.percentile([], 50) is None
+    assert benchmark.percentile([3.0, 1.0, 2.0], 50) == 2.0
+    assert benchmark.percentile([1.0, 2.0, 3.0, 4.0], 100) == 4.0
@@ -0,0 +1,56 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from detections import Detections
+
+ID2LABEL = {0: "leaf", 1: "stem", 2: "fruit"}
+
+
+def test_select_keeps_top_k_above_threshold():
+    boxes = np.arange(20, dtype=np.float64).reshape(5, 4)
+    label_ids = np.array([0, 1, 2, 0, 1])
+    scores = np.array([0.95, 0.5, 0.99, 0.91, 0.97])
+
+    selected = Detections.select(boxes, label_ids, scores, ID2LABEL, threshold=0.9, top_k=3)
+
+    assert selected.labels.tolist() == ["fruit", "stem", "leaf"]
+    assert selected.scores.tolist() == pytest.approx([0.99, 0.97, 0.95])
+    assert selected.boxes.tolist() == [[8, 9, 10, 11], [16, 17, 18, 19], [0, 1, 2, 3]]
+    assert selected.boxes.dtype == np.float32
+
+
+def test_select_with_nothing_above_threshold():
+    selected = Detections.select(np.zeros((2, 4)), np.array([0, 1]), np.array([0.1, 0.2]), ID2LABEL, threshold=0.9)
+
+    assert len(selected) == 0
+    assert selected.to_prompt() == "none"
+    assert selected.to_list() == []
+
+
+def test_rescaled_moves_boxes_to_the_new_size():
+    detections = Detections(
+        np.array([[10, 20, 110, 220]], dtype=np.float32), np.array(["leaf"]), np.array([0.9], dtype=np.float32)
+    )
+
+    scaled = detections.rescaled((200, 400), (100, 800))
+
+    assert scaled.boxes.tolist() == [[5, 40, 55, 440]]
+    assert scaled.labels.tolist() == ["leaf"]
+    assert detections.rescaled((200, 400), [200, 400]) is detections
+
+
+def test_list_round_trip():
+    detections = Detections(
+        np.array([[1.04, 2, 3, 4], [5, 6, 7, 8]], dtype=np.float32),
+        np.array(["leaf", "stem"]),
+        np.array([0.91234, 0.5], dtype=np.float32)
+    )
+
+    items = detections.to_list()
+    restored = Detections.from_list(items)
+
+    assert items[0] == {"label": "leaf", "score": 0.9123, "box": [1.0, 2.0, 3.0, 4.0]}
+    assert restored.to_list() == items
+    assert Detections.from_list([]).boxes.shape == (0, 4)
+    assert detections.to_prompt() == "[1,2,3,4] leaf 0.91\n[5,6,7,8] stem 0.50"
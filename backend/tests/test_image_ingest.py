@@ -0,0 +1,42 @@
+import io
+
+import pytest
+
+pytest.importorskip("numpy")
+Image = pytest.importorskip("PIL.Image")
+
+import image_ingest
+from image_ingest import ImageRejected, decode_image
+
+
+def _png(width, height):
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def pixel_limit(monkeypatch):
+    monkeypatch.setattr(image_ingest, "INGEST_MAX_PIXELS", 100)
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 100)
+
+
+@pytest.mark.parametrize("size", [(11, 10), (30, 30)])
+def test_rejects_images_over_the_pixel_limit(pixel_limit, size):
+    # 110 pixels only trips our own check; 900 is past Pillow's own bomb error
+    with pytest.raises(ImageRejected):
+        decode_image(_png(*size))
+
+
+def test_decodes_images_within_the_limit(pixel_limit):
+    image = decode_image(_png(10, 10))
+
+    assert image.original_size == (10, 10)
+    assert image.array.shape == (10, 10, 3)
+
+
+def test_rejects_uploads_over_the_byte_limit(monkeypatch):
+    monkeypatch.setattr(image_ingest, "INGEST_MAX_BYTES", 10)
+
+    with pytest.raises(ImageRejected):
+        decode_image(_png(10, 10))
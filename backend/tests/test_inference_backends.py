@@ -0,0 +1,66 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("transformers")
+
+import model_registry
+from inference_backends import OnnxDetector, model_bytes, quantize_int8
+from model_registry import ModelRegistry
+
+
+class StubSession:
+    def get_inputs(self):
+        return []
+
+
+def _model():
+    return torch.nn.Sequential(torch.nn.Linear(64, 64), torch.nn.ReLU(), torch.nn.Linear(64, 4))
+
+
+def test_counts_fp32_weights():
+    # Two weight matrices and biases, four bytes each
+    assert model_bytes(_model()) == (64 * 64 + 64 + 64 * 4 + 4) * 4
+
+
+def test_counts_packed_int8_weights():
+    quantized = quantize_int8(_model())
+
+    # parameters() no longer sees the packed weights at all
+    assert sum(p.numel() for p in quantized.parameters()) == 0
+    assert (64 * 64 + 64 * 4) <= model_bytes(quantized) < model_bytes(_model()) / 2
+
+
+def test_counts_onnx_graph_files(tmp_path):
+    path = tmp_path / "detector.onnx"
+    path.write_bytes(b"\0" * 1000)
+    model = torch.nn.Linear(2, 2)
+    model.config = None
+    model.name_or_path = "stub"
+
+    assert model_bytes(OnnxDetector(StubSession(), str(path), model)) == 1000
+
+
+def test_each_registry_resolves_its_own_device(monkeypatch):
+    monkeypatch.setattr(model_registry, "MODEL_DEVICE", None)
+    monkeypatch.setattr(torch.cuda, "is_available", lambda: True)
+
+    assert ModelRegistry(backend="torch").device == "cuda"
+    assert ModelRegistry(backend="int8").device == "cpu"
+    assert ModelRegistry(backend="onnx").device == "cpu"
+
+
+def test_thread_pool_is_sized_once_per_process(monkeypatch):
+    import inference_backends
+
+    calls = []
+    monkeypatch.setattr(torch, "set_num_threads", calls.append)
+    monkeypatch.setattr(inference_backends, "_threads_pid", None)
+
+    inference_backends.configure_threads()
+    inference_backends.configure_threads()
+    assert calls == [inference_backends.STAGE_THREADS]
+
+    # As seen from a forked child
+    monkeypatch.setattr(inference_backends, "_threads_pid", -1)
+    inference_backends.configure_threads()
+    assert len(calls) == 2
@@ -0,0 +1,148 @@
+import time
+import asyncio
+
+import pytest
+
+from job_queue import JobQueue, QueueFull
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(db_path=str(tmp_path / "jobs.db"), max_pending=3, workers=1, stale_after=60)
+
+
+def test_claims_oldest_job_first(queue):
+    first = queue._insert({"n": 1}, b"image", "s1")
+    queue._insert({"n": 2}, None, "s2")
+
+    job = queue._claim()
+
+    assert job == {"job_id": first["job_id"], "session_id": "s1", "payload": {"n": 1}, "image": b"image"}
+    assert queue._get(first["job_id"])["status"] == "running"
+    assert queue._claim()["payload"] == {"n": 2}
+    assert queue._claim() is None
+
+
+def test_reports_queue_position(queue):
+    jobs = [queue._insert({}, None, None) for _ in range(3)]
+
+    assert [job["position"] for job in jobs] == [1, 2, 3]
+    queue._claim()
+    assert queue._get(jobs[2]["job_id"])["position"] == 2
+    assert "position" not in queue._get(jobs[0]["job_id"])
+
+
+def test_rejects_submissions_when_full(queue):
+    for _ in range(3):
+        queue._insert({}, None, None)
+
+    with pytest.raises(QueueFull) as e:
+        queue._insert({}, None, None)
+
+    assert e.value.depth == 3
+    assert e.value.retry_after >= 1
+    assert queue._stats()["rejected"] == 1
+
+
+def test_finish_stores_result_and_drops_image(queue):
+    job_id = queue._insert({}, b"image", None)["job_id"]
+    queue._claim()
+
+    queue._finish(job_id, {"diagnosis": "rust"}, None)
+
+    job = queue._get(job_id)
+    assert job["status"] == "done"
+    assert job["result"] == {"diagnosis": "rust"}
+    assert queue._connect().execute("SELECT image FROM jobs WHERE id = ?", (job_id,)).fetchone()[0] is None
+
+
+def test_requeues_only_jobs_without_heartbeat(queue):
+    stale = queue._insert({}, None, None)["job_id"]
+    alive = queue._insert({}, None, None)["job_id"]
+    queue._claim()
+    queue._claim()
+    long_ago = time.time() - 10 * 60
+    # Both started long ago, but only one still has its worker refreshing the heartbeat
+    queue._connect().execute("UPDATE jobs SET started = ?, heartbeat = ?", (long_ago, long_ago))
+    queue._touch(alive)
+
+    queue._requeue_stale()
+
+    assert queue._get(stale)["status"] == "queued"
+    assert queue._get(alive)["status"] == "running"
+    assert queue._claim()["job_id"] == stale
+
+
+def test_adds_heartbeat_column_to_old_queue_files(tmp_path):
+    import sqlite3
+    path = str(tmp_path / "old.db")
+    db = sqlite3.connect(path)
+    db.execute(
+        "CREATE TABLE jobs (id TEXT PRIMARY KEY, session_id TEXT, status TEXT NOT NULL, "
+        "payload TEXT NOT NULL, image BLOB, result TEXT, error TEXT, "
+        "created REAL NOT NULL, started REAL, finished REAL)"
+    )
+    db.commit()
+    db.close()
+
+    queue = JobQueue(db_path=path)
+    job_id = queue._insert({}, None, None)["job_id"]
+
+    assert queue._claim()["job_id"] == job_id
+
+
+def test_workers_run_jobs_and_notify_listeners(queue):
+    updates = []
+    calls = []
+
+    async def handler(payload, image):
+        # Outlive stale_after several times over; the heartbeat keeps the job from being requeued
+        await asyncio.sleep(0.2)
+        await asyncio.to_thread(queue._requeue_stale)
+        calls.append((await queue.get(payload["job_id"]))["status"])
+        return {"echo": payload["n"], "bytes": len(image)}
+
+    async def listener(job):
+        updates.append((job["job_id"], job["status"]))
+
+    async def scenario():
+        queue.stale_after = 0.04
+        queue.add_listener(listener)
+        queue.start(handler)
+        job = await queue.submit({"n": 7}, b"abc", session_id="s1")
+        # The listener hears of completion after the result is stored
+        for _ in range(100):
+            if updates[-1][1] == "done":
+                break
+            await asyncio.sleep(0.02)
+        await queue.stop()
+        return job, await queue.get(job["job_id"]), await queue.stats()
+
+    job, finished, stats = asyncio.run(scenario())
+
+    assert finished["result"] == {"echo": 7, "bytes": 3}
+    assert calls == ["running"]
+    assert [status for job_id, status in updates] == ["queued", "running", "done"]
+    assert stats["completed"] == 1 and stats["failed"] == 0
+    assert stats["running"] == 0
+
+
+def test_failed_jobs_record_the_error(queue):
+    async def handler(payload, image):
+        raise RuntimeError("Image analysis failed")
+
+    async def scenario():
+        queue.start(handler)
+        job = await queue.submit({})
+        for _ in range(100):
+            failed = await queue.get(job["job_id"])
+            if failed["status"] == "failed":
+                break
+            await asyncio.sleep(0.02)
+        await queue.stop()
+        return failed
+
+    failed = asyncio.run(scenario())
+
+    assert failed["error"] == "Image analysis failed"
+    assert queue.failed == 1
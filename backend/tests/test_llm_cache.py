@@ -0,0 +1,43 @@
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration
+
+from llm_cache import LLMResponseCache, llm_cache_key, normalize_prompt
+from result_cache import ResultCache
+
+
+def test_whitespace_and_key_order_do_not_change_the_key():
+    a = '[{"kwargs": {"content": "Diagnose  this\\n leaf", "type": "human"}}]'
+    b = '[{"kwargs": {"type": "human", "content": "Diagnose this leaf"}}]'
+
+    assert normalize_prompt(a) == normalize_prompt(b)
+    assert llm_cache_key(a, "gpt-4o|t=0") == llm_cache_key(b, "gpt-4o|t=0")
+    assert llm_cache_key(a, "gpt-4o|t=0") != llm_cache_key(a, "gpt-4o|t=0.7")
+    assert normalize_prompt("  plain\ttext ") == "plain text"
+
+
+def test_hits_return_the_stored_generation_without_token_usage():
+    cache = LLMResponseCache(ResultCache(db_path=None))
+    message = AIMessage(
+        content='{"possible_diagnosis": ["Rust"]}',
+        usage_metadata={"input_tokens": 900, "output_tokens": 40, "total_tokens": 940}
+    )
+
+    assert cache.lookup("prompt", "llm") is None
+    cache.update("prompt", "llm", [ChatGeneration(message=message)])
+    (generation,) = cache.lookup(" prompt ", "llm")
+
+    assert generation.message.content == message.content
+    assert generation.message.usage_metadata is None
+    assert cache.stats()["memory_hits"] == 1
+
+
+def test_unreadable_entries_are_misses():
+    store = ResultCache(db_path=None)
+    cache = LLMResponseCache(store)
+    store.set(llm_cache_key("prompt", "llm"), ["not a serialized generation"])
+
+    assert cache.lookup("prompt", "llm") is None
@@ -0,0 +1,59 @@
+import pytest
+
+from model_catalogue import DEFAULT_CATALOGUE, ModelCatalogue, UnknownTier
+
+CONFIG = {
+    "default_tier": "accurate",
+    "tiers": {
+        "accurate": {"caption": "blip-large", "detection": "detr"},
+        "fast": {"caption": "blip-base", "detection": "yolos", "detection_threshold": 0.7},
+        "huge": {"caption": "blip-huge", "detection": "detr-101"},
+    },
+    "endpoints": {"upload": "fast"},
+}
+
+
+def test_enables_default_and_endpoint_tiers():
+    catalogue = ModelCatalogue(CONFIG)
+
+    assert catalogue.enabled == ["accurate", "fast"]
+    assert [tier.name for tier in catalogue.enabled_tiers()] == ["accurate", "fast"]
+    assert catalogue.tiers["accurate"].detection_threshold == 0.9
+
+
+def test_resolve_prefers_request_then_endpoint_then_default():
+    catalogue = ModelCatalogue(CONFIG)
+
+    assert catalogue.resolve("accurate", "upload").name == "accurate"
+    assert catalogue.resolve(None, "upload").name == "fast"
+    assert catalogue.resolve(None, "diagnose").name == "accurate"
+    assert catalogue.resolve().detection == "detr"
+
+
+def test_resolve_rejects_unknown_and_disabled_tiers():
+    catalogue = ModelCatalogue(CONFIG)
+
+    with pytest.raises(UnknownTier, match="Unknown model tier 'tiny'"):
+        catalogue.resolve("tiny")
+    with pytest.raises(UnknownTier, match="not enabled"):
+        catalogue.resolve("huge")
+
+
+def test_overrides_replace_default_and_enabled_tiers():
+    catalogue = ModelCatalogue(CONFIG, default_tier="huge", enabled=["huge", "fast"])
+
+    assert catalogue.resolve().name == "huge"
+    with pytest.raises(UnknownTier):
+        catalogue.resolve("accurate")
+
+
+def test_rejects_references_to_missing_tiers():
+    with pytest.raises(ValueError, match="unknown tier: tiny"):
+        ModelCatalogue({**CONFIG, "endpoints": {"upload": "tiny"}})
+
+
+def test_default_catalogue_is_valid():
+    catalogue = ModelCatalogue(DEFAULT_CATALOGUE)
+
+    assert catalogue.describe()["default_tier"] == "accurate"
+    assert set(catalogue.describe()["tiers"]) == {"accurate", "fast"}
@@ -0,0 +1,84 @@
+import os
+import random
+
+import pytest
+
+import phash_index
+from phash_index import BKTree, PerceptualIndex, hamming
+from result_cache import ResultCache
+
+
+def test_bktree_finds_nearest_within_radius():
+    rng = random.Random(0)
+    values = [rng.getrandbits(64) for _ in range(500)]
+    tree = BKTree()
+    for i, value in enumerate(values):
+        tree.add(value, i)
+
+    for _ in range(50):
+        query = values[rng.randrange(len(values))] ^ (1 << rng.randrange(64)) ^ (1 << rng.randrange(64))
+        expected = min((hamming(query, value), i) for i, value in enumerate(values))
+        found = tree.nearest(query, 6)
+        assert found is not None and found[0] == expected[0]
+        assert hamming(query, values[found[1]]) == expected[0]
+
+    assert tree.size == 500
+
+
+def test_bktree_misses_beyond_radius():
+    tree = BKTree()
+    tree.add(0, "zero")
+
+    assert tree.nearest(0b111, 2) is None
+    assert tree.nearest(0b11, 2) == (2, "zero")
+    assert BKTree().nearest(0, 64) is None
+
+
+def test_bktree_keeps_newest_payload_for_same_hash():
+    tree = BKTree()
+    tree.add(42, "old")
+    tree.add(42, "new")
+
+    assert tree.nearest(42, 0) == (0, "new")
+    assert tree.size == 1
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = ResultCache(max_entries=100, db_path=None)
+    monkeypatch.setattr(phash_index, "result_cache", cache)
+    # model_versions would otherwise read the model catalogue
+    monkeypatch.setattr(phash_index, "model_versions", lambda tier=None: tier or "default")
+    return cache
+
+
+def test_index_resolves_matches_through_the_result_cache(cache):
+    index = PerceptualIndex(max_distance=4)
+    cache.set("vision:a", {"caption": "a leaf"})
+    index.add(0b1010, "vision:a")
+    index.add(0b1111 << 40, "vision:gone")
+
+    assert index.lookup(0b1011) == {"caption": "a leaf"}
+    # Indexed, but evicted from the result cache
+    assert index.lookup(0b1111 << 40) is None
+    # Different models are never mixed
+    assert index.lookup(0b1010, "accurate") is None
+    assert (index.hits, index.misses) == (1, 2)
+
+
+def test_index_drops_oldest_entries_when_full(cache):
+    index = PerceptualIndex(max_distance=0, max_entries=8)
+    for value in range(9):
+        cache.set(f"vision:{value}", value)
+        index.add(value << 8, f"vision:{value}")
+
+    stats = index.stats()
+    assert stats["rebuilds"] == 1
+    assert stats["entries"] == 6
+    assert index.lookup(0) is None
+    assert index.lookup(8 << 8) == 8
+
+
+@pytest.mark.skipif(bool(os.getenv("PHASH_MAX_ENTRIES")), reason="PHASH_MAX_ENTRIES is set")
+def test_default_capacity_follows_the_result_cache():
+    assert phash_index.PHASH_MAX_ENTRIES == phash_index.result_cache.capacity
@@ -0,0 +1,74 @@
+import pytest
+
+import result_cache as result_cache_module
+from result_cache import ResultCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(result_cache_module.time, "time", lambda: now[0])
+    return now
+
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = ResultCache(max_entries=2, db_path=None)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = ResultCache(ttl=60, db_path=None)
+    cache.set("a", {"caption": "a leaf"})
+
+    clock[0] += 59
+    assert cache.get("a") == {"caption": "a leaf"}
+    clock[0] += 2
+    assert cache.get("a") is None
+    assert cache.stats()["memory_entries"] == 0
+
+
+def test_disk_tier_backs_the_memory_tier(tmp_path):
+    path = str(tmp_path / "results.db")
+    ResultCache(db_path=path).set("a", [1, 2])
+
+    cache = ResultCache(db_path=path)
+
+    assert cache.get("a") == [1, 2]
+    assert cache.get("a") == [1, 2]
+    stats = cache.stats()
+    assert (stats["disk_hits"], stats["memory_hits"], stats["disk_entries"]) == (1, 1, 1)
+
+
+def test_disk_entries_expire_after_ttl(tmp_path, clock):
+    path = str(tmp_path / "results.db")
+    ResultCache(ttl=60, db_path=path).set("a", 1)
+    clock[0] += 61
+
+    cache = ResultCache(ttl=60, db_path=path)
+
+    assert cache.get("a") is None
+    assert cache.stats()["disk_entries"] == 0
+
+
+def test_capacity_is_that_of_the_largest_tier(tmp_path):
+    assert ResultCache(max_entries=8, db_path=None).capacity == 8
+    assert ResultCache(max_entries=8, db_path=str(tmp_path / "r.db"), max_disk_entries=50).capacity == 50
+
+
+def test_clear_empties_both_tiers(tmp_path):
+    cache = ResultCache(db_path=str(tmp_path / "results.db"))
+    cache.set("a", 1)
+
+    cache.clear()
+
+    assert cache.get("a") is None
+    assert cache.stats()["disk_entries"] == 0
@@ -0,0 +1,92 @@
+import pytest
+
+pytest.importorskip("langchain")
+
+import session_store
+from session_store import MemorySessionStore, SessionStore, SQLiteSessionStore, from_record, new_session, to_record
+
+
+def _session(*turns):
+    session = new_session()
+    session["image_path"] = "uploads/leaf.jpg"
+    for human, ai in turns:
+        session["memory"].chat_memory.add_user_message(human)
+        session["memory"].chat_memory.add_ai_message(ai)
+    return session
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(session_store.time, "time", lambda: now[0])
+    return now
+
+
+def test_incomplete_backends_cannot_be_built():
+    class NoStats(SessionStore):
+        def load(self, session_id):
+            return None
+
+        def save(self, session_id, session):
+            pass
+
+    with pytest.raises(TypeError):
+        NoStats()
+
+
+def test_records_round_trip():
+    session = _session(("Is it rust?", "Probably."))
+
+    restored = from_record(to_record(session))
+
+    assert restored["image_path"] == "uploads/leaf.jpg"
+    assert [m.content for m in restored["memory"].chat_memory.messages] == ["Is it rust?", "Probably."]
+
+
+def test_memory_store_evicts_least_recently_used(clock):
+    store = MemorySessionStore(max_sessions=2, ttl=60)
+    store.save("a", _session())
+    store.save("b", _session())
+    assert store.load("a") is not None
+
+    store.save("c", _session())
+
+    assert store.load("b") is None
+    assert store.exists("a") and store.exists("c")
+    assert store.stats()["evictions"] == 1
+
+
+def test_memory_store_expires_idle_sessions(clock):
+    store = MemorySessionStore(ttl=60)
+    store.save("a", _session())
+
+    clock[0] += 61
+
+    assert store.load("a") is None
+    assert store.stats()["live_sessions"] == 0
+
+
+def test_sqlite_store_shares_sessions_between_workers(tmp_path, clock):
+    path = str(tmp_path / "sessions.db")
+    first, second = SQLiteSessionStore(db_path=path), SQLiteSessionStore(db_path=path)
+    first.save("a", _session(("Is it rust?", "Probably.")))
+
+    session = second.load("a")
+    session["memory"].chat_memory.add_user_message("What now?")
+    clock[0] += 1
+    second.save("a", session)
+
+    messages = first.load("a")["memory"].chat_memory.messages
+    assert [m.content for m in messages][-1] == "What now?"
+    assert first.stats()["rehydrations"] == 1
+
+
+def test_sqlite_store_expires_and_caps_sessions(tmp_path, clock):
+    store = SQLiteSessionStore(db_path=str(tmp_path / "sessions.db"), max_sessions=2, ttl=60)
+    for session_id in "abc":
+        clock[0] += 1
+        store.save(session_id, _session())
+
+    assert store.load("a") is None
+    clock[0] += 61
+    assert store.load("c") is None
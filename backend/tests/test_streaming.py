@@ -0,0 +1,76 @@
+import json
+import asyncio
+
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from streaming import FinalAnswerStreamHandler
+
+
+def _stream(reply, step=1, calls=1):
+    """Feed reply to a handler in tokens of `step` characters, once per simulated LLM call"""
+    received = []
+
+    async def on_token(text):
+        received.append(text)
+
+    async def run():
+        handler = FinalAnswerStreamHandler(on_token)
+        for _ in range(calls):
+            await handler.on_llm_start({}, [])
+            for i in range(0, len(reply), step):
+                await handler.on_llm_new_token(reply[i:i + step])
+
+    asyncio.run(run())
+    return "".join(received)
+
+
+ANSWER = 'Leaf rust: remove "infected" leaves\n\tthen spray\\fungicide é 🌿 /done'
+
+
+@pytest.mark.parametrize("step", [1, 2, 3, 7, 1000])
+def test_streams_the_unescaped_final_answer(step):
+    reply = json.dumps({"action": "Final Answer", "action_input": ANSWER}, ensure_ascii=False)
+
+    assert _stream(reply, step) == ANSWER
+
+
+@pytest.mark.parametrize("step", [1, 5])
+def test_unescapes_json_ascii_escapes(step):
+    # json.dumps writes non-ASCII characters as \\uXXXX, astral ones as surrogate pairs
+    reply = json.dumps({"action": "Final Answer", "action_input": ANSWER})
+
+    streamed = _stream(reply, step)
+
+    assert streamed == ANSWER
+    streamed.encode("utf-8")
+
+
+def test_ignores_tool_calls():
+    reply = json.dumps({"action": "Image Analysis", "action_input": "What is in \"this\" image?"})
+
+    assert _stream(reply, 3) == ""
+
+
+def test_ignores_text_after_the_answer():
+    reply = '```json\n{"action": "Final Answer", "action_input": "Water less."}\n```'
+
+    assert _stream(reply, 4) == "Water less."
+
+
+def test_each_llm_call_starts_afresh():
+    reply = json.dumps({"action": "Final Answer", "action_input": "Prune."})
+
+    assert _stream(reply, 2, calls=2) == "Prune.Prune."
+
+
+@pytest.mark.parametrize("escape, expected", [
+    ("\\uZZZZ", "\\uZZZZ"),
+    ("\\ud83c.", "\ufffd."),
+    ("\\udf3f", "\ufffd"),
+])
+def test_survives_malformed_unicode_escapes(escape, expected):
+    reply = '{"action": "Final Answer", "action_input": "bad ' + escape + ' escape"}'
+
+    assert _stream(reply, 1) == f"bad {expected} escape"
@@ -0,0 +1,70 @@
+import os
+import logging
+from typing import Any, Callable, List
+
+from langchain.memory import ConversationBufferMemory, ConversationSummaryBufferMemory
+from langchain_core.callbacks import AsyncCallbackHandler
+from langchain_core.language_models import BaseChatModel
+from langchain_core.memory import BaseMemory
+from langchain_core.messages import BaseMessage
+
+logger = logging.getLogger(__name__)
+
+# "summary" keeps recent turns under MEMORY_TOKEN_BUDGET and summarizes older ones;
+# "buffer" keeps the full history verbatim
+MEMORY_MODE = os.getenv("MEMORY_MODE", "summary")
+MEMORY_TOKEN_BUDGET = int(os.getenv("MEMORY_TOKEN_BUDGET", "1500"))
+
+# Model used to fold old turns into the running summary
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", "gpt-4o-mini")
+
+
+def memory_factory(summary_llm: BaseChatModel) -> Callable[[], BaseMemory]:
+    """
+    Build a factory for per-session conversation memory
+
+    Args:
+        summary_llm: Chat model used to summarize turns that fall outside the budget
+
+    Returns:
+        Callable returning a fresh memory object for the selected MEMORY_MODE
+    """
+    if MEMORY_MODE == "buffer":
+        return lambda: ConversationBufferMemory(
+            memory_key='chat_history',
+            return_messages=True
+        )
+    if MEMORY_MODE == "summary":
+        # Once the history exceeds the budget the oldest turns are pruned and
+        # folded into moving_summary_buffer, one incremental summary call per prune
+        return lambda: ConversationSummaryBufferMemory(
+            llm=summary_llm,
+            max_token_limit=MEMORY_TOKEN_BUDGET,
+            memory_key='chat_history',
+            return_messages=True
+        )
+    raise ValueError(f"Unknown MEMORY_MODE: {MEMORY_MODE}")
+
+
+class PromptTokenCounter(AsyncCallbackHandler):
+    """Counts the prompt tokens sent on every chat model call of one turn"""
+
+    def __init__(self, llm: BaseChatModel):
+        self.llm = llm
+        self.calls: List[int] = []
+
+    async def on_chat_model_start(
+        self,
+        serialized: Any,
+        messages: List[List[BaseMessage]],
+        **kwargs: Any
+    ) -> None:
+        for prompt in messages:
+            try:
+                self.calls.append(self.llm.get_num_tokens_from_messages(prompt))
+            except Exception as e:
+                logger.warning(f"Could not count prompt tokens: {str(e)}")
+
+    @property
+    def total(self) -> int:
+        return sum(self.calls)
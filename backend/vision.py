@@ -0,0 +1,91 @@
+from typing import List, Optional
+
+from model_registry import ModelRegistry, registry
+from model_catalogue import ModelTier, catalogue
+from image_ingest import IngestedImage
+from detections import Detections
+
+
+# torch is imported inside the functions so importing this module stays cheap;
+# by the time they run the registry has already loaded it
+
+
+def caption_images(
+    images: List[IngestedImage],
+    models: Optional[ModelRegistry] = None,
+    tier: Optional[ModelTier] = None
+) -> List[str]:
+    """
+    Caption a batch of images with BLIP in a single generate call.
+
+    Args:
+        images: Decoded images to caption
+        models: Registry to take the model from (defaults to the shared one)
+        tier: Model tier to use (defaults to the catalogue's default tier)
+
+    Returns:
+        One caption per input image, in the same order
+    """
+    import torch
+    from inference_backends import configure_threads
+
+    configure_threads()
+    models = models or registry
+    processor, model = models.caption(tier)
+
+    with torch.inference_mode():
+        inputs = processor([image.array for image in images], return_tensors="pt").to(models.device)
+        output = model.generate(**inputs, max_new_tokens=20)
+
+    return processor.batch_decode(output, skip_special_tokens=True)
+
+
+def detect_objects(
+    images: List[IngestedImage],
+    models: Optional[ModelRegistry] = None,
+    tier: Optional[ModelTier] = None
+) -> List[Detections]:
+    """
+    Run object detection on a batch of images in a single forward pass.
+
+    Post-processing is vectorized over the whole batch: class scores and
+    boxes for every query are computed with a few tensor ops, and only the
+    per-image threshold/top-k selection happens in NumPy.
+
+    Args:
+        images: Decoded images to run detection on
+        models: Registry to take the model from (defaults to the shared one)
+        tier: Model tier to use (defaults to the catalogue's default tier)
+
+    Returns:
+        One Detections per input image, with boxes in the original
+        upload's pixel space
+    """
+    import torch
+    from inference_backends import configure_threads
+
+    configure_threads()
+    tier = tier or catalogue.resolve()
+    models = models or registry
+    processor, model = models.detection(tier)
+
+    with torch.inference_mode():
+        inputs = processor(images=[image.array for image in images], return_tensors="pt").to(models.device)
+        outputs = model(**inputs)
+
+        # DETR-style heads: the last class is "no object", boxes are normalized (cx, cy, w, h)
+        scores, label_ids = outputs.logits.softmax(-1)[..., :-1].max(-1)
+        cx, cy, w, h = outputs.pred_boxes.unbind(-1)
+        boxes = torch.stack((cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2), dim=-1)
+        scale = torch.tensor(
+            [[width, height, width, height] for width, height in (image.original_size for image in images)],
+            dtype=boxes.dtype,
+            device=boxes.device
+        )
+        boxes = boxes * scale[:, None, :]
+
+    scores, label_ids, boxes = scores.cpu().numpy(), label_ids.cpu().numpy(), boxes.cpu().numpy()
+    return [
+        Detections.select(boxes[i], label_ids[i], scores[i], model.config.id2label, tier.detection_threshold)
+        for i in range(len(images))
+    ]
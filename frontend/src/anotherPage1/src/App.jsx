@@ -84,7 +84,7 @@ function App() {
 
       if (data.success) {
         setSessionId(data.session_id);
-        setSelectedImage(data.file_path);
+        setSelectedImage(data.thumbnail_path || data.file_path);
         addMessage('user', `Uploaded an image${symptoms ? ` with symptoms: ${symptoms}` : ''}`);
         addMessage('assistant', data.response);
         setLatestDiagnosis(data.response);